@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Compare searching the message log with a LIKE scan to searching it with
+the full-text index !history uses.
+
+Usage: python bench/history_search.py [n_messages]
+"""
+from __future__ import print_function
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+sys.path.insert(0, os.path.join(DIR, "../limbo/plugins"))
+
+import history
+import log
+from limbo.fakeserver import FakeSlack
+from limbo.server import LimboServer
+from limbo.storage import Storage, connect
+
+WORDS = ("deploy build lunch coffee review merge broken fixed test release "
+         "standup meeting ticket bug server database cache slow fast today").split()
+
+def timed(fn, repeat=20):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return sorted(times)[repeat // 2] * 1000
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "limbo.sqlite3")
+        server = LimboServer(FakeSlack(), {}, {}, Storage(connect(path), path))
+        log.DO_LOG = True
+        log.on_init(server)
+        # spread the messages over the two years before the newest
+        newest = 1446672000
+        rows = [(u" ".join(random.choice(WORDS) for _ in range(12)) + u" zebra{0}".format(i % 1000),
+                 "U{0}".format(i % 50), str(newest - i * 2 * 365 * 24 * 60 * 60 // n), "T1", "C{0}".format(i % 20))
+                for i in range(n)]
+        messages = log.message_log(server)
+        start = time.time()
+        for row in rows:
+            messages.insert(*row)
+        print("logged {0} messages in {1} partitions, with indexing, in {2:.1f}s ({3:.1f}MB)".format(
+            n, len(messages.partitions()), time.time() - start, os.path.getsize(path) / 1e6))
+
+        sql, params = messages.union("SELECT msg FROM {table} WHERE msg LIKE ?", [u"%zebra123 %"])
+        print("     LIKE scan: {0:8.2f}ms".format(timed(lambda: server.query(sql + " LIMIT 5", *params))))
+        print("      !history: {0:8.2f}ms".format(timed(lambda: history.history(server, u"zebra123"))))
+        print("  ... in #C3:   {0:8.2f}ms".format(timed(lambda: history.history(server, u"zebra123 deploy", "C3"))))
+        print("  ... since 30 days ago: {0:8.2f}ms".format(
+            timed(lambda: history.history(server, u"zebra123", since=newest - 30 * 24 * 60 * 60))))
+        server.close()
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
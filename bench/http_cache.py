@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Measure how long a plugin's repeated GET takes with and without the
+response cache, against a local server that takes 20ms to answer.
+
+Usage: python bench/http_cache.py [n_requests]
+"""
+from __future__ import print_function
+import os
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.httpcache import ResponseCache
+from limbo.httpclient import HTTPClient
+
+BODY = b'{"list": [' + b", ".join([b'{"temp": {"day": 61.2}}'] * 100) + b']}'
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(0.02)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def median(xs):
+    return sorted(xs)[len(xs) // 2]
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    t = threading.Thread(target=httpd.serve_forever)
+    t.daemon = True
+    t.start()
+    url = "http://127.0.0.1:{0}/forecast?q=boston".format(httpd.server_address[1])
+
+    for name, http in (("no cache", HTTPClient()), ("cache", HTTPClient(cache=ResponseCache()))):
+        times = []
+        for _ in range(n):
+            start = time.time()
+            http.get(url).json()
+            times.append(time.time() - start)
+        print("{0:>9}: median {1:8.3f}ms, first {2:8.3f}ms".format(name, median(times) * 1000, times[0] * 1000))
+
+if __name__ == "__main__":
+    main()
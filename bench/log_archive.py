@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Archive a month of messages and compare the space they take in the
+database to the space they take in the archive, then stream them back,
+measuring the memory it takes.
+
+Usage: python bench/log_archive.py [n_messages]
+"""
+from __future__ import print_function
+import calendar
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.archive import Archive
+from limbo.messagelog import MessageLog
+from limbo.storage import Storage, connect
+
+WORDS = ("deploy build lunch coffee review merge broken fixed test release "
+         "standup meeting ticket bug server database cache slow fast today").split()
+START = calendar.timegm((2015, 11, 1, 0, 0, 0))
+MONTH = 30 * 24 * 60 * 60
+
+def size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "limbo.sqlite3")
+        storage = Storage(connect(path), path)
+        archive = Archive(os.path.join(tmp, "archive"))
+        log = MessageLog(storage.query, archive=archive, archive_after=1, transaction=storage.transaction)
+        log.create("log_2015_11")
+        with storage.transaction() as db:
+            db.executemany("INSERT INTO log_2015_11 (ts, msg, sender, team, channel) VALUES (?, ?, ?, ?, ?)",
+                           ((START + i * MONTH / n, u" ".join(random.choice(WORDS) for _ in range(12)),
+                             "U{0}".format(i % 50), "T1", "C{0}".format(i % 20)) for i in range(n)))
+        in_db = size(path) + size(path + "-wal")
+
+        start = time.time()
+        log.archive_partitions()
+        print("archived {0} messages in {1:.1f}s: {2:.1f}MB in the database, {3:.1f}MB archived".format(
+            n, time.time() - start, in_db / 1e6, size(archive.directory) / 1e6))
+
+        tracemalloc.start()
+        start = time.time()
+        count = sum(1 for _ in archive.read())
+        _, peak = tracemalloc.get_traced_memory()
+        print("streamed all {0} back in {1:.2f}s, with a peak of {2:.2f}MB allocated".format(
+            count, time.time() - start, peak / 1e6))
+
+        start = time.time()
+        count = sum(1 for _ in archive.read(START + MONTH / 2, START + MONTH / 2 + 3600, channel="C3"))
+        print("one channel's hour, {0} messages, in {1:.1f}ms".format(count, (time.time() - start) * 1000))
+        storage.close()
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
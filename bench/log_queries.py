@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Time a channel's and a user's messages over a day, in an old untyped log
+table and after migrating it into typed, indexed partitions, and how long
+each batch of the migration holds the writer.
+
+Usage: python bench/log_queries.py [n_messages]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.messagelog import MessageLog
+from limbo.migrations import BATCH_ROWS
+from limbo.storage import Storage, connect
+
+NEWEST = 1446672000
+DAY = 24 * 60 * 60
+
+def timed(fn, repeat=20):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return sorted(times)[repeat // 2] * 1000
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "limbo.sqlite3")
+        db = Storage(connect(path), path)
+        db.query("CREATE TABLE log (msg STRING, sender STRING, time STRING, team STRING, channel STRING)")
+        # a year of messages
+        with db.transaction() as writer:
+            writer.executemany("INSERT INTO log VALUES (?, ?, ?, ?, ?)",
+                               ((u"message {0}".format(i), "U{0}".format(i % 50), str(NEWEST - i * 365 * DAY // n),
+                                 "T1", "C{0}".format(i % 20)) for i in range(n)))
+        start, end = NEWEST - 100 * DAY, NEWEST - 99 * DAY
+
+        old = lambda column, value: db.query(
+            "SELECT time, msg FROM log WHERE {0} = ? AND CAST(time AS REAL) >= ? AND CAST(time AS REAL) < ?".format(
+                column), value, start, end)
+        print("untyped log, {0} messages:".format(n))
+        print("  channel over a day: {0:8.2f}ms".format(timed(lambda: old("channel", "C3"))))
+        print("     user over a day: {0:8.2f}ms".format(timed(lambda: old("sender", "U7"))))
+
+        log = MessageLog(db.query)
+        batches = log.type_partitions(db, BATCH_ROWS)
+        began = time.time()
+        next(batches)
+        longest = 0
+        while True:
+            batch = time.time()
+            if next(batches, StopIteration) is StopIteration:
+                break
+            longest = max(longest, time.time() - batch)
+        print("migrated in {0:.1f}s, at most {1:.1f}ms per batch of {2}".format(
+            time.time() - began, longest * 1000, BATCH_ROWS))
+
+        print("typed partitions:")
+        print("  channel over a day: {0:8.2f}ms".format(
+            timed(lambda: log.messages(channel="C3", start=start, end=end))))
+        print("     user over a day: {0:8.2f}ms".format(timed(lambda: log.messages(sender="U7", start=start, end=end))))
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
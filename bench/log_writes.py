@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Measure how long logging a message holds up the thread that answers it,
+committing each row with server.query and buffering it with write_behind.
+
+Usage: python bench/log_writes.py [n_messages]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.plugins import log
+from limbo.server import LimboServer
+from limbo.storage import Storage, connect
+from limbo.writebehind import init_write_behind
+
+def run(server, n):
+    log.DO_LOG = True
+    log.on_init(server)
+    times = []
+    for i in range(n):
+        msg = {"text": u"message {0}".format(i), "user": "U1", "ts": str(time.time()), "team": "T1", "channel": "C1"}
+        start = time.time()
+        log.on_message(msg, server)
+        times.append(time.time() - start)
+    start = time.time()
+    server.close()
+    return sorted(times), time.time() - start
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tmp = tempfile.mkdtemp()
+    try:
+        for name in ("query", "write_behind"):
+            path = os.path.join(tmp, name + ".sqlite3")
+            db = Storage(connect(path), path)
+            write_behind = init_write_behind({}, db) if name == "write_behind" else None
+            server = LimboServer(None, {}, {}, db, write_behind=write_behind)
+            times, close = run(server, n)
+            print("{0:>13}: median {1:7.3f}ms, p99 {2:7.3f}ms per message, {3:7.1f}ms to close".format(
+                name, times[n // 2] * 1000, times[n * 99 // 100] * 1000, close * 1000))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Compare the memory used to build the roster from an rtm.start reply by
+decoding the whole reply and by streaming it.
+
+Usage: python bench/login_memory.py [n_users]
+"""
+from __future__ import print_function
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.slackclient._jsonstream import JSONStream
+from limbo.slackclient._server import ROSTER_KEYS, Server
+
+def payload(n):
+    users = [{"id": "U{0:08d}".format(i), "name": "user{0}".format(i), "real_name": "User {0}".format(i),
+              "tz": "America/New_York", "profile": {"title": "x" * 100, "image_72": "https://example.com/" + "y" * 80}}
+             for i in range(n)]
+    channels = [{"id": "C{0:08d}".format(i), "name": "channel{0}".format(i), "members": [u["id"] for u in users[:20]],
+                 "topic": {"value": "z" * 100}, "purpose": {"value": "z" * 100}}
+                for i in range(n // 10)]
+    return json.dumps({"ok": True, "url": "wss://example.com/", "self": {"id": "U0", "name": "limbo"},
+                       "team": {"domain": "bench"}, "users": users, "channels": channels,
+                       "groups": [], "ims": []}).encode("utf8")
+
+def load_whole(server, data):
+    login_data = json.loads(io.BytesIO(data).read().decode("utf8"))
+    server.domain = login_data["team"]["domain"]
+    server.username = login_data["self"]["name"]
+    for key in ("channels", "groups", "ims"):
+        server.parse_channel_data(login_data[key])
+    server.parse_user_data(login_data["users"])
+    # the old client kept the whole reply around
+    return login_data
+
+def load_streaming(server, data):
+    return server.parse_slack_login_data(JSONStream(io.BytesIO(data)).members(ROSTER_KEYS))
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    data = payload(n)
+    print("{0} users, {1:.1f}MB reply".format(n, len(data) / 1e6))
+    for name, load in (("json.loads", load_whole), ("JSONStream", load_streaming)):
+        server = Server("xoxb-bench", connect=False)
+        tracemalloc.start()
+        kept = load(server, data)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{0:>11}: peak {1:7.1f}MB, retained {2:7.1f}MB".format(name, peak / 1e6, current / 1e6))
+        del kept
+
+if __name__ == "__main__":
+    main()
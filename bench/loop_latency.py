@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""Measure the latency between a command arriving on the websocket and limbo
+sending its reply, for the old fixed-sleep loop and the readiness-driven one.
+
+Usage: python bench/loop_latency.py [n_messages]
+"""
+from __future__ import print_function
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+import limbo
+from limbo.limbo import handle_event, loop
+from limbo.server import LimboServer
+from limbo.slackclient import SlackClient
+
+class TimingWebsocket(object):
+    """newline-delimited frames over a socketpair; records reply times"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setblocking(0)
+        self.buf = b""
+        self.replies = {}
+
+    def send(self, data):
+        msg = json.loads(data)
+        if msg.get("type") == "message":
+            self.replies[msg["text"]] = time.time()
+
+    def recv(self):
+        while b"\n" not in self.buf:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise socket.error("closed")
+            self.buf += chunk
+        frame, self.buf = self.buf.split(b"\n", 1)
+        return frame.decode("utf8")
+
+def sleep_loop(server):
+    """limbo's loop before it learned to wait on the socket"""
+    while True:
+        server.slack.server.ping()
+        for event in server.slack.rtm_read():
+            response = handle_event(event, server)
+            if response:
+                server.slack.rtm_send_message(event["channel"], response)
+        time.sleep(1)
+
+def make_server():
+    ours, theirs = socket.socketpair()
+    slack = SlackClient("xoxb-bench")
+    slack.server.websocket = TimingWebsocket(ours)
+    slack.server.connected = True
+    # measure the loop, not slack's rate limit
+    slack.server.outbox.interval = 0
+    slack.server.username = "limbo"
+    slack.server.attach_user("limbo", "U1", "", "")
+    slack.server.attach_user("bencher", "U2", "", "")
+    slack.server.attach_channel("bench", "C1", [])
+    hooks = limbo.init_plugins(os.path.join(DIR, "..", "test", "plugins"))
+    return LimboServer(slack, {}, hooks, None), theirs
+
+# the loops run until the bench exits, so keep their sockets open until then
+PEERS = []
+
+def run(loopfun, n):
+    server, peer = make_server()
+    PEERS.append(peer)
+    t = threading.Thread(target=loopfun, args=(server,))
+    t.daemon = True
+    t.start()
+
+    sent = {}
+    for i in range(n):
+        time.sleep(random.uniform(0.05, 0.5))
+        text = u"!echo {0}".format(i)
+        event = {"type": "message", "channel": "C1", "user": "U2", "text": text}
+        sent[text] = time.time()
+        peer.sendall(json.dumps(event).encode("utf8") + b"\n")
+
+    # give the slow loop a chance to catch up with the last message
+    time.sleep(1.5)
+    replies = server.slack.server.websocket.replies
+    return sorted(replies[text] - sent[text] for text in sent if text in replies)
+
+def median(xs):
+    return xs[len(xs) // 2] if xs else float("nan")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    random.seed(0)
+    for name, loopfun in (("sleep(1) loop", sleep_loop), ("select loop", loop)):
+        latencies = run(loopfun, n)
+        print("{0:>14}: {1}/{2} replies, median latency {3:.2f}ms, max {4:.2f}ms".format(
+            name, len(latencies), n, median(latencies) * 1000, max(latencies) * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Compare user and channel lookups in a SearchList and an IndexedList.
+
+Usage: python bench/roster_lookup.py [n_entries]
+"""
+from __future__ import print_function
+import os
+import random
+import sys
+import timeit
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.slackclient._channel import Channel
+from limbo.slackclient._user import User
+from limbo.slackclient._util import IndexedList, SearchList
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+    users = [User(None, "user{0}".format(i), "U{0:08d}".format(i), "", "") for i in range(n)]
+    channels = [Channel(None, "channel{0}".format(i), "C{0:08d}".format(i), []) for i in range(n)]
+    queries = {
+        "user by id": (users, ["U{0:08d}".format(random.randrange(n)) for _ in range(50)]),
+        "user by name": (users, ["user{0}".format(random.randrange(n)) for _ in range(50)]),
+        "channel by id": (channels, ["C{0:08d}".format(random.randrange(n)) for _ in range(50)]),
+        "channel by #name": (channels, ["#channel{0}".format(random.randrange(n)) for _ in range(50)]),
+    }
+
+    print("{0} entries".format(n))
+    for name in sorted(queries):
+        items, keys = queries[name]
+        for cls in (SearchList, IndexedList):
+            roster = cls(items)
+            assert all(roster.find(k) is not None for k in keys)
+            per_lookup = timeit.timeit(lambda: [roster.find(k) for k in keys], number=3) / (3 * len(keys))
+            print("{0:>17} {1:>11}: {2:10.2f}us per find".format(name, cls.__name__, per_lookup * 1e6))
+
+if __name__ == "__main__":
+    main()
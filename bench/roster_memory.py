@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Measure the memory the roster of a large team takes, with the compact
+roster classes and with plain objects like the ones they replaced.
+
+Usage: python bench/roster_memory.py [n_users] [n_channels]
+"""
+from __future__ import print_function
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from limbo.slackclient._server import Server
+
+class PlainUser(object):
+    def __init__(self, server, name, id, real_name, tz):
+        self.tz = tz
+        self.name = name
+        self.real_name = real_name
+        self.server = server
+        self.id = id
+
+class PlainChannel(object):
+    def __init__(self, server, name, id, members=[]):
+        self.server = server
+        self.name = name
+        self.id = id
+        self.members = members
+
+class PlainServer(Server):
+    def parse_user(self, user):
+        return PlainUser(self, user["name"], user["id"], user.get("real_name", user["name"]), user.get("tz", "unknown"))
+
+    def parse_channel(self, channel):
+        return PlainChannel(self, channel.get("name", channel["id"]), channel["id"], channel.get("members", []))
+
+def roster(n_users, n_channels):
+    random.seed(0)
+    users = [{"id": "U{0:08d}".format(i), "name": "user{0}".format(i),
+              "real_name": "User {0}".format(i), "tz": "America/New_York"}
+             for i in range(n_users)]
+    ids = [u["id"] for u in users]
+    channels = [{"id": "C{0:08d}".format(i), "name": "channel{0}".format(i),
+                 "members": random.sample(ids, random.randint(2, 200))}
+                for i in range(n_channels)]
+    # round trip through json so that every id is its own string, as it is
+    # when it comes off the wire
+    return json.dumps(users), json.dumps(channels)
+
+def measure(server_class, users, channels):
+    tracemalloc.start()
+    server = server_class("xoxb-bench", connect=False)
+    server.parse_user_data(json.loads(users))
+    server.parse_channel_data(json.loads(channels))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    users, channels = roster(n_users, n_channels)
+    print("{0} users, {1} channels".format(n_users, n_channels))
+    for name, server_class in (("plain", PlainServer), ("compact", Server)):
+        print("{0:>8}: {1:7.1f}MB".format(name, measure(server_class, users, channels) / 1e6))
+
+if __name__ == "__main__":
+    main()
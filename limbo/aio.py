@@ -0,0 +1,154 @@
+"""An asyncio runtime for limbo, selected with LIMBO_RUNTIME=asyncio.
+
+Plugins may define their hooks with `async def`; ordinary hooks are run in
+the event loop's executor. All of the hooks for an event run concurrently, so
+a message takes as long as its slowest plugin rather than the sum of them.
+With LIMBO_POOL_SIZE set, plugins get the same deadlines they do in the
+threaded runtime. Requires python 3.5+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import sys
+import time
+import traceback
+
+from . import executor as plugin_executor
+from .executor import log_late_result, plugin_name
+from .limbo import ignore_message, maintain_connection, message_hooks, POLL_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+async def call_hook(hook, *args, executor=None):
+    """Run `hook`, on the event loop's executor unless it's a coroutine
+    function, and return its result. If `executor` gives its plugin a
+    deadline and it misses it, its result is dropped: an ordinary hook
+    finishes in the background and its late result is logged, and a
+    coroutine is cancelled"""
+    timeout = executor.timeout_for(hook) if executor else None
+    try:
+        if asyncio.iscoroutinefunction(hook):
+            return await asyncio.wait_for(hook(*args), timeout)
+
+        when = time.time() + timeout if timeout is not None else None
+        eventloop = asyncio.get_event_loop()
+        call = eventloop.run_in_executor(None, functools.partial(plugin_executor.call_hook, when, hook, *args))
+        try:
+            return await asyncio.wait_for(asyncio.shield(call), timeout)
+        except asyncio.TimeoutError:
+            call.add_done_callback(functools.partial(log_late_result, hook))
+            raise
+    except asyncio.TimeoutError:
+        logger.warning("plugin {0} missed its {1}s deadline".format(plugin_name(hook), timeout))
+    except Exception:
+        logger.warning("Failed to run plugin {0}, module not loaded".format(hook))
+        logger.warning("{0}".format(sys.exc_info()[0]))
+        logger.warning("{0}".format(traceback.format_exc()))
+
+async def run_hook(hooks, hook, *args, executor=None):
+    """Run every plugin's `hook` concurrently and return their non-empty
+    responses, dropping those that miss the deadlines `executor` gives them"""
+    return await run_hooks(hooks.get(hook, []), *args, executor=executor)
+
+async def run_hooks(hookfuns, *args, executor=None):
+    responses = await asyncio.gather(*[call_hook(h, *args, executor=executor) for h in hookfuns])
+    return [r for r in responses if r]
+
+async def stream_responses(hookfuns, event, server):
+    """Send each plugin's response as soon as it's ready. Responses that
+    finish within LIMBO_STREAM_WINDOW milliseconds of each other are sent as
+    one message"""
+    window = float(server.config.get("stream_window", 0)) / 1000
+    order = {}
+    for i, hook in enumerate(hookfuns):
+        order[asyncio.ensure_future(call_hook(hook, event, server, executor=server.executor))] = i
+
+    pending = set(order)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if window and pending:
+            more, pending = await asyncio.wait(pending, timeout=window)
+            done |= more
+
+        responses = [t.result() for t in sorted(done, key=order.get) if t.result()]
+        if responses:
+            server.slack.rtm_send_message(event["channel"], "\n".join(responses))
+
+async def handle_message(event, server):
+    if ignore_message(event, server):
+        return
+
+    hookfuns = message_hooks(server.hooks, event)
+    if server.config and server.config.get("stream_replies"):
+        return await stream_responses(hookfuns, event, server)
+
+    return "\n".join(await run_hooks(hookfuns, event, server, executor=server.executor))
+
+event_handlers = {
+    "message": handle_message,
+}
+
+async def handle_event(event, server):
+    handler = event_handlers.get(event.get("type"))
+    if handler:
+        return await handler(event, server)
+
+async def respond(event, server, previous=None):
+    """Handle `event` and send the response, but not before `previous`, the
+    task handling the channel's prior event, is done. Events in a channel are
+    handled concurrently but answered in the order they arrived, unless the
+    prior event is still being handled after the longest any plugin is given"""
+    response = await handle_event(event, server)
+    if previous is not None:
+        timeout = server.executor.longest_timeout() if server.executor else None
+        done, _ = await asyncio.wait([previous], timeout=timeout)
+        if not done:
+            logger.warning("answering out of order in {0}; its last event is still being handled".format(
+                event["channel"]))
+    if response:
+        server.slack.rtm_send_message(event["channel"], response)
+
+async def loop(server):
+    eventloop = asyncio.get_event_loop()
+    timeout = float(server.config.get("poll_timeout", POLL_TIMEOUT))
+    # waits on the websocket, which may be replaced or closed under us when
+    # we reconnect, so we leave the socket to wait_for_data rather than
+    # registering it with the event loop
+    waiter = ThreadPoolExecutor(max_workers=1)
+    # channel id -> the task handling the most recent event in that channel
+    latest = {}
+
+    def forget(channel, task):
+        if latest.get(channel) is task:
+            del latest[channel]
+
+    try:
+        while True:
+            wait = maintain_connection(server, timeout)
+            if not await eventloop.run_in_executor(waiter, server.slack.server.wait_for_data, wait):
+                continue
+
+            events = server.slack.rtm_read()
+            for event in events:
+                logger.debug("got {0}".format(event.get("type", event)))
+                channel = event.get("channel")
+                task = eventloop.create_task(respond(event, server, latest.get(channel)))
+                latest[channel] = task
+                task.add_done_callback(functools.partial(forget, channel))
+    finally:
+        waiter.shutdown(wait=False)
+
+def run(server):
+    async def main():
+        await run_hook(server.hooks, "init", server)
+        await loop(server)
+
+    eventloop = asyncio.new_event_loop()
+    asyncio.set_event_loop(eventloop)
+    # run synchronous plugins on the configured thread pool (LIMBO_POOL_SIZE)
+    if server.executor:
+        eventloop.set_default_executor(server.executor.pool)
+    try:
+        eventloop.run_until_complete(main())
+    finally:
+        eventloop.close()
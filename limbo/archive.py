@@ -0,0 +1,182 @@
+"""Compressed segments of old messages, moved out of the database.
+
+Each partition of the message log is archived to a segment named after it,
+like log_2015_11.jsonl.gz, holding a JSON object per message per line.
+Segments are only ever appended to. Each append is a run of gzip members of
+BLOCK_ROWS messages, so the whole segment still reads with zcat. A sidecar
+index, like log_2015_11.idx, has a line for each block with its offset,
+length and time range, so a reader can seek straight to the blocks it
+needs. A block is only in the index once it's safely written, so anything
+after the last block the index knows about is ignored. The message log
+keeps count of the blocks it knows are safely out of the database, and cuts
+a segment back to that many with truncate() if it stopped part way."""
+import json
+import logging
+import os
+import re
+import zlib
+
+from .messagelog import partition_bounds
+
+logger = logging.getLogger(__name__)
+
+# messages per gzip member
+BLOCK_ROWS = 1000
+# bytes to read at a time
+CHUNK_SIZE = 64 * 1024
+COMPRESSION = 6
+SEGMENT = re.compile(r"^(log_[\d_]+)\.idx$")
+# the fields of each message, in the order they're passed to append()
+FIELDS = ("ts", "msg", "sender", "team", "channel")
+
+def compress_block(records):
+    """One gzip member holding `records`, a JSON object per line"""
+    compressor = zlib.compressobj(COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    data = [compressor.compress((json.dumps(r, sort_keys=True) + "\n").encode("utf8")) for r in records]
+    data.append(compressor.flush())
+    return b"".join(data)
+
+def read_block(f, offset, length):
+    """The records in the gzip member `length` bytes long at `offset` in
+    `f`, decompressed a piece at a time"""
+    f.seek(offset)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b""
+    while length > 0:
+        chunk = f.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            break
+        length -= len(chunk)
+        lines = (pending + decompressor.decompress(chunk)).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield json.loads(line.decode("utf8"))
+
+def overlaps(first, last, start, end):
+    return (start is None or last >= start) and (end is None or first < end)
+
+class Archive(object):
+    def __init__(self, directory, block_rows=BLOCK_ROWS):
+        self.directory = directory
+        self.block_rows = block_rows
+
+    def path(self, name, ext):
+        return os.path.join(self.directory, name + ext)
+
+    def segments(self, start=None, end=None):
+        """The archived partitions holding messages from `start` up to
+        `end`, oldest first"""
+        try:
+            files = os.listdir(self.directory)
+        except OSError:
+            return []
+        found = []
+        for f in files:
+            match = SEGMENT.match(f)
+            bounds = match and partition_bounds(match.group(1))
+            if bounds and (start is None or bounds[1] > start) and (end is None or bounds[0] < end):
+                found.append((bounds, match.group(1)))
+        return [name for _, name in sorted(found)]
+
+    def append(self, name, rows):
+        """Append `rows`, (ts, msg, sender, team, channel) tuples, to the
+        segment `name`, and return how many there were"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.repair_index(name)
+        count = 0
+        with open(self.path(name, ".jsonl.gz"), "ab") as segment:
+            with open(self.path(name, ".idx"), "a") as index:
+                block = []
+                for row in rows:
+                    block.append(dict(zip(FIELDS, row)))
+                    if len(block) == self.block_rows:
+                        count += self.append_block(segment, index, block)
+                        block = []
+                if block:
+                    count += self.append_block(segment, index, block)
+        return count
+
+    def repair_index(self, name):
+        """Cut off a line a crash left half written at the end of the index,
+        so that the next line starts on a line of its own"""
+        try:
+            with open(self.path(name, ".idx"), "rb+") as index:
+                data = index.read()
+                if data and not data.endswith(b"\n"):
+                    index.truncate(data.rfind(b"\n") + 1)
+        except (IOError, OSError):
+            pass
+
+    def append_block(self, segment, index, block):
+        data = compress_block(block)
+        # after a crash part way through a block, this is past whatever of it
+        # was written, which the index doesn't know about
+        segment.seek(0, os.SEEK_END)
+        offset = segment.tell()
+        segment.write(data)
+        segment.flush()
+        os.fsync(segment.fileno())
+        times = [r["ts"] for r in block]
+        index.write(json.dumps({"offset": offset, "length": len(data), "rows": len(block),
+                                "start": min(times), "end": max(times)}) + "\n")
+        index.flush()
+        os.fsync(index.fileno())
+        return len(block)
+
+    def truncate(self, name, blocks):
+        """Cut the segment `name` back to its first `blocks` blocks, dropping
+        any that were appended after them"""
+        self.repair_index(name)
+        try:
+            with open(self.path(name, ".idx"), "rb+") as index:
+                lines = index.readlines()
+                if len(lines) <= blocks:
+                    return
+                kept = [json.loads(line.decode("utf8")) for line in lines[:blocks]]
+                index.truncate(sum(len(line) for line in lines[:blocks]))
+        except (IOError, OSError):
+            return
+        # the blocks after the index are ignored anyway, but zcat would show them
+        with open(self.path(name, ".jsonl.gz"), "r+b") as segment:
+            segment.truncate(kept[-1]["offset"] + kept[-1]["length"] if kept else 0)
+        logger.warning("dropped {0} blocks archived from {1} after the last ones it recorded".format(
+            len(lines) - blocks, name))
+
+    def block_count(self, name):
+        """How many blocks the segment `name` has, 0 if there isn't one"""
+        try:
+            return sum(1 for _ in self.blocks(name))
+        except (IOError, OSError):
+            return 0
+
+    def blocks(self, name):
+        with open(self.path(name, ".idx")) as index:
+            for line in index:
+                # a line cut short by a crash is the end of the index
+                if not line.endswith("\n"):
+                    break
+                yield json.loads(line)
+
+    def read(self, start=None, end=None, channel=None, sender=None):
+        """Each archived message from `start` up to `end`, in `channel` or
+        from `sender` if they're given, as a dict. Only the blocks that
+        overlap the time range are read, and only one piece of one block is
+        in memory at a time"""
+        for name in self.segments(start, end):
+            with open(self.path(name, ".jsonl.gz"), "rb") as segment:
+                for block in self.blocks(name):
+                    if not overlaps(block["start"], block["end"], start, end):
+                        continue
+                    for record in read_block(segment, block["offset"], block["length"]):
+                        if start is not None and record["ts"] < start or end is not None and record["ts"] >= end:
+                            continue
+                        if channel is not None and record["channel"] != channel:
+                            continue
+                        if sender is not None and record["sender"] != sender:
+                            continue
+                        yield record
+
+    def count(self, name):
+        """How many messages the segment `name` holds"""
+        return sum(block["rows"] for block in self.blocks(name))
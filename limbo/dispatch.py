@@ -0,0 +1,69 @@
+"""Dispatch events to a shared pool of worker threads, keeping each channel's
+events in order.
+
+Every channel gets its own queue, and at most one worker services a channel
+at a time, so two commands in one channel are answered in the order they
+arrived while a slow command in one channel doesn't hold up any other."""
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import logging
+import sys
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_WORKERS = 4
+
+class ChannelDispatcher(object):
+    def __init__(self, handler, workers=DISPATCH_WORKERS):
+        self.handler = handler
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        # channel id -> events waiting for a worker. A channel is present for
+        # as long as a worker is scheduled to service it
+        self.queues = {}
+
+    def submit(self, event):
+        channel = event.get("channel")
+        with self.lock:
+            if channel in self.queues:
+                self.queues[channel].append(event)
+                return
+            self.queues[channel] = collections.deque([event])
+        self.pool.submit(self.drain, channel)
+
+    def drain(self, channel):
+        """Handle the oldest event in `channel`, then go to the back of the line
+        if the channel has more waiting, so busy channels can't starve quiet ones"""
+        with self.lock:
+            event = self.queues[channel].popleft()
+
+        try:
+            self.handler(event)
+        except:
+            logger.warning("Failed to handle event {0}".format(event))
+            logger.warning("{0}".format(sys.exc_info()[0]))
+            logger.warning("{0}".format(traceback.format_exc()))
+
+        with self.lock:
+            if not self.queues[channel]:
+                del self.queues[channel]
+                return
+        self.pool.submit(self.drain, channel)
+
+    def depth(self):
+        """the number of events waiting to be handled, not counting those in progress"""
+        with self.lock:
+            return sum(len(q) for q in self.queues.values())
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+def init_dispatcher(config, handler):
+    """Returns a ChannelDispatcher if LIMBO_DISPATCH_WORKERS is set, otherwise
+    None, in which case events are handled one at a time as they're read"""
+    if not config.get("dispatch_workers"):
+        return None
+
+    return ChannelDispatcher(handler, int(config["dispatch_workers"]))
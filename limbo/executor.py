@@ -0,0 +1,115 @@
+"""Run plugin hooks on a bounded thread pool, giving each plugin a deadline.
+
+A plugin that misses its deadline has its response dropped; the thread it
+was running on finishes in the background and its late result is logged."""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, ALL_COMPLETED, FIRST_COMPLETED
+import functools
+import logging
+import time
+
+from .httpclient import deadline, running_plugin
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 8
+PLUGIN_TIMEOUT = 10
+
+class PluginTimeout(Exception):
+    pass
+
+def plugin_name(hook):
+    return getattr(hook, "__module__", None) or repr(hook)
+
+def parse_timeouts(spec):
+    """parse a string like "wiki:20,google:5" into {"wiki": 20.0, "google": 5.0}"""
+    timeouts = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, seconds = item.partition(":")
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+def call_hook(when, hook, *args):
+    """Call hook, cutting short any HTTP requests it makes through
+    server.http that would run past `when`, and crediting them to its plugin"""
+    with deadline(when), running_plugin(plugin_name(hook)):
+        return hook(*args)
+
+def log_late_result(hook, future):
+    if future.exception() is not None:
+        logger.warning("plugin {0} failed after its deadline: {1!r}".format(plugin_name(hook), future.exception()))
+    else:
+        logger.warning("dropping late result from plugin {0}: {1!r}".format(plugin_name(hook), future.result()))
+
+class PluginExecutor(object):
+    def __init__(self, pool_size=POOL_SIZE, timeout=PLUGIN_TIMEOUT, timeouts=None):
+        self.pool = ThreadPoolExecutor(max_workers=pool_size)
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+
+    def timeout_for(self, hook):
+        return self.timeouts.get(plugin_name(hook), self.timeout)
+
+    def longest_timeout(self):
+        """The most time any plugin is given"""
+        return max([self.timeout] + list(self.timeouts.values()))
+
+    def submit_all(self, hooks, *args):
+        """Start every hook running in the pool. Returns a list of
+        (hook, wait) pairs, in hook order; calling wait() returns the hook's
+        result, re-raises its exception, or raises PluginTimeout if the hook
+        misses its deadline"""
+        start = time.time()
+        return [(hook, functools.partial(self.wait, hook, self.submit(hook, args, start), start))
+                for hook in hooks]
+
+    def submit(self, hook, args, start):
+        return self.pool.submit(call_hook, start + self.timeout_for(hook), hook, *args)
+
+    def iter_completed(self, hooks, args, window=0):
+        """Start every hook running in the pool, and yield lists of
+        (hook, wait) pairs, as submit_all returns, as the hooks finish. Hooks
+        that finish within `window` seconds of the first hook in a batch join
+        that batch. Hooks that miss their deadline are yielded once it passes,
+        and their wait() raises PluginTimeout"""
+        start = time.time()
+        pending = dict((self.submit(hook, args, start), (i, hook)) for i, hook in enumerate(hooks))
+
+        while pending:
+            deadline = min(start + self.timeout_for(hook) for _, hook in pending.values())
+            done, _ = wait(pending, timeout=max(deadline - time.time(), 0), return_when=FIRST_COMPLETED)
+            if done and window:
+                more, _ = wait(set(pending) - done, timeout=min(window, max(deadline - time.time(), 0)),
+                               return_when=ALL_COMPLETED)
+                done |= more
+
+            now = time.time()
+            batch = [f for f in pending if f in done or start + self.timeout_for(pending[f][1]) <= now]
+            batch.sort(key=lambda f: pending[f][0])
+            yield [(pending[f][1], functools.partial(self.wait, pending[f][1], f, start)) for f in batch]
+            for f in batch:
+                del pending[f]
+
+    def wait(self, hook, future, start):
+        timeout = self.timeout_for(hook)
+        remaining = start + timeout - time.time()
+        try:
+            return future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            logger.warning("plugin {0} missed its {1}s deadline".format(plugin_name(hook), timeout))
+            future.add_done_callback(functools.partial(log_late_result, hook))
+            raise PluginTimeout(plugin_name(hook))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+def init_executor(config):
+    """Returns a PluginExecutor if LIMBO_POOL_SIZE is set, otherwise None, in
+    which case plugins run one after another on the main thread"""
+    if not config.get("pool_size"):
+        return None
+
+    return PluginExecutor(int(config["pool_size"]),
+                          float(config.get("plugin_timeout", PLUGIN_TIMEOUT)),
+                          parse_timeouts(config.get("plugin_timeouts")))
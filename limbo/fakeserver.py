@@ -1,12 +1,15 @@
-from .slackclient._util import SearchList
+from .httpclient import HTTPClient
+from .slackclient._util import IndexedList
 from .slackclient._user import User
 
 class FakeServer(object):
-    def __init__(self, slack=None, config=None, hooks=None, db=None):
+    def __init__(self, slack=None, config=None, hooks=None, db=None, executor=None, http=None):
         self.slack = slack or FakeSlack()
         self.config = config
         self.hooks = hooks
         self.db = db
+        self.executor = executor
+        self.http = http or HTTPClient()
 
     def query(self, sql, *params):
         # XXX: what to do with this?
@@ -18,16 +21,12 @@ class FakeSlack(object):
 
 class FakeSlackServer(object):
     def __init__(self, botname="limbo_test", users=None):
-        self.login_data = {
-            "self": {
-                "name": botname,
-            }
-        }
+        self.username = botname
 
         if  users:
             self.users = users
         else:
-            self.users = SearchList([
+            self.users = IndexedList([
                 User(self, "limbo_test", 1, "", 0),
                 User(self, "msguser", 2, "", 0),
                 User(self, "slackbot", 3, "", 0),
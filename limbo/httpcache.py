@@ -0,0 +1,273 @@
+"""A cache for the responses to plugins' GET requests.
+
+Responses are kept in memory in a size-limited LRU, and optionally in a
+table in limbo's sqlite database so they last across restarts. How long a
+response stays fresh depends on its host. Once it's stale, a response with
+an ETag or Last-Modified header is revalidated with a conditional request,
+so an unchanged page costs a 304 instead of a download."""
+from collections import OrderedDict
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# the most the in-memory cache holds
+MAX_ENTRIES = 1000
+MAX_BYTES = 32 * 1024 * 1024
+# seconds a response stays fresh, unless its host has its own policy
+DEFAULT_TTL = 60
+HOST_TTLS = {
+    "en.wikipedia.org": 24 * 60 * 60,
+    "secure.flickr.com": 24 * 60 * 60,
+    "www.shutterstock.com": 24 * 60 * 60,
+    "www.youtube.com": 60 * 60,
+    "encrypted.google.com": 60 * 60,
+    "www.google.com": 60 * 60,
+    "espn.go.com": 15 * 60,
+    "api.openweathermap.org": 10 * 60,
+}
+# (host, path prefix) -> seconds, for pages that need a different policy
+# from the rest of their host
+PATH_TTLS = {
+    # stock quotes go stale fast
+    ("www.google.com", "/finance"): 30,
+}
+# how long to keep a stale response on disk in the hope of revalidating it
+KEEP_STALE = 24 * 60 * 60
+# prune the disk cache after this many writes
+PRUNE_EVERY = 100
+
+
+def parse_ttls(spec):
+    """parse a string like "example.com:60,api.example.com:5" into
+    {"example.com": 60.0, "api.example.com": 5.0}"""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        host, _, seconds = item.rpartition(":")
+        ttls[host.strip()] = float(seconds)
+    return ttls
+
+
+def request_key(url, params=None, headers=None):
+    """The same GET request always has the same key, however its parameters
+    and headers were passed"""
+    url = requests.Request("GET", url, params=params).prepare().url
+    if not headers:
+        return url
+    return url + "\n" + "\n".join(sorted("{0}: {1}".format(k.lower(), v) for k, v in headers.items()))
+
+
+class CachedResponse(object):
+    __slots__ = ("url", "status", "headers", "content", "encoding", "expires")
+
+    def __init__(self, url, status, headers, content, encoding, expires):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.expires = expires
+
+    @classmethod
+    def from_response(cls, response, expires):
+        return cls(response.url, response.status_code, dict(response.headers),
+                   response.content, response.encoding, expires)
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    @property
+    def validators(self):
+        """Headers that ask the server whether this response is still good"""
+        headers = {}
+        if "ETag" in self.headers:
+            headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+    def to_response(self):
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.encoding = self.encoding
+        response.reason = "OK"
+        return response
+
+
+class LRU(object):
+    """An LRU of CachedResponses, limited in both entries and bytes"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self.entries[key] = entry
+            self.bytes += entry.size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.size
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DiskCache(object):
+    """CachedResponses in a table in limbo's database, read and written
+    through its Storage like everything else"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.writes = 0
+        self.storage.query("""CREATE TABLE IF NOT EXISTS http_cache (
+            key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT,
+            content BLOB, encoding TEXT, expires REAL)""")
+
+    def get(self, key):
+        rows = self.storage.query("SELECT url, status, headers, content, encoding, expires FROM http_cache WHERE key=?",
+                                  key)
+        if not rows:
+            return None
+        url, status, headers, content, encoding, expires = rows[0]
+        return CachedResponse(url, status, json.loads(headers), bytes(content), encoding, expires)
+
+    def put(self, key, entry):
+        with self.storage.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, entry.url, entry.status, json.dumps(entry.headers),
+                        sqlite3.Binary(entry.content), entry.encoding, entry.expires))
+            self.writes += 1
+            if self.writes % PRUNE_EVERY == 0:
+                db.execute("DELETE FROM http_cache WHERE expires < ?", (time.time() - KEEP_STALE,))
+
+
+class PluginCacheStats(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        # bytes we served from the cache, and that we had to download
+        self.hit_bytes = 0
+        self.miss_bytes = 0
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in ("hits", "misses", "revalidated", "hit_bytes", "miss_bytes"))
+
+
+class ResponseCache(object):
+    def __init__(self, memory=None, disk=None, default_ttl=DEFAULT_TTL, host_ttls=None):
+        self.memory = memory if memory is not None else LRU()
+        self.disk = disk
+        self.default_ttl = default_ttl
+        self.host_ttls = dict(HOST_TTLS)
+        self.host_ttls.update(host_ttls or {})
+        self.plugin_stats = {}
+        self.stats_lock = threading.Lock()
+
+    def ttl_for(self, url):
+        parsed = urlparse(url)
+        host = parsed.hostname or ""
+        for (path_host, prefix), ttl in PATH_TTLS.items():
+            if host == path_host and parsed.path.startswith(prefix):
+                return ttl
+        # www.example.com uses the policy for example.com if it has none
+        parts = host.split(".")
+        for i in range(len(parts) - 1):
+            ttl = self.host_ttls.get(".".join(parts[i:]))
+            if ttl is not None:
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning("unable to read the http cache: {0!r}".format(e))
+            if entry is not None:
+                self.memory.put(key, entry)
+        return entry
+
+    def store(self, key, entry):
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, entry)
+            except sqlite3.Error as e:
+                logger.warning("unable to write the http cache: {0!r}".format(e))
+
+    def fetch(self, send, plugin, key, url, **kwargs):
+        """GET `url`, whose request_key is `key`, from the cache if we can.
+        `send(method, url, **kwargs)` makes the request when we can't"""
+        entry = self.lookup(key)
+        now = time.time()
+        if entry is not None and entry.expires > now:
+            self.record(plugin, hit=entry.size)
+            return entry.to_response()
+
+        if entry is not None and entry.validators:
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, **entry.validators)
+        response = send("GET", url, **kwargs)
+        ttl = self.ttl_for(response.url or url)
+
+        if entry is not None and response.status_code == 304:
+            entry.expires = now + ttl
+            self.store(key, entry)
+            self.record(plugin, hit=entry.size, revalidated=True)
+            return entry.to_response()
+
+        self.record(plugin, miss=len(response.content))
+        if response.status_code == 200 and ttl > 0:
+            self.store(key, CachedResponse.from_response(response, now + ttl))
+        return response
+
+    def record(self, plugin, hit=None, miss=None, revalidated=False):
+        with self.stats_lock:
+            stats = self.plugin_stats.setdefault(plugin, PluginCacheStats())
+            if hit is not None:
+                stats.hits += 1
+                stats.hit_bytes += hit
+            if miss is not None:
+                stats.misses += 1
+                stats.miss_bytes += miss
+            if revalidated:
+                stats.revalidated += 1
+
+    def stats(self):
+        """Hits, misses and bytes for each plugin that's made requests"""
+        with self.stats_lock:
+            return dict((plugin, s.as_dict()) for plugin, s in self.plugin_stats.items())
@@ -0,0 +1,145 @@
+"""A shared HTTP client for plugins.
+
+Plugins that use `server.http` instead of calling requests directly share a
+pool of kept-alive connections to each host, get default timeouts, have
+their timeouts cut short so that they can't run past their deadline, and
+share a cache of GET responses (see httpcache). Identical GET requests made
+at the same time are only sent once."""
+import contextlib
+import copy
+import functools
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .httpcache import DEFAULT_TTL, LRU, MAX_BYTES, DiskCache, ResponseCache, parse_ttls, request_key
+from .singleflight import FlightTimeout, SingleFlight
+
+# seconds to wait for a connection, and then between bytes of the reply
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+# slack's Web API, which can take a while to start sending a big team's
+# roster (see slackclient._slackrequest)
+API_READ_TIMEOUT = 30
+# how many hosts to keep connections open to, and how many to each
+POOL_HOSTS = 32
+POOL_SIZE = 8
+
+_local = threading.local()
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+def remaining_time():
+    """Seconds left before the current thread's deadline, or None if it
+    doesn't have one"""
+    deadline = getattr(_local, "deadline", None)
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+def current_plugin():
+    """The name of the plugin running on this thread, if we know it"""
+    return getattr(_local, "plugin", None)
+
+@contextlib.contextmanager
+def deadline(when):
+    """Give HTTP requests made in this block until the time `when`"""
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = when
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+@contextlib.contextmanager
+def running_plugin(name):
+    """Attribute HTTP requests made in this block to the plugin `name`"""
+    previous = getattr(_local, "plugin", None)
+    _local.plugin = name
+    try:
+        yield
+    finally:
+        _local.plugin = previous
+
+class HTTPClient(object):
+    """Has the same get/post/request methods as requests, over a shared
+    Session. If given a ResponseCache, GET requests go through it.
+
+    A GET request that's the same as one already in flight waits for that
+    one and gets a copy of its response, instead of being sent again"""
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), pool_hosts=POOL_HOSTS, pool_size=POOL_SIZE,
+                 cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.flights = SingleFlight()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def timeout_for(self, timeout):
+        """Shorten `timeout` to fit in the current deadline"""
+        remaining = remaining_time()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise DeadlineExceeded("the plugin's deadline has passed")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) if t is not None else remaining for t in timeout)
+        return min(timeout, remaining) if timeout is not None else remaining
+
+    def request(self, method, url, **kwargs):
+        if method != "GET" or kwargs.get("stream"):
+            return self.send(method, url, **kwargs)
+
+        key = request_key(url, kwargs.get("params"), kwargs.get("headers"))
+        if self.cache is not None:
+            fetch = functools.partial(self.cache.fetch, self.send, current_plugin(), key, url, **kwargs)
+        else:
+            fetch = functools.partial(self.send, method, url, **kwargs)
+        try:
+            response = self.flights.do(key, fetch, remaining_time())
+        except FlightTimeout:
+            raise DeadlineExceeded("the plugin's deadline passed waiting for {0}".format(url))
+        # give everyone who shared the request a response of their own
+        return copy.copy(response)
+
+    def send(self, method, url, **kwargs):
+        kwargs["timeout"] = self.timeout_for(kwargs.get("timeout", self.timeout))
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+def init_cache(config, storage):
+    """Returns a ResponseCache holding up to LIMBO_HTTP_CACHE_SIZE megabytes
+    in memory, or None if that's 0. If LIMBO_HTTP_CACHE_DISK is set, the
+    cache is kept in the database through `storage` too"""
+    size = float(config.get("http_cache_size", MAX_BYTES / (1024 * 1024)))
+    if not size:
+        return None
+
+    disk = DiskCache(storage) if config.get("http_cache_disk") and storage else None
+    return ResponseCache(LRU(max_bytes=int(size * 1024 * 1024)),
+                         disk,
+                         float(config.get("http_cache_ttl", DEFAULT_TTL)),
+                         parse_ttls(config.get("http_cache_ttls")))
+
+def init_http(config, storage=None):
+    """Returns the HTTPClient for plugins to share, with the read timeout set
+    by LIMBO_HTTP_TIMEOUT"""
+    return HTTPClient((CONNECT_TIMEOUT, float(config.get("http_timeout", READ_TIMEOUT))),
+                      cache=init_cache(config, storage))
@@ -7,12 +7,25 @@ import importlib
 import logging
 import os
 import re
-import sqlite3
+import signal
 import sys
 import time
 import traceback
 
+try:
+    from inspect import iscoroutine
+except ImportError:
+    def iscoroutine(obj):
+        return False
+
 from .slackclient import SlackClient
+from .dispatch import init_dispatcher
+from .executor import call_hook, init_executor, PluginTimeout
+from .httpclient import init_http
+from .sandbox import init_sandbox
+from .storage import connect, init_storage
+from .triggers import TriggerRouter
+from .writebehind import init_write_behind
 from .server import LimboServer
 from .fakeserver import FakeServer
 
@@ -21,6 +34,9 @@ DIR = functools.partial(os.path.join, CURDIR)
 
 PYTHON3 = sys.version_info[0] > 2
 
+# the longest loop will sleep between checks on the connection
+POLL_TIMEOUT = 5
+
 logger = logging.getLogger(__name__)
 
 class InvalidPluginDir(Exception):
@@ -45,6 +61,7 @@ def init_plugins(plugindir):
         raise InvalidPluginDir(plugindir)
 
     hooks = {}
+    router = TriggerRouter()
 
     oldpath = copy.deepcopy(sys.path)
     sys.path.insert(0, plugindir)
@@ -59,6 +76,9 @@ def init_plugins(plugindir):
                 logger.debug("plugin: attaching %s hook for %s", hook, modname)
                 hooks.setdefault(hook, []).append(hookfun)
 
+            if hasattr(mod, "on_message"):
+                router.add(len(hooks["message"]) - 1, getattr(mod, "TRIGGERS", None))
+
             if mod.__doc__:
                 firstline = mod.__doc__.split('\n')[0]
                 hooks.setdefault('help', {})[modname] = firstline
@@ -72,41 +92,108 @@ def init_plugins(plugindir):
             logger.warning("{0}".format(traceback.format_exc()))
 
     sys.path = oldpath
+
+    # only bother routing messages if some plugin has declared its triggers
+    if router:
+        hooks["triggers"] = router.compile()
+
     return hooks
 
-def run_hook(hooks, hook, *args):
-    responses = []
-    for hook in hooks.get(hook, []):
-        try:
-            h = hook(*args)
-            if h:
-                responses.append(h)
-        except:
-            logger.warning("Failed to run plugin {0}, module not loaded".format(hook))
-            logger.warning("{0}".format(sys.exc_info()[0]))
-            logger.warning("{0}".format(traceback.format_exc()))
+def run_coroutine(coro):
+    # lets a plugin with an `async def` hook run under the synchronous runtime
+    import asyncio
+    eventloop = asyncio.new_event_loop()
+    try:
+        return eventloop.run_until_complete(coro)
+    finally:
+        eventloop.close()
+
+def run_hook(hooks, hook, *args, **kwargs):
+    """Run every plugin's `hook` and return their non-empty responses. If an
+    `executor` keyword argument is given, the plugins run concurrently on its
+    thread pool and responses from plugins that miss their deadline are dropped"""
+    return run_hooks(hooks.get(hook, []), *args, **kwargs)
+
+def message_hooks(hooks, event):
+    """Return the message hooks that might respond to `event`"""
+    router = hooks.get("triggers")
+    if not router:
+        return hooks.get("message", [])
+
+    funs = hooks["message"]
+    return [funs[i] for i in router.match(event.get("text", ""))]
+
+def run_hooks(hookfuns, *args, **kwargs):
+    executor = kwargs.get("executor")
+    if executor:
+        calls = executor.submit_all(hookfuns, *args)
+    else:
+        calls = [(h, functools.partial(call_hook, None, h, *args)) for h in hookfuns]
 
-    return responses
+    responses = (collect(hook, call) for hook, call in calls)
+    return [r for r in responses if r]
 
-def handle_message(event, server):
+def collect(hook, call):
+    """Return the result of `call`, a pending call of `hook`, or None if the
+    plugin failed or missed its deadline"""
+    try:
+        h = call()
+        if iscoroutine(h):
+            h = run_coroutine(h)
+        return h
+    except PluginTimeout:
+        pass
+    except:
+        logger.warning("Failed to run plugin {0}, module not loaded".format(hook))
+        logger.warning("{0}".format(sys.exc_info()[0]))
+        logger.warning("{0}".format(traceback.format_exc()))
+
+def stream_responses(hookfuns, event, server):
+    """Send each plugin's response to the event's channel as soon as it's
+    ready, instead of waiting for every plugin to finish. With a thread pool,
+    responses that finish within LIMBO_STREAM_WINDOW milliseconds of each
+    other are sent as one message"""
+    if server.executor:
+        window = float(server.config.get("stream_window", 0)) / 1000
+        batches = server.executor.iter_completed(hookfuns, (event, server), window)
+    else:
+        batches = ([(h, functools.partial(call_hook, None, h, event, server))] for h in hookfuns)
+
+    for batch in batches:
+        responses = [r for r in (collect(hook, call) for hook, call in batch) if r]
+        if responses:
+            server.slack.rtm_send_message(event["channel"], "\n".join(responses))
+
+def ignore_message(event, server):
+    """Return True if limbo should not run any plugins for this message"""
     # ignore bot messages and edits
     subtype = event.get("subtype", "")
     if subtype == "bot_message" or subtype == "message_changed":
-        return
+        return True
 
-    botname = server.slack.server.login_data["self"]["name"]
+    botname = server.slack.server.username
     msguser = server.slack.server.users.find(event["user"])
 
     # slack returns None if it can't find the user because it thinks it's ruby
     if not msguser:
         logger.debug("event {0} has no user".format(event))
-        return
+        return True
 
     # don't respond to ourself or slackbot
     if msguser.name == botname or msguser.name.lower() == "slackbot":
+        return True
+
+    return False
+
+def handle_message(event, server):
+    if ignore_message(event, server):
         return
 
-    return "\n".join(run_hook(server.hooks, "message", event, server))
+    hookfuns = message_hooks(server.hooks, event)
+    if server.config and server.config.get("stream_replies"):
+        return stream_responses(hookfuns, event, server)
+
+    return "\n".join(run_hooks(hookfuns, event, server, executor=server.executor))
 
 event_handlers = {
     "message": handle_message,
@@ -117,6 +204,11 @@ def handle_event(event, server):
     if handler:
         return handler(event, server)
 
+def respond(event, server):
+    response = handle_event(event, server)
+    if response:
+        server.slack.rtm_send_message(event["channel"], response)
+
 def getif(config, name, envvar):
     if envvar in os.environ:
         config[name] = os.environ.get(envvar)
@@ -127,22 +219,69 @@ def init_config():
     getif(config, "loglevel", "LIMBO_LOGLEVEL")
     getif(config, "logfile", "LIMBO_LOGFILE")
     getif(config, "logformat", "LIMBO_LOGFORMAT")
+    getif(config, "poll_timeout", "LIMBO_POLL_TIMEOUT")
+    getif(config, "runtime", "LIMBO_RUNTIME")
+    getif(config, "pool_size", "LIMBO_POOL_SIZE")
+    getif(config, "plugin_timeout", "LIMBO_PLUGIN_TIMEOUT")
+    getif(config, "plugin_timeouts", "LIMBO_PLUGIN_TIMEOUTS")
+    getif(config, "sandbox_plugins", "LIMBO_SANDBOX_PLUGINS")
+    getif(config, "sandbox_workers", "LIMBO_SANDBOX_WORKERS")
+    getif(config, "sandbox_cpu", "LIMBO_SANDBOX_CPU")
+    getif(config, "sandbox_memory", "LIMBO_SANDBOX_MEMORY")
+    getif(config, "sandbox_timeout", "LIMBO_SANDBOX_TIMEOUT")
+    getif(config, "dispatch_workers", "LIMBO_DISPATCH_WORKERS")
+    getif(config, "stream_replies", "LIMBO_STREAM_REPLIES")
+    getif(config, "stream_window", "LIMBO_STREAM_WINDOW")
+    getif(config, "send_interval", "LIMBO_SEND_INTERVAL")
+    getif(config, "ping_interval", "LIMBO_PING_INTERVAL")
+    getif(config, "ping_missed", "LIMBO_PING_MISSED")
+    getif(config, "roster_snapshot", "LIMBO_ROSTER_SNAPSHOT")
+    getif(config, "http_timeout", "LIMBO_HTTP_TIMEOUT")
+    getif(config, "http_cache_size", "LIMBO_HTTP_CACHE_SIZE")
+    getif(config, "http_cache_disk", "LIMBO_HTTP_CACHE_DISK")
+    getif(config, "http_cache_ttl", "LIMBO_HTTP_CACHE_TTL")
+    getif(config, "http_cache_ttls", "LIMBO_HTTP_CACHE_TTLS")
+    getif(config, "log_batch_rows", "LIMBO_LOG_BATCH_ROWS")
+    getif(config, "log_batch_ms", "LIMBO_LOG_BATCH_MS")
+    getif(config, "db_readers", "LIMBO_DB_READERS")
     return config
 
+def maintain_connection(server, timeout):
+    """Start reconnecting if the connection has died, send a ping if one is
+    due, and send any queued replies that are due. Returns how long the event
+    loop may sleep before this needs to be called again"""
+    slackserver = server.slack.server
+    if slackserver.connected and slackserver.heartbeat.dead():
+        logger.warning("slack stopped answering pings, reconnecting")
+        slackserver.reconnect()
+    elif not slackserver.connected and not slackserver.reconnector.running():
+        logger.warning("lost connection to slack, reconnecting")
+        slackserver.reconnect()
+
+    if slackserver.connected:
+        slackserver.heartbeat.tick()
+    slackserver.outbox.flush()
+
+    waits = [timeout, slackserver.heartbeat.next_due(), slackserver.outbox.next_due()]
+    return min(w for w in waits if w is not None)
+
 def loop(server):
+    timeout = float(server.config.get("poll_timeout", POLL_TIMEOUT))
+    dispatcher = server.dispatcher = init_dispatcher(server.config, functools.partial(respond, server=server))
     try:
         while True:
-            # This will cause a broken pipe to reveal itself
-            server.slack.server.ping()
+            # Sleep until the websocket is readable or we've got something to send
+            wait = maintain_connection(server, timeout)
+            if not server.slack.server.wait_for_data(wait):
+                continue
 
             events = server.slack.rtm_read()
             for event in events:
                 logger.debug("got {0}".format(event.get("type", event)))
-                response = handle_event(event, server)
-                if response:
-                    server.slack.rtm_send_message(event["channel"], response)
-
-            time.sleep(1)
+                if dispatcher:
+                    dispatcher.submit(event)
+                else:
+                    respond(event, server)
     except KeyboardInterrupt:
         if os.environ.get("LIMBO_DEBUG"):
             import ipdb; ipdb.set_trace()
@@ -156,8 +295,10 @@ def relevant_environ():
 def init_server(args, config, Server=LimboServer, Client=SlackClient):
     init_log(config)
     logger.debug("config: {0}".format(config))
-    db = init_db(args.database_name)
+    db = init_storage(config, init_db(args.database_name), args.database_name)
     hooks = init_plugins(args.pluginpath)
+    # fork the sandbox workers now, before we've got threads or a websocket
+    init_sandbox(config, hooks)
     try:
         slack = Client(config["token"])
     except KeyError:
@@ -173,7 +314,18 @@ Try setting your bot's slack token with:
 export SLACK_TOKEN=<your-slack-bot-token>
 """.format(relevant_environ(), config))
         raise
-    server = Server(slack, config, hooks, db)
+    if "send_interval" in config:
+        slack.server.outbox.interval = float(config["send_interval"])
+    if "ping_interval" in config:
+        slack.server.heartbeat.interval = float(config["ping_interval"])
+    if "ping_missed" in config:
+        slack.server.heartbeat.max_missed = int(config["ping_missed"])
+    # keep a copy of the roster next to the database, so that we can answer
+    # commands while a fresh one downloads. Set the path to "" to turn it off
+    slack.server.roster_path = config.get("roster_snapshot", args.database_name + ".roster")
+    slack.server.load_roster()
+    server = Server(slack, config, hooks, db, init_executor(config), init_http(config, db),
+                    init_write_behind(config, db))
     return server
 
 # decode a string. if str is a python 3 string, do nothing.
@@ -202,14 +354,23 @@ def main(args):
         return
 
     server = init_server(args, config)
+    # heroku stops dynos with SIGTERM; exit cleanly so buffered writes are made
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    if server.slack.rtm_connect():
-        # run init hook. This hook doesn't send messages to the server (ought it?)
-        run_hook(server.hooks, "init", server)
+    try:
+        if server.slack.rtm_connect():
+            if config.get("runtime") == "asyncio":
+                from .aio import run
+                return run(server)
 
-        loop(server)
-    else:
-        logger.warn("Connection Failed, invalid token <{0}>?".format(config["token"]))
+            # run init hook. This hook doesn't send messages to the server (ought it?)
+            run_hook(server.hooks, "init", server)
+
+            loop(server)
+        else:
+            logger.warn("Connection Failed, invalid token <{0}>?".format(config["token"]))
+    finally:
+        server.close()
 
 # run a command. cmd should be a unicode string (str in python3, unicode in python2).
 # returns a string appropriate for printing (str in py2 and py3)
@@ -237,4 +398,5 @@ def repl(server, args):
         pass
 
 def init_db(database_file):
-    return sqlite3.connect(database_file)
+    """Open the connection that all writes to the database go through"""
+    return connect(database_file)
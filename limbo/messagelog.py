@@ -0,0 +1,369 @@
+"""The message log, split into a table per month or per day.
+
+Each partition is a table named for the time it covers, like log_2015_11 or
+log_2015_11_04, with its own full-text index. Old messages are pruned by
+dropping their partition, which doesn't delete rows one at a time or hold
+the write lock for long, and the pages it frees are reused by the next
+partition instead of growing the file. Partitions can be moved to an
+archive of compressed segments instead (see archive), a batch of messages at
+a time, each deleted in the transaction that records how much of the archive
+is safely written. Queries over a time range only read the partitions that
+overlap it."""
+import calendar
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# messages to read from a partition at a time when archiving it
+ARCHIVE_BATCH_ROWS = 1000
+
+# the time format of a partition's name for each way of partitioning
+PARTITIONS = {"month": "%Y_%m", "day": "%Y_%m_%d"}
+DEFAULT_PARTITION = "month"
+PARTITION_NAME = re.compile(r"^log_(\d{4})_(\d{2})(?:_(\d{2}))?$")
+
+# the log before it was partitioned
+LEGACY_TABLE = "log"
+# what tables are renamed to while their messages are moved into typed
+# partitions
+UNTYPED = "_untyped"
+# how many blocks of each archive segment hold messages deleted from the
+# database; any more were written by an archiver that stopped part way
+ARCHIVED = "log_archived"
+ARCHIVED_SCHEMA = "CREATE TABLE IF NOT EXISTS {0} (name TEXT PRIMARY KEY, blocks INTEGER NOT NULL)".format(ARCHIVED)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS {table}
+        (id INTEGER PRIMARY KEY, ts REAL NOT NULL, msg TEXT, sender TEXT, team TEXT, channel TEXT)""",
+    # for a channel's or a user's messages over a range of time
+    "CREATE INDEX IF NOT EXISTS {table}_channel_ts ON {table} (channel, ts)",
+    "CREATE INDEX IF NOT EXISTS {table}_sender_ts ON {table} (sender, ts)",
+]
+# a full-text index of each partition, for !history. It keeps no copy of the
+# messages, just the index, and the triggers keep it up to date as rows are
+# inserted
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts
+        USING fts5(msg, content='{table}', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, msg) VALUES (new.id, new.msg);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, msg) VALUES ('delete', old.id, old.msg);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF msg ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, msg) VALUES ('delete', old.id, old.msg);
+        INSERT INTO {table}_fts(rowid, msg) VALUES (new.id, new.msg);
+    END""",
+]
+FTS_TRIGGERS = ("insert", "delete", "update")
+INSERT = "INSERT INTO {table} (ts, msg, sender, team, channel) VALUES (?, ?, ?, ?, ?)"
+
+def partition_bounds(name):
+    """The times the partition `name` starts and ends, or None if `name`
+    isn't a partition"""
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    year, month = int(year), int(month)
+    if day is not None:
+        start = calendar.timegm((year, month, int(day), 0, 0, 0))
+        return start, start + 24 * 60 * 60
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return calendar.timegm((year, month, 1, 0, 0, 0)), calendar.timegm((next_year, next_month, 1, 0, 0, 0))
+
+def message_time(ts, default=None):
+    """The time of a message from its slack ts, or `default` (now, unless
+    it's given) if it hasn't got one"""
+    try:
+        return float(ts)
+    except (TypeError, ValueError):
+        return time.time() if default is None else default
+
+class MessageLog(object):
+    """Reads and writes the partitioned log with `query(sql, *params)`.
+    Inserts go through `write(sql, *params)`, which may buffer them.
+
+    With `retention` days set, partitions that ended longer ago than that
+    are dropped whenever a new partition is started. With an `archive` and
+    `archive_after` days set, partitions that ended longer ago than that are
+    moved to the archive in the background then too, through `transaction`,
+    a Storage's transaction(), unless the log's being migrated"""
+
+    def __init__(self, query, write=None, partition=DEFAULT_PARTITION, retention=None, fts=True,
+                 archive=None, archive_after=None, transaction=None):
+        self.query = query
+        self.write = write or query
+        self.format = PARTITIONS[partition]
+        self.retention = retention
+        self.fts = fts
+        self.archive = archive
+        self.archive_after = archive_after
+        self.transaction = transaction
+        self.archiver = None
+        # set while type_partitions is moving messages, which archiving
+        # would race
+        self.migrating = False
+        # the partitions we know exist
+        self.known = set()
+        self.lock = threading.Lock()
+
+    def partition_for(self, when):
+        return "log_" + time.strftime(self.format, time.gmtime(when))
+
+    def partitions(self, start=None, end=None):
+        """The partitions holding messages from `start` up to `end`, oldest
+        first"""
+        rows = self.query("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'log\\_%' ESCAPE '\\'")
+        found = []
+        for (name,) in rows:
+            bounds = partition_bounds(name)
+            if bounds is None:
+                continue
+            if (start is None or bounds[1] > start) and (end is None or bounds[0] < end):
+                found.append((bounds, name))
+        return [name for _, name in sorted(found)]
+
+    def create(self, name):
+        """Create the partition `name` if it doesn't exist"""
+        for sql in SCHEMA:
+            self.query(sql.format(table=name))
+        if self.fts:
+            try:
+                for sql in FTS_SCHEMA:
+                    self.query(sql.format(table=name))
+            except sqlite3.OperationalError as e:
+                # sqlite was built without fts5
+                logger.warning("unable to index the log for !history: {0!r}".format(e))
+                self.fts = False
+
+    def ensure(self, name):
+        """Create the partition `name` if we haven't already, pruning the
+        partitions that have expired when we do, and archiving the ones that
+        are due unless `name` is one of them"""
+        if name in self.known:
+            return
+        self.create(name)
+        with self.lock:
+            self.known.add(name)
+        self.prune()
+        if not self.archivable(name):
+            self.start_archiving()
+
+    def expired(self, name, now=None):
+        """True if the partition `name` has passed the retention period"""
+        if not self.retention:
+            return False
+        return partition_bounds(name)[1] <= (now or time.time()) - self.retention * DAY
+
+    def archivable(self, name, now=None):
+        """True if the partition `name` is due to be archived"""
+        if not self.archive or not self.archive_after or not self.transaction:
+            return False
+        return partition_bounds(name)[1] <= (now or time.time()) - self.archive_after * DAY
+
+    def insert(self, text, user, ts, team, channel):
+        when = message_time(ts)
+        name = self.partition_for(when)
+        if self.expired(name):
+            # it'd only be dropped again
+            return
+        # create the partition before we insert into it, even if the insert
+        # is buffered
+        self.ensure(name)
+        self.write(INSERT.format(table=name), when, text, user, team, channel)
+
+    def prune(self, now=None):
+        """Drop the partitions that have passed the retention period, and
+        return their names"""
+        if not self.retention:
+            return []
+        dropped = []
+        for name in self.partitions():
+            if not self.expired(name, now):
+                continue
+            self.drop(name)
+            dropped.append(name)
+        if dropped:
+            logger.info("dropped log partitions {0}".format(", ".join(dropped)))
+        return dropped
+
+    def drop(self, name):
+        self.query("DROP TABLE IF EXISTS {0}_fts".format(name))
+        self.query("DROP TABLE {0}".format(name))
+        with self.lock:
+            self.known.discard(name)
+
+    def archive_partitions(self, now=None):
+        """Move the partitions that ended more than `archive_after` days ago
+        to the archive, and return their names"""
+        if self.migrating:
+            return []
+        archived = []
+        for name in self.partitions():
+            if not self.archivable(name, now):
+                continue
+            start = time.time()
+            count = self.archive_partition(name)
+            archived.append(name)
+            logger.info("archived {0} messages from {1} in {2:.1f}s".format(count, name, time.time() - start))
+        return archived
+
+    def archive_partition(self, name, batch_rows=ARCHIVE_BATCH_ROWS):
+        """Move the messages in the partition `name` to the archive a batch
+        at a time, and drop it once it's empty. Returns how many were moved.
+
+        Each batch is deleted in the transaction that records how many blocks
+        of the archive hold it, and the partition is only dropped by one that
+        finds it empty, so a message written to it meanwhile is archived too.
+        If we stopped after archiving a batch and before deleting it, the
+        archive is cut back to the blocks recorded first"""
+        with self.transaction() as db:
+            db.execute(ARCHIVED_SCHEMA)
+            row = db.execute("SELECT blocks FROM {0} WHERE name = ?".format(ARCHIVED), (name,)).fetchone()
+            if row is None:
+                db.execute("INSERT INTO {0} VALUES (?, ?)".format(ARCHIVED), (name, self.archive.block_count(name)))
+            else:
+                self.archive.truncate(name, row[0])
+
+        moved = 0
+        while True:
+            rows = self.query("SELECT id, ts, msg, sender, team, channel FROM {0} ORDER BY id LIMIT ?".format(name),
+                              batch_rows)
+            if rows:
+                moved += self.archive.append(name, (row[1:] for row in rows))
+            with self.transaction() as db:
+                if rows:
+                    db.execute("DELETE FROM {0} WHERE id <= ?".format(name), (rows[-1][0],))
+                db.execute("UPDATE {0} SET blocks = ? WHERE name = ?".format(ARCHIVED),
+                           (self.archive.block_count(name), name))
+                if not db.execute("SELECT 1 FROM {0} LIMIT 1".format(name)).fetchall():
+                    db.execute("DROP TABLE IF EXISTS {0}_fts".format(name))
+                    db.execute("DROP TABLE {0}".format(name))
+                    break
+        with self.lock:
+            self.known.discard(name)
+        return moved
+
+    def start_archiving(self):
+        """Archive the partitions that are due on a background thread, unless
+        that's already happening"""
+        if not self.archive or not self.archive_after or not self.transaction or self.migrating:
+            return
+        with self.lock:
+            if self.archiver is not None and self.archiver.is_alive():
+                return
+            self.archiver = threading.Thread(target=self.archive_safely, name="archive-log")
+            self.archiver.daemon = True
+            self.archiver.start()
+
+    def archive_safely(self):
+        try:
+            self.archive_partitions()
+        except Exception:
+            logger.exception("archiving the log failed; it'll be retried when the next partition starts")
+
+    def union(self, select, params=(), start=None, end=None):
+        """`select`, with {table} standing for a partition, run over each
+        partition from `start` up to `end` and combined with UNION ALL.
+        Returns the sql and its parameters, or (None, ()) if there are no
+        partitions in that range"""
+        names = self.partitions(start, end)
+        if not names:
+            return None, ()
+        sql = "\nUNION ALL\n".join(select.format(table=name) for name in names)
+        return sql, tuple(params) * len(names)
+
+    def messages(self, channel=None, sender=None, start=None, end=None, limit=None):
+        """(ts, msg, sender, channel) for each message in `channel` or from
+        `sender` from `start` up to `end`, oldest first. Either is found with
+        an index, and only the partitions in that time range are read"""
+        select = "SELECT ts, msg, sender, channel FROM {table} WHERE 1"
+        params = []
+        for column, value in (("channel", channel), ("sender", sender)):
+            if value is not None:
+                select += " AND {0} = ?".format(column)
+                params.append(value)
+        if start is not None:
+            select += " AND ts >= ?"
+            params.append(start)
+        if end is not None:
+            select += " AND ts < ?"
+            params.append(end)
+
+        sql, params = self.union(select, params, start, end)
+        if sql is None:
+            return []
+        sql += " ORDER BY ts"
+        if limit is not None:
+            sql += " LIMIT {0:d}".format(limit)
+        return self.query(sql, *params)
+
+    def migrations(self):
+        """The migrations that bring the log's tables up to date, for
+        migrations.migrate(), in order"""
+        return [self.type_partitions]
+
+    def columns(self, table):
+        return [row[1] for row in self.query("PRAGMA table_info({0})".format(table))]
+
+    def type_partitions(self, storage, batch_rows):
+        """Move the messages in the unpartitioned log, and in partitions
+        with a string time and no indexes, into typed partitions, and start
+        archiving once they're all moved"""
+        self.migrating = True
+        try:
+            for batch in self.move_untyped(storage, batch_rows):
+                yield batch
+        finally:
+            self.migrating = False
+        self.start_archiving()
+
+    def move_untyped(self, storage, batch_rows):
+        tables = [name for (name,) in self.query("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+        for name in tables:
+            if name != LEGACY_TABLE and not (partition_bounds(name) and "time" in self.columns(name)):
+                continue
+            # set it aside, so that new messages go to a new partition.
+            # Moving rows out of it shouldn't touch its full-text index
+            for trigger in FTS_TRIGGERS:
+                self.query("DROP TRIGGER IF EXISTS {0}_fts_{1}".format(name, trigger))
+            self.query("DROP TABLE IF EXISTS {0}_fts".format(name))
+            self.query("ALTER TABLE {0} RENAME TO {0}{1}".format(name, UNTYPED))
+        yield
+
+        # including any set aside by a start that didn't finish moving them
+        untyped = self.query("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ? ESCAPE '\\'",
+                             "%" + UNTYPED.replace("_", "\\_"))
+        for (name,) in untyped:
+            moved = 0
+            while True:
+                rows = self.query("SELECT rowid, msg, sender, time, team, channel FROM {0} "
+                                  "ORDER BY rowid LIMIT ?".format(name), batch_rows)
+                if not rows:
+                    break
+                partitions = {}
+                for _, msg, sender, ts, team, channel in rows:
+                    # messages without a usable time go in the partition for 1970
+                    when = message_time(ts, 0)
+                    partition = self.partition_for(when)
+                    if not self.expired(partition):
+                        partitions.setdefault(partition, []).append((when, msg, sender, team, channel))
+                for partition in partitions:
+                    self.ensure(partition)
+                # the rows are deleted as they're moved, so that stopping
+                # part way doesn't copy any of them twice
+                with storage.transaction() as db:
+                    for partition, values in partitions.items():
+                        db.executemany(INSERT.format(table=partition), values)
+                    db.execute("DELETE FROM {0} WHERE rowid <= ?".format(name), (rows[-1][0],))
+                moved += len(rows)
+                yield
+            self.query("DROP TABLE {0}".format(name))
+            logger.info("moved {0} messages out of {1}".format(moved, name))
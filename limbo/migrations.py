@@ -0,0 +1,78 @@
+"""Versioned upgrades of limbo's tables.
+
+Each set of tables has a name and a version in the schema_version table. A
+migration is a generator function called with the Storage and a batch size.
+Whatever it does before its first yield is done at startup, before the bot
+answers anything. The batches after that are done on a background thread,
+with a pause between them so that the bot's own writes get their turn. A
+migration's version is recorded once it's finished."""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# rows to move in each transaction
+BATCH_ROWS = 1000
+# seconds to wait between batches
+PAUSE = 0.05
+
+def schema_version(storage, name):
+    storage.query("CREATE TABLE IF NOT EXISTS schema_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    rows = storage.query("SELECT version FROM schema_version WHERE name = ?", name)
+    return rows[0][0] if rows else 0
+
+def set_schema_version(storage, name, version):
+    storage.query("INSERT OR REPLACE INTO schema_version VALUES (?, ?)", name, version)
+
+class Migrator(object):
+    """Brings the tables `name` up to date by running each of `migrations`
+    after the version they're at; the first migration upgrades version 0 to
+    version 1"""
+
+    def __init__(self, storage, name, migrations, batch_rows=BATCH_ROWS, pause=PAUSE):
+        self.storage = storage
+        self.name = name
+        self.migrations = migrations
+        self.batch_rows = batch_rows
+        self.pause = pause
+        self.thread = None
+
+    def start(self):
+        """Run the migrations up to their first batch, and the rest in the
+        background. Returns False if they're already up to date"""
+        version = schema_version(self.storage, self.name)
+        pending = [(v + 1, m(self.storage, self.batch_rows)) for v, m in enumerate(self.migrations) if v >= version]
+        if not pending:
+            return False
+
+        logger.info("migrating {0} from version {1} to {2}".format(self.name, version, len(self.migrations)))
+        # only the first migration can start now; the rest have to wait for
+        # it to finish
+        next(pending[0][1], None)
+        self.thread = threading.Thread(target=self.finish, args=(pending,), name="migrate-" + self.name)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def finish(self, pending):
+        try:
+            for version, batches in pending:
+                start = time.time()
+                for _ in batches:
+                    time.sleep(self.pause)
+                set_schema_version(self.storage, self.name, version)
+                logger.info("migrated {0} to version {1} in {2:.1f}s".format(self.name, version, time.time() - start))
+        except Exception:
+            logger.exception("migrating {0} failed; it'll be retried at the next start".format(self.name))
+
+    def run(self):
+        """Run the migrations to the end"""
+        if self.start():
+            self.thread.join()
+
+def migrate(storage, name, migrations, batch_rows=BATCH_ROWS, pause=PAUSE):
+    """Start bringing the tables `name` up to date, and return the Migrator"""
+    migrator = Migrator(storage, name, migrations, batch_rows, pause)
+    migrator.start()
+    return migrator
@@ -5,6 +5,8 @@ import argparse
 import re
 import pyfiglet
 
+TRIGGERS = ["!banner"]
+
 FIGLET = pyfiglet.Figlet()
 FONTS = FIGLET.getFonts()
 
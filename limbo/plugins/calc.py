@@ -7,10 +7,12 @@ except ImportError:
     from urllib.request import quote
 import requests
 
-def calc(eq):
+TRIGGERS = ["!calc"]
+
+def calc(eq, http=requests):
     query = quote(eq)
     url = "https://encrypted.google.com/search?hl=en&q={0}".format(query)
-    soup = BeautifulSoup(requests.get(url).text)
+    soup = BeautifulSoup(http.get(url).text)
 
     answer = soup.findAll("h2", attrs={"class": "r"})
     if not answer:
@@ -28,4 +30,4 @@ def on_message(msg, server):
     if not match:
         return
 
-    return calc(match[0].encode("utf8"))
+    return calc(match[0].encode("utf8"), getattr(server, "http", requests))
@@ -3,6 +3,8 @@ import re
 import random
 from emojicodedict import emojiCodeDict
 
+TRIGGERS = ["!emoji"]
+
 def randomelt(dic):
     keys = dic.keys()
     i = random.randint(0, len(keys) - 1)
@@ -2,6 +2,8 @@
 import random
 import re
 
+TRIGGERS = ["!flip"]
+
 def flip(lst):
     random.shuffle(lst)
     return ", ".join(lst)
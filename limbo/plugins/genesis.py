@@ -5,10 +5,12 @@ import re
 import requests
 from random import shuffle, randint
 
-def genesis():
+TRIGGERS = ["!genesis"]
+
+def genesis(http=requests):
     # http://ascii.textfiles.com/archives/4365
     page = randint(1, 8)
-    r = requests.get("https://secure.flickr.com/photos/textfiles/sets/72157646180733361/page%s/" % page)
+    r = http.get("https://secure.flickr.com/photos/textfiles/sets/72157646180733361/page%s/" % page)
     soup = BeautifulSoup(r.text)
     images = soup.findAll("img", attrs={"data-defer-src": True})
     images = [i.attrs["data-defer-src"] for i in images]
@@ -23,4 +25,4 @@ def on_message(msg, server):
     if not match:
         return
 
-    return genesis()
+    return genesis(getattr(server, "http", requests))
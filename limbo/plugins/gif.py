@@ -8,7 +8,9 @@ import re
 import requests
 from random import shuffle
 
-def gif(searchterm, unsafe=False):
+TRIGGERS = ["!gif"]
+
+def gif(searchterm, unsafe=False, http=requests):
     searchterm = quote(searchterm)
 
     safe = "&safe=" if unsafe else "&safe=active"
@@ -17,7 +19,7 @@ def gif(searchterm, unsafe=False):
     # this is an old iphone user agent. Seems to make google return good results.
     useragent = "Mozilla/5.0 (iPhone; U; CPU iPhone OS 4_0 like Mac OS X; en-us) AppleWebKit/532.9 (KHTML, like Gecko) Versio  n/4.0.5 Mobile/8A293 Safari/6531.22.7"
 
-    result = requests.get(searchurl, headers={"User-agent": useragent}).text
+    result = http.get(searchurl, headers={"User-agent": useragent}).text
 
     gifs = re.findall(r'imgurl.*?(http.*?)\\', result)
     shuffle(gifs)
@@ -34,4 +36,4 @@ def on_message(msg, server):
         return
 
     searchterm = match[0]
-    return gif(searchterm.encode("utf8"))
+    return gif(searchterm.encode("utf8"), http=getattr(server, "http", requests))
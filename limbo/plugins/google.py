@@ -7,10 +7,12 @@ except ImportError:
     from urllib.request import quote, unquote
 import requests
 
-def google(q):
+TRIGGERS = ["!google", "!search"]
+
+def google(q, http=requests):
     query = quote(q)
     url = "https://encrypted.google.com/search?q={0}".format(query)
-    soup = BeautifulSoup(requests.get(url).text)
+    soup = BeautifulSoup(http.get(url).text)
 
     answer = soup.findAll("h3", attrs={"class": "r"})
     if not answer:
@@ -24,4 +26,4 @@ def on_message(msg, server):
     if not match:
         return
 
-    return google(match[0])
+    return google(match[0], getattr(server, "http", requests))
@@ -2,6 +2,8 @@
 
 import re
 
+TRIGGERS = ["!help"]
+
 def on_message(msg, server):
     text = msg.get("text", "")
     match = re.findall(r"!help( .*)?", text)
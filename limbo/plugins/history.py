@@ -0,0 +1,117 @@
+"""!history <terms> [in #channel] [from @user] [since YYYY-MM-DD] searches the message log for <terms>
+
+Needs LIMBO_LOG_EVERYTHING to be set, so that there's a log to search.
+Matches are ranked best first. End a term with * to match words that start
+with it"""
+import calendar
+import re
+import sqlite3
+import time
+
+from limbo.messagelog import MessageLog
+
+TRIGGERS = ["!history"]
+
+# how many matches to show
+MAX_RESULTS = 5
+# words of context to show around the match
+SNIPPET_WORDS = 16
+NO_HISTORY = "I'm not keeping a searchable history of messages"
+
+# slack sends "#general" as <#C024BE7LR|general> and "@bob" as <@U024BE7LH>,
+# but handle them typed out too
+CHANNEL = re.compile(r"\bin\s+(?:<#(\w+)(?:\|[^>]*)?>|#([\w-]+))")
+USER = re.compile(r"\bfrom\s+(?:<@(\w+)(?:\|[^>]*)?>|@([\w.-]+))")
+SINCE = re.compile(r"\bsince\s+(\d{4}-\d{2}-\d{2})")
+
+def fts_query(terms):
+    """Quote each of `terms` so that fts5 matches it as a word, not as query
+    syntax. A trailing * still makes it a prefix"""
+    words = []
+    for term in terms.split():
+        prefix = term.endswith("*") and len(term) > 1
+        term = term.rstrip("*") if prefix else term
+        words.append(u'"{0}"{1}'.format(term.replace('"', '""'), "*" if prefix else ""))
+    return u" ".join(words)
+
+def find_id(roster, name):
+    """The id of the channel or user `name` in `roster`, or None"""
+    found = roster.find(name) if roster is not None else None
+    return found.id if found else None
+
+def format_match(snippet, sender, ts, channel):
+    try:
+        when = time.strftime("%Y-%m-%d %H:%M", time.gmtime(float(ts)))
+    except (TypeError, ValueError):
+        when = ts
+    return u"<@{0}> in <#{1}> at {2}: {3}".format(sender, channel, when, snippet.replace("\n", " "))
+
+def history(server, terms, channel=None, sender=None, since=None):
+    # like the REPL's FakeServer, with nowhere to keep one
+    if getattr(server, "db", None) is None:
+        return NO_HISTORY
+
+    select = u"""SELECT snippet({{table}}_fts, 0, '*', '*', '...', {0}), sender, ts, channel, rank
+        FROM {{table}}_fts JOIN {{table}} ON {{table}}.id = {{table}}_fts.rowid
+        WHERE {{table}}_fts MATCH ?""".format(SNIPPET_WORDS)
+    params = [fts_query(terms)]
+    if channel:
+        select += " AND channel = ?"
+        params.append(channel)
+    if sender:
+        select += " AND sender = ?"
+        params.append(sender)
+    if since:
+        select += " AND ts >= ?"
+        params.append(since)
+
+    # only search the partitions that have messages since `since`
+    sql, params = MessageLog(server.query).union(select, params, start=since)
+    if sql is None:
+        return NO_HISTORY
+    try:
+        rows = server.query(sql + " ORDER BY 5 LIMIT {0}".format(MAX_RESULTS), *params)
+    except sqlite3.OperationalError:
+        return NO_HISTORY
+    if not rows:
+        return u"No messages match {0}".format(terms)
+    return u"\n".join(format_match(*row[:4]) for row in rows)
+
+def on_message(msg, server):
+    text = msg.get("text", "")
+    match = re.findall(r"!history\s+(.*)", text)
+    if not match:
+        return
+
+    terms = match[0]
+    slack = server.slack.server
+
+    channel = None
+    m = CHANNEL.search(terms)
+    if m:
+        channel = m.group(1) or find_id(getattr(slack, "channels", None), m.group(2))
+        if not channel:
+            return u"I don't know the channel #{0}".format(m.group(2))
+        terms = terms[:m.start()] + terms[m.end():]
+
+    sender = None
+    m = USER.search(terms)
+    if m:
+        sender = m.group(1) or find_id(getattr(slack, "users", None), m.group(2))
+        if not sender:
+            return u"I don't know the user @{0}".format(m.group(2))
+        terms = terms[:m.start()] + terms[m.end():]
+
+    since = None
+    m = SINCE.search(terms)
+    if m:
+        try:
+            since = calendar.timegm(time.strptime(m.group(1), "%Y-%m-%d"))
+        except ValueError:
+            return u"I don't understand the date {0}".format(m.group(1))
+        terms = terms[:m.start()] + terms[m.end():]
+
+    terms = terms.strip()
+    if not terms:
+        return "What should I search for? !history <terms> [in #channel] [from @user] [since YYYY-MM-DD]"
+    return history(server, terms, channel, sender, since)
@@ -4,6 +4,8 @@ from jira import JIRA
 import os
 import re
 
+TRIGGERS = [r"rs jira "]
+
 JIRA_USER = os.environ['JIRA_USER']
 JIRA_AUTH = os.environ['JIRA_AUTH']
 OPTIONS = {
@@ -5,6 +5,8 @@ from jira import JIRA
 import os
 import re
 
+TRIGGERS = [r"[A-Z]+-\d+"]
+
 JIRA_USER = os.environ['JIRA_USER']
 JIRA_AUTH = os.environ['JIRA_AUTH']
 OPTIONS = {
@@ -1,6 +1,8 @@
 """Command to make Rosencrantz leave a channel"""
 import re
 
+TRIGGERS = [r"(rs|rosencrantz) leave\b"]
+
 
 def on_message(msg, server):
     text = msg.get("text", "")
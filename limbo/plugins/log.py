@@ -1,18 +1,59 @@
 """Log all messages to the database
 
-Only active if the LIMBO_LOG_EVERYTHING environment variable is set"""
+Only active if the LIMBO_LOG_EVERYTHING environment variable is set. The
+log is split into a table per LIMBO_LOG_PARTITION ("month", the default, or
+"day"), and with LIMBO_LOG_RETENTION_DAYS set, partitions older than that
+are dropped. With LIMBO_LOG_ARCHIVE_DAYS set, partitions older than that
+are moved to compressed files in LIMBO_LOG_ARCHIVE_DIR (by default, next to
+the database)"""
 import os
 
+from limbo.archive import Archive
+from limbo.messagelog import DEFAULT_PARTITION, MessageLog
+from limbo.migrations import migrate
+
 DO_LOG = os.environ.get("LIMBO_LOG_EVERYTHING", False)
+PARTITION = os.environ.get("LIMBO_LOG_PARTITION", DEFAULT_PARTITION)
+RETENTION_DAYS = os.environ.get("LIMBO_LOG_RETENTION_DAYS")
+ARCHIVE_DAYS = os.environ.get("LIMBO_LOG_ARCHIVE_DAYS")
+ARCHIVE_DIR = os.environ.get("LIMBO_LOG_ARCHIVE_DIR")
+
+# the MessageLog for the server we've been initialized with
+messages = None
+# what's upgrading the log's tables, if they needed it
+migrator = None
+
+def message_log(server):
+    global messages
+    if messages is None or messages.query != server.query:
+        # buffer the inserts if we can, so that they don't hold up replies
+        write = getattr(server, "write_behind", None)
+        messages = MessageLog(server.query, write.write if write else None, PARTITION,
+                              float(RETENTION_DAYS) if RETENTION_DAYS else None,
+                              archive=log_archive(server),
+                              archive_after=float(ARCHIVE_DAYS) if ARCHIVE_DAYS else None,
+                              transaction=getattr(server.db, "transaction", None))
+    return messages
+
+def log_archive(server):
+    """The Archive to move old partitions to, if there's somewhere to put it"""
+    database = getattr(getattr(server, "db", None), "database", None)
+    if ARCHIVE_DIR:
+        return Archive(ARCHIVE_DIR)
+    if database and database != ":memory:":
+        return Archive(database + ".archive")
+    return None
 
 def on_message(msg, server):
     if DO_LOG:
-        server.query("INSERT INTO log VALUES (?, ?, ?, ?, ?)",
-                     msg["text"], msg["user"], msg["ts"], msg["team"], msg["channel"])
+        message_log(server).insert(msg["text"], msg["user"], msg["ts"], msg["team"], msg["channel"])
 
 def on_init(server):
+    global migrator
     if DO_LOG:
-        server.query("""
-CREATE TABLE IF NOT EXISTS log
-    (msg STRING, sender STRING, time STRING, team STRING, channel STRING)
-""")
+        log = message_log(server)
+        # messages logged by older versions of limbo are moved in the
+        # background, a batch at a time, and archiving waits for them
+        migrator = migrate(server.db, "log", log.migrations())
+        log.prune()
+        log.start_archiving()
@@ -11,6 +11,8 @@ except ImportError:
     from urllib.request import quote
 import re
 
+TRIGGERS = ["!map"]
+
 def makemap(query):
     querywords = []
     args = {
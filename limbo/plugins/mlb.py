@@ -7,6 +7,8 @@ import re
 import requests
 from bs4 import BeautifulSoup as Soup
 
+TRIGGERS = ["!mlb"]
+
 schedules = {
     'arizona diamondbacks': 'http://espn.go.com/mlb/team/schedule/_/name/ari/arizona-diamondbacks',
     'atlanta braves': 'http://espn.go.com/mlb/team/schedule/_/name/atl/atlanta-braves',
@@ -44,7 +46,7 @@ def fmtdatetime(dt):
     hour = datetime.strftime(dt, "%I").lstrip('0')
     return datetime.strftime(dt, "%m/%d {0}%p".format(hour))
 
-def schedule(query):
+def schedule(query, http=requests):
     url = None
     query = query.lower()
     for team in schedules:
@@ -55,7 +57,7 @@ def schedule(query):
     if not url:
         return "Unable to find {0}".format(query)
 
-    r = requests.get(url)
+    r = http.get(url)
     soup = Soup(r.text)
     sched = soup.find("table", attrs={"class": "tablehead"})
     games = []
@@ -90,4 +92,4 @@ def on_message(msg, server):
     if not match:
         return
 
-    return schedule(match[0])
+    return schedule(match[0], getattr(server, "http", requests))
@@ -12,6 +12,8 @@ import itertools
 import os
 import re
 
+TRIGGERS = [r"D+\d+"]
+
 PHAB_HOST = os.environ['PHAB_HOST']
 PHAB_ENDPOINT = 'https://' + PHAB_HOST
 PHAB_API_ENDPOINT = 'https://' + PHAB_HOST + '/api/'
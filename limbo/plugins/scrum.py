@@ -5,6 +5,8 @@ import os
 import re
 import datetime
 
+TRIGGERS = [r"rs scrum "]
+
 JIRA_USER = os.environ['JIRA_USER']
 JIRA_AUTH = os.environ['JIRA_AUTH']
 OPTIONS = {
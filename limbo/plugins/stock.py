@@ -10,11 +10,13 @@ except ImportError:
 from bs4 import BeautifulSoup
 import requests
 
+TRIGGERS = [r"\$[a-zA-Z]"]
+
 logger = logging.getLogger(__name__)
 
-def stockprice(ticker):
+def stockprice(ticker, http=requests):
     url = "https://www.google.com/finance?q={0}"
-    soup = BeautifulSoup(requests.get(url.format(quote(ticker))).text)
+    soup = BeautifulSoup(http.get(url.format(quote(ticker))).text)
 
     try:
         company, ticker = re.findall(u"^(.+?)\xa0\xa0(.+?)\xa0", soup.text, re.M)[0]
@@ -36,5 +38,6 @@ def on_message(msg, server):
     if not matches:
         return
 
-    prices = [stockprice(ticker[1:].encode("utf8")) for ticker in matches]
+    http = getattr(server, "http", requests)
+    prices = [stockprice(ticker[1:].encode("utf8"), http) for ticker in matches]
     return "\n".join(p for p in prices if p)
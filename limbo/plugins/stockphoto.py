@@ -10,10 +10,12 @@ except ImportError:
 import requests
 from bs4 import BeautifulSoup
 
-def stock(searchterm):
+TRIGGERS = ["!stock"]
+
+def stock(searchterm, http=requests):
     searchterm = quote(searchterm)
     url = "http://www.shutterstock.com/cat.mhtml?searchterm={0}&search_group=&lang=en&language=en&search_source=search_form&version=llv1".format(searchterm)
-    r = requests.get(url)
+    r = http.get(url)
     soup = BeautifulSoup(r.text)
     images = [x["src"] for x in soup.select(".gc_clip img")]
     shuffle(images)
@@ -26,4 +28,4 @@ def on_message(msg, server):
     if not match:
         return
 
-    return stock(match[0].encode("utf8"))
+    return stock(match[0].encode("utf8"), getattr(server, "http", requests))
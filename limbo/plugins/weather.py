@@ -9,6 +9,8 @@ import re
 import requests
 import time
 
+TRIGGERS = ["!weather"]
+
 # http://openweathermap.org/weather-conditions
 iconmap = {
     "01": ":sunny:",
@@ -22,12 +24,12 @@ iconmap = {
     "50": ":umbrella:",    # mist?
 }
 
-def weather(searchterm):
+def weather(searchterm, http=requests):
     searchterm = quote(searchterm)
     url = 'http://api.openweathermap.org/data/2.5/forecast/daily?q={0}&cnt=5&mode=json&units=imperial'
     url = url.format(searchterm)
 
-    dat = requests.get(url).json()
+    dat = http.get(url).json()
 
     msg = ["{0}: ".format(dat["city"]["name"])]
     for day in dat["list"]:
@@ -45,4 +47,4 @@ def on_message(msg, server):
         return
 
     searchterm = match[0]
-    return weather(searchterm.encode("utf8"))
+    return weather(searchterm.encode("utf8"), getattr(server, "http", requests))
@@ -8,14 +8,16 @@ except ImportError:
 import requests
 from bs4 import BeautifulSoup
 
-def wiki(searchterm):
+TRIGGERS = ["!wiki"]
+
+def wiki(searchterm, http=requests):
     """return the top wiki search result for the term"""
     searchterm = quote(searchterm)
 
     url = "https://en.wikipedia.org/w/api.php?action=query&list=search&srsearch={0}&format=json"
     url = url.format(searchterm)
 
-    result = requests.get(url).json()
+    result = http.get(url).json()
 
     pages = result["query"]["search"]
 
@@ -28,7 +30,8 @@ def wiki(searchterm):
     page = quote(pages[0]["title"].encode("utf8"))
     link = "http://en.wikipedia.org/wiki/{0}".format(page)
 
-    r = requests.get("http://en.wikipedia.org/w/api.php?format=json&action=parse&page={0}".format(page)).json()
+    # https, so that this reuses the connection from the search
+    r = http.get("https://en.wikipedia.org/w/api.php?format=json&action=parse&page={0}".format(page)).json()
     soup = BeautifulSoup(r["parse"]["text"]["*"])
     p = soup.find('p').get_text()
     p = p[:8000]
@@ -42,4 +45,4 @@ def on_message(msg, server):
         return
 
     searchterm = match[0]
-    return wiki(searchterm.encode("utf8"))
+    return wiki(searchterm.encode("utf8"), getattr(server, "http", requests))
@@ -8,11 +8,13 @@ except ImportError:
 
 import requests
 
-def youtube(searchterm):
+TRIGGERS = ["!youtube"]
+
+def youtube(searchterm, http=requests):
     url = "https://www.youtube.com/results?search_query={0}"
     url = url.format(quote(searchterm))
 
-    r = requests.get(url)
+    r = http.get(url)
     results = re.findall('a href="(/watch[^&]*?)"', r.text)
 
     if not results:
@@ -27,4 +29,4 @@ def on_message(msg, server):
         return
 
     searchterm = match[0]
-    return youtube(searchterm.encode("utf8"))
+    return youtube(searchterm.encode("utf8"), getattr(server, "http", requests))
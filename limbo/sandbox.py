@@ -0,0 +1,203 @@
+"""Run selected plugins in a pool of pre-forked worker processes.
+
+Plugins listed in LIMBO_SANDBOX_PLUGINS (e.g. "banner,wiki") have their hooks
+replaced by stubs that ship the event to a worker process and wait for the
+reply. Each call is limited in CPU time and wall-clock time, and each worker
+in how much memory it may allocate; a worker that breaks a limit or crashes is
+killed and replaced, and the call fails without taking the main process (and
+its connection to slack) down with it.
+
+Workers are forked before limbo connects to slack, so sandboxed plugins are
+called with `None` in place of the server, and won't see any state set up by
+`on_init` hooks."""
+import functools
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import sys
+import traceback
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .executor import plugin_name
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_WORKERS = 2
+# seconds of CPU time a single call may use
+SANDBOX_CPU = 5
+# megabytes a worker may allocate beyond what it inherited from limbo
+SANDBOX_MEMORY = 256
+# seconds a call may take, however it spends them
+SANDBOX_TIMEOUT = 30
+
+class SandboxError(Exception):
+    pass
+
+def vm_size():
+    """Return the size of this process's address space in bytes, or 0 if we
+    can't tell"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError):
+        return 0
+
+def limit_memory(megabytes):
+    if resource and megabytes:
+        limit = vm_size() + megabytes * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def limit_cpu(seconds):
+    """Allow `seconds` more seconds of CPU time; after that the kernel kills us
+    with SIGXCPU"""
+    if resource and seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def worker_main(conn, memory_limit):
+    # the parent handles ^C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    limit_memory(memory_limit)
+
+    while True:
+        try:
+            modname, hookname, args, cpu_limit = pickle.loads(conn.recv_bytes())
+        except EOFError:
+            return
+
+        limit_cpu(cpu_limit)
+        try:
+            reply = ("ok", getattr(sys.modules[modname], hookname)(*args))
+        except MemoryError:
+            reply = ("exhausted", "exceeded its memory limit")
+        except Exception:
+            reply = ("error", traceback.format_exc())
+
+        try:
+            data = pickle.dumps(reply, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            data = pickle.dumps(("error", "returned an unpicklable value"), pickle.HIGHEST_PROTOCOL)
+        conn.send_bytes(data)
+
+        # a worker that ran out of memory exits, and is replaced with a fresh one
+        if reply[0] == "exhausted":
+            return
+
+class Worker(object):
+    def __init__(self, context, memory_limit):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child, memory_limit))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        # set when the worker is still busy, dead or exiting, and can't take another call
+        self.broken = False
+
+    def call(self, hook, args, cpu_limit, timeout):
+        name = plugin_name(hook)
+        try:
+            self.conn.send_bytes(pickle.dumps((hook.__module__, hook.__name__, args, cpu_limit),
+                                              pickle.HIGHEST_PROTOCOL))
+            if not self.conn.poll(timeout):
+                self.broken = True
+                raise SandboxError("plugin {0} took more than {1}s".format(name, timeout))
+            status, value = pickle.loads(self.conn.recv_bytes())
+        except (EOFError, IOError, OSError):
+            self.broken = True
+            self.process.join(1)
+            if self.process.exitcode == -getattr(signal, "SIGXCPU", 0):
+                raise SandboxError("plugin {0} exceeded its CPU limit".format(name))
+            raise SandboxError("plugin {0} killed its worker (exit code {1})".format(name, self.process.exitcode))
+
+        if status == "exhausted":
+            self.broken = True
+        if status != "ok":
+            raise SandboxError("plugin {0} failed in its sandbox: {1}".format(name, value))
+        return value
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(1)
+        self.conn.close()
+
+class Sandbox(object):
+    def __init__(self, workers=SANDBOX_WORKERS, cpu_limit=SANDBOX_CPU,
+                 memory_limit=SANDBOX_MEMORY, timeout=SANDBOX_TIMEOUT):
+        if hasattr(multiprocessing, "get_context"):
+            self.context = multiprocessing.get_context("fork")
+        else:
+            self.context = multiprocessing
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+        self.idle = queue.Queue()
+        for _ in range(workers):
+            self.idle.put(self.spawn())
+
+    def spawn(self):
+        return Worker(self.context, self.memory_limit)
+
+    def call(self, hook, *args):
+        """Call `hook` with `args` in a worker process and return its result.
+        Raises SandboxError if the hook fails or breaks one of its limits"""
+        worker = self.idle.get()
+        try:
+            if not worker.alive():
+                worker.kill()
+                worker = self.spawn()
+            return worker.call(hook, args, self.cpu_limit, self.timeout)
+        finally:
+            if worker.broken:
+                worker.kill()
+                worker = self.spawn()
+            self.idle.put(worker)
+
+    def wrap(self, hook):
+        @functools.wraps(hook)
+        def sandboxed(event, *args):
+            return self.call(hook, event, None)
+        return sandboxed
+
+def sandbox_hooks(hooks, plugins, sandbox):
+    """Replace the hooks of each plugin named in `plugins` with one that runs
+    in `sandbox`. init hooks always run in the main process"""
+    for hook, funs in hooks.items():
+        if hook == "init" or not isinstance(funs, list):
+            continue
+        hooks[hook] = [sandbox.wrap(f) if plugin_name(f) in plugins else f for f in funs]
+
+def init_sandbox(config, hooks):
+    """Sandbox the plugins named in LIMBO_SANDBOX_PLUGINS. Returns the
+    Sandbox, or None if no plugins are to be sandboxed"""
+    plugins = set(p.strip() for p in config.get("sandbox_plugins", "").split(",") if p.strip())
+    if not plugins:
+        return None
+
+    sandbox = Sandbox(int(config.get("sandbox_workers", SANDBOX_WORKERS)),
+                      float(config.get("sandbox_cpu", SANDBOX_CPU)),
+                      int(config.get("sandbox_memory", SANDBOX_MEMORY)),
+                      float(config.get("sandbox_timeout", SANDBOX_TIMEOUT)))
+    sandbox_hooks(hooks, plugins, sandbox)
+    logger.debug("sandboxing plugins: {0}".format(", ".join(sorted(plugins))))
+    return sandbox
@@ -1,14 +1,33 @@
+from .httpclient import HTTPClient
+from .storage import Storage
+
 class LimboServer(object):
-    def __init__(self, slack, config, hooks, db):
+    def __init__(self, slack, config, hooks, db, executor=None, http=None, write_behind=None):
         self.slack = slack
         self.config = config
         self.hooks = hooks
-        self.db = db
+        # queries go through a Storage, which keeps writes to one connection
+        # at a time and sends reads to read-only connections
+        self.db = db if db is None or isinstance(db, Storage) else Storage(db)
+        self.executor = executor
+        # the event loop's ChannelDispatcher, once it's started one
+        self.dispatcher = None
+        # plugins share this for their HTTP requests
+        self.http = http or HTTPClient()
+        # and this for writes that don't need to be made right away
+        self.write_behind = write_behind
 
     def query(self, sql, *params):
-        c = self.db.cursor()
-        c.execute(sql, params)
-        rows = c.fetchall()
-        c.close()
-        self.db.commit()
-        return rows
+        return self.db.query(sql, *params)
+
+    def close(self):
+        """Make any writes that are still buffered, stop the thread pools
+        without waiting for plugins that are stuck, and close the database"""
+        if self.write_behind:
+            self.write_behind.close()
+        if self.dispatcher:
+            self.dispatcher.shutdown()
+        if self.executor:
+            self.executor.shutdown()
+        if self.db:
+            self.db.close()
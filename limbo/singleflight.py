@@ -0,0 +1,56 @@
+"""Coalesce identical calls that are in flight at the same time, so that
+when ten people ask for the same thing at once, we only fetch it once."""
+import threading
+
+class Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class FlightTimeout(Exception):
+    pass
+
+class SingleFlight(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        # how many calls we made, and how many waited on one of those instead
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn, timeout=None):
+        """Return fn(), unless a call with the same `key` is already in
+        flight, in which case wait up to `timeout` seconds for it and return
+        its result or raise its exception"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise FlightTimeout(key)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self.lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self.flights)}
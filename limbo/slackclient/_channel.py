@@ -1,26 +1,50 @@
+from ._util import DEFAULT_HANDLES, intern_id
+
 class Channel(object):
+    __slots__ = ("server", "name", "id", "member_handles")
+
     def __init__(self, server, name, id, members=[]):
         self.server = server
         self.name = name
-        self.id = id
+        self.id = intern_id(id)
         self.members = members
 
+    @property
+    def user_handles(self):
+        return getattr(self.server, "user_handles", DEFAULT_HANDLES)
+
+    @property
+    def members(self):
+        """The ids of the channel's members. They're stored as an array of
+        handles, so changing the list this returns won't change the channel;
+        assign a new list instead"""
+        return self.user_handles.unpack(self.member_handles)
+
+    @members.setter
+    def members(self, members):
+        self.member_handles = self.user_handles.pack(members)
+
     def __eq__(self, compare_str):
-        if self.name == compare_str or self.name == "#" + compare_str or self.id == compare_str:
+        if compare_str in self.index_keys():
             return True
         else:
             return False
 
+    def index_keys(self):
+        keys = (self.name, "#" + self.name, self.id)
+        if self.name.startswith("#"):
+            keys += (self.name[1:],)
+        return keys
+
     def __str__(self):
         data = ""
-        for key in list(self.__dict__.keys()):
-            data += "{} : {}\n".format(key, str(self.__dict__[key])[:40])
+        for key in ("name", "id", "members"):
+            data += "{} : {}\n".format(key, str(getattr(self, key))[:40])
         return data
 
     def __repr__(self):
         return self.__str__()
 
     def send_message(self, message):
-        message_json = {"type": "message", "channel": self.id, "text": message}
-        self.server.send_to_websocket(message_json)
+        self.server.send_message(self.id, message)
 
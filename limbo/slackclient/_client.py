@@ -1,8 +1,6 @@
 #!/usr/bin/python
 # mostly a proxy object to abstract how some of this works
 
-import json
-
 from ._server import Server
 
 class SlackClient(object):
@@ -24,11 +22,8 @@ class SlackClient(object):
         # in the future, this should handle some events internally i.e. channel
         # creation
         if self.server:
-            json_data = self.server.websocket_safe_read()
-            data = []
-            if json_data != '':
-                for d in json_data.split('\n'):
-                    data.append(json.loads(d))
+            self.server.outbox.flush()
+            data = self.server.read_frames()
             for item in data:
                 self.process_changes(item)
             return data
@@ -46,6 +41,8 @@ class SlackClient(object):
             if data["type"] == 'im_created':
                 channel = data["channel"]
                 self.server.attach_channel(channel["user"], channel["id"], [])
+            if data["type"] == 'pong':
+                self.server.heartbeat.pong(data.get("reply_to"))
             pass
 
 
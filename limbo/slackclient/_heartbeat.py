@@ -0,0 +1,72 @@
+import threading
+import time
+
+PING_INTERVAL = 10
+MAX_MISSED = 3
+# weight of the newest sample in the moving average of round trip times
+RTT_SMOOTHING = 0.2
+
+
+class Heartbeat(object):
+    """Pings slack every `interval` seconds and matches the pongs that come
+    back to measure round trip time. A ping that goes unanswered for longer
+    than `interval` is missed; after `max_missed` of those the connection is
+    considered dead."""
+
+    def __init__(self, send, interval=PING_INTERVAL, max_missed=MAX_MISSED):
+        self.send = send
+        self.interval = interval
+        self.max_missed = max_missed
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.next_id = 1
+            # ping id -> the time we sent it
+            self.outstanding = {}
+            self.last_ping = 0
+            self.rtt = None
+            self.average_rtt = None
+
+    def ping(self):
+        with self.lock:
+            ping_id = self.next_id
+            self.next_id += 1
+            self.last_ping = time.time()
+            self.outstanding[ping_id] = self.last_ping
+        self.send({"type": "ping", "id": ping_id})
+
+    def tick(self):
+        """Send a ping if one is due"""
+        if self.next_due() == 0:
+            self.ping()
+
+    def next_due(self):
+        """Seconds until the next ping should be sent"""
+        return max(0, self.last_ping + self.interval - time.time())
+
+    def pong(self, reply_to):
+        """Record the pong answering ping `reply_to`. Pings sent before it that
+        are still unanswered won't be, so forget them"""
+        with self.lock:
+            sent = self.outstanding.pop(reply_to, None)
+            if sent is None:
+                return
+            for ping_id in [i for i in self.outstanding if i < reply_to]:
+                del self.outstanding[ping_id]
+
+            self.rtt = time.time() - sent
+            if self.average_rtt is None:
+                self.average_rtt = self.rtt
+            else:
+                self.average_rtt += RTT_SMOOTHING * (self.rtt - self.average_rtt)
+
+    def missed(self):
+        """The number of pings that have gone unanswered for too long"""
+        with self.lock:
+            cutoff = time.time() - self.interval
+            return sum(1 for sent in self.outstanding.values() if sent <= cutoff)
+
+    def dead(self):
+        return self.missed() >= self.max_missed
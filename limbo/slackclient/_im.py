@@ -1,8 +1,12 @@
+from ._util import intern_id
+
 class Im(object):
+    __slots__ = ("server", "user", "id")
+
     def __init__(self, server, user, id):
         self.server = server
-        self.user = user
-        self.id = id
+        self.user = intern_id(user)
+        self.id = intern_id(id)
 
     def __eq__(self, compare_str):
         if self.id == compare_str or self.user == compare_str:
@@ -10,17 +14,19 @@ class Im(object):
         else:
             return False
 
+    def index_keys(self):
+        return (self.id, self.user)
+
     def __str__(self):
         data = ""
-        for key in list(self.__dict__.keys()):
+        for key in self.__slots__:
             if key != "server":
-                data += "{} : {}\n".format(key, str(self.__dict__[key])[:40])
+                data += "{} : {}\n".format(key, str(getattr(self, key))[:40])
         return data
 
     def __repr__(self):
         return self.__str__()
 
     def send_message(self, message):
-        message_json = {"type": "message", "channel": self.id, "text": message}
-        self.server.send_to_websocket(message_json)
+        self.server.send_message(self.id, message)
 
@@ -0,0 +1,100 @@
+import codecs
+import json
+
+# bytes to read from the stream at a time
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+
+
+class JSONStream(object):
+    """Incrementally parses a JSON object from a file-like object of utf-8
+    bytes, so that a large document never has to be held in memory at once.
+
+    Only a window of the document big enough to hold the value being decoded
+    is kept in memory; see members()."""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf = u""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        """Read up to `size` more bytes onto the end of the buffer, dropping
+        what has already been parsed. Returns False at the end of the stream"""
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.fp.read(size)
+        if not data:
+            self.eof = True
+            self.buf += self.text.decode(b"", True)
+            return False
+        self.buf += self.text.decode(data)
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or "" at the end of
+        the stream"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill(self.chunk_size):
+                return ""
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("expected one of {0!r} at {1!r}".format(chars, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # read at least as much again as we have, so that decoding a large
+            # value isn't quadratic in its size
+            self.fill(max(self.chunk_size, len(self.buf) - self.pos))
+
+    def members(self, stream=()):
+        """Yield the (key, value) pairs of the object at the head of the stream.
+
+        If the value of a key in `stream` is an array, its elements are
+        decoded and yielded one at a time as (key, element), rather than
+        building the whole array"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key in stream and self.peek() == "[":
+                self.pos += 1
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                yield key, self.value()
+
+            if self.expect(",}") == "}":
+                return
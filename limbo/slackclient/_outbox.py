@@ -0,0 +1,89 @@
+import threading
+import time
+
+# slack allows about one message per second per channel
+SEND_INTERVAL = 1.0
+# and cuts off messages longer than this
+MAX_MESSAGE_LENGTH = 4000
+
+
+class Outbox(object):
+    """Paces outgoing messages to one per `interval` seconds per channel.
+
+    A message to a channel that hasn't been sent to recently goes out right
+    away; otherwise it waits in the channel's queue, and everything waiting
+    for a channel is sent as one message when the channel is next due.
+    Someone has to call flush() regularly to send queued messages; `wake`,
+    if it's given, is called whenever a message is queued, to tell them
+    there's a new one to wait for."""
+
+    def __init__(self, send, interval=SEND_INTERVAL, max_length=MAX_MESSAGE_LENGTH, wake=None):
+        self.send = send
+        self.wake = wake
+        self.interval = interval
+        self.max_length = max_length
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_sent = {}
+
+    def put(self, channel, text):
+        with self.lock:
+            now = time.time()
+            if channel in self.pending or now - self.last_sent.get(channel, 0) < self.interval:
+                self.pending.setdefault(channel, []).append(text)
+                queued = True
+            else:
+                self.last_sent[channel] = now
+                queued = False
+        if not queued:
+            self.send(channel, text)
+        elif self.wake:
+            self.wake()
+
+    def flush(self):
+        """Send the queued messages for every channel that's due"""
+        ready = []
+        with self.lock:
+            now = time.time()
+            for channel, texts in list(self.pending.items()):
+                if now - self.last_sent.get(channel, 0) < self.interval:
+                    continue
+                text, rest = self.coalesce(texts)
+                if rest:
+                    self.pending[channel] = rest
+                else:
+                    del self.pending[channel]
+                self.last_sent[channel] = now
+                ready.append((channel, text))
+
+        for channel, text in ready:
+            self.send(channel, text)
+
+    def coalesce(self, texts):
+        """Join as many of `texts` as fit in one message. Returns the message
+        and the texts that didn't fit"""
+        merged = texts[0]
+        for i, text in enumerate(texts[1:], 1):
+            if len(merged) + 1 + len(text) > self.max_length:
+                return merged, texts[i:]
+            merged += "\n" + text
+        return merged, []
+
+    def next_due(self):
+        """Seconds until the next queued message may be sent, or None if
+        nothing is queued"""
+        with self.lock:
+            if not self.pending:
+                return None
+            now = time.time()
+            return max(0, min(self.last_sent.get(c, 0) + self.interval - now for c in self.pending))
+
+    def depth(self):
+        """The number of messages waiting to be sent"""
+        with self.lock:
+            return sum(len(texts) for texts in self.pending.values())
+
+    def depths(self):
+        """The number of messages waiting to be sent to each channel"""
+        with self.lock:
+            return dict((channel, len(texts)) for channel, texts in self.pending.items())
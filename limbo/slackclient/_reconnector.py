@@ -0,0 +1,61 @@
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+
+
+class Reconnector(object):
+    """Calls `connect` on a background thread until it stops raising, waiting
+    a jittered, exponentially growing delay between attempts, then calls
+    `on_connect`. Only one reconnection runs at a time."""
+
+    def __init__(self, connect, on_connect, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.connect = connect
+        self.on_connect = on_connect
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.running():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name="slack-reconnect")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def delay(self, attempt):
+        """How long to wait after `attempt` failed attempts. Somewhere between
+        half and all of the exponential backoff, so that a crowd of clients
+        that lost their connections at once won't all retry in lockstep"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+
+    def run(self):
+        attempt = 0
+        while not self.stopping.is_set():
+            try:
+                self.connect()
+            except Exception as e:
+                delay = self.delay(attempt)
+                attempt += 1
+                logger.warning("reconnect attempt {0} failed ({1!r}), retrying in {2:.1f}s".format(attempt, e, delay))
+                self.stopping.wait(delay)
+                continue
+
+            logger.info("reconnected after {0} failed attempts".format(attempt))
+            self.on_connect()
+            return
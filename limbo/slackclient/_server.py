@@ -1,10 +1,34 @@
 from ._slackrequest import SlackRequest
 from ._channel import Channel
+from ._heartbeat import Heartbeat
+from ._jsonstream import JSONStream
+from ._outbox import Outbox
+from ._reconnector import Reconnector
+from ._snapshot import load_roster, save_roster
 from ._user import User
-from ._util import SearchList
+from ._util import Handles, IndexedList, Waker
 
-from websocket import create_connection
+from websocket import create_connection, WebSocketTimeoutException
+import collections
+import errno
 import json
+import logging
+import select
+import ssl
+import threading
+
+logger = logging.getLogger(__name__)
+
+# how many messages we'll hold on to while we're disconnected
+UNSENT_LIMIT = 1000
+# the arrays in an rtm.start reply we build the roster from
+ROSTER_KEYS = ("channels", "groups", "ims", "users")
+
+def would_block(exc):
+    """True if `exc` just means there's nothing to read on a non-blocking socket"""
+    if isinstance(exc, (WebSocketTimeoutException, getattr(ssl, "SSLWantReadError", ()))):
+        return True
+    return getattr(exc, "errno", None) in (errno.EAGAIN, errno.EWOULDBLOCK)
 
 
 class Server(object):
@@ -12,13 +36,28 @@ class Server(object):
         self.token = token
         self.username = None
         self.domain = None
-        self.login_data = None
         self.websocket = None
-        self.users = SearchList()
-        self.channels = SearchList()
+        self.users = IndexedList()
+        self.channels = IndexedList()
+        # channels store their members as handles into this table
+        self.user_handles = Handles()
+        # where to keep a copy of the roster between runs, if anywhere
+        self.roster_path = None
         self.connected = False
         self.pingcounter = 0
         self.api_requester = SlackRequest()
+        # replies may be sent from several threads at once
+        self.send_lock = threading.Lock()
+        # wakes the event loop when a reply is queued, so it can work out
+        # when to send it
+        self.waker = Waker()
+        self.outbox = Outbox(self.send_message_now, wake=self.waker.wake)
+        self.heartbeat = Heartbeat(self.send_to_websocket)
+        self.reconnector = Reconnector(lambda: self.rtm_connect(reconnect=True), self.resume)
+        # set while we're connected, for the event loop to wait on otherwise
+        self.reconnected = threading.Event()
+        # messages sent while disconnected, to be sent once we reconnect
+        self.unsent = collections.deque(maxlen=UNSENT_LIMIT)
 
         if connect:
             self.rtm_connect()
@@ -39,27 +78,87 @@ class Server(object):
         return self.__str__()
 
     def rtm_connect(self, reconnect=False):
-        reply = self.api_requester.do(self.token, "rtm.start")
+        # when reconnecting we already have the roster, and when starting up
+        # we may have one from a snapshot. Then use rtm.connect, which only
+        # returns the websocket url, and refresh a snapshot in the background
+        refresh = not reconnect and len(self.users) > 0
+        reply = self.api_requester.do(self.token, "rtm.connect" if reconnect or refresh else "rtm.start")
         if reply.code != 200:
             raise SlackConnectionError
         else:
-            login_data = json.loads(reply.read().decode('utf-8'))
-            if login_data["ok"]:
+            login_data = self.parse_slack_login_data(JSONStream(reply).members(ROSTER_KEYS))
+            if login_data.get("ok"):
                 self.ws_url = login_data['url']
-                if not reconnect:
-                    self.parse_slack_login_data(login_data)
                 self.connect_slack_websocket(self.ws_url)
             else:
                 raise SlackLoginError
 
-    def parse_slack_login_data(self, login_data):
-        self.login_data = login_data
-        self.domain = self.login_data["team"]["domain"]
-        self.username = self.login_data["self"]["name"]
-        self.parse_channel_data(login_data["channels"])
-        self.parse_channel_data(login_data["groups"])
-        self.parse_channel_data(login_data["ims"])
-        self.parse_user_data(login_data["users"])
+        if refresh:
+            thread = threading.Thread(target=self.refresh_roster_safely, name="slack-roster")
+            thread.daemon = True
+            thread.start()
+        elif not reconnect:
+            self.save_roster()
+
+    def load_roster(self):
+        """Load the roster saved at roster_path, if there is one"""
+        return bool(self.roster_path) and load_roster(self, self.roster_path)
+
+    def save_roster(self):
+        if not self.roster_path:
+            return
+        try:
+            save_roster(self, self.roster_path)
+        except Exception as e:
+            logger.warning("unable to save roster snapshot {0}: {1!r}".format(self.roster_path, e))
+
+    def refresh_roster(self):
+        """Download the roster again and swap it in for the one we have"""
+        # users and channels we hear about while downloading aren't in the
+        # download, so remember where they'll start
+        seen_users, seen_channels = len(self.users), len(self.channels)
+        users, channels = IndexedList(), IndexedList()
+        reply = self.api_requester.do(self.token, "rtm.start")
+        if reply.code != 200:
+            raise SlackConnectionError
+        login_data = self.parse_slack_login_data(JSONStream(reply).members(ROSTER_KEYS), users, channels)
+        if not login_data.get("ok"):
+            raise SlackLoginError
+
+        for new, old, seen in ((users, self.users, seen_users), (channels, self.channels, seen_channels)):
+            for item in old[seen:]:
+                if new.find(item.id) is None:
+                    new.append(item)
+        self.users, self.channels = users, channels
+        logger.info("refreshed roster: {0} users, {1} channels".format(len(users), len(channels)))
+        self.save_roster()
+
+    def refresh_roster_safely(self):
+        try:
+            self.refresh_roster()
+        except Exception as e:
+            logger.warning("unable to refresh the roster, keeping the old one: {0!r}".format(e))
+
+    def parse_slack_login_data(self, members, users=None, channels=None):
+        """Build the roster from the (key, value) pairs of an rtm.start reply,
+        with the roster arrays streamed an element at a time (see JSONStream).
+        Users and channels are added to our own lists unless others are given.
+        Only the fields we use are kept; returns the reply's ok and url"""
+        users = self.users if users is None else users
+        channels = self.channels if channels is None else channels
+        login_data = {}
+        for key, value in members:
+            if key == "users":
+                users.append(self.parse_user(value))
+            elif key in ROSTER_KEYS:
+                channels.append(self.parse_channel(value))
+            elif key == "team":
+                self.domain = value["domain"]
+            elif key == "self":
+                self.username = value["name"]
+            elif key in ("ok", "url", "error"):
+                login_data[key] = value
+        return login_data
 
     def connect_slack_websocket(self, ws_url):
         try:
@@ -67,47 +166,139 @@ class Server(object):
             self.websocket.sock.setblocking(0)
         except:
             raise SlackConnectionError
+        self.connected = True
+        self.reconnected.set()
 
     def parse_channel_data(self, channel_data):
         for channel in channel_data:
-            if "name" not in channel:
-                channel["name"] = channel["id"]
-            if "members" not in channel:
-                channel["members"] = []
-            self.attach_channel(channel["name"],
-                                channel["id"],
-                                channel["members"])
+            self.channels.append(self.parse_channel(channel))
+
+    def parse_channel(self, channel):
+        return Channel(self,
+                       channel.get("name", channel["id"]),
+                       channel["id"],
+                       channel.get("members", []))
 
     def parse_user_data(self, user_data):
         for user in user_data:
-            if "tz" not in user:
-                user["tz"] = "unknown"
-            if "real_name" not in user:
-                user["real_name"] = user["name"]
-            self.attach_user(user["name"], user["id"], user["real_name"], user["tz"])
+            self.users.append(self.parse_user(user))
+
+    def parse_user(self, user):
+        return User(self,
+                    user["name"],
+                    user["id"],
+                    user.get("real_name", user["name"]),
+                    user.get("tz", "unknown"))
 
     def send_to_websocket(self, data):
-        """Send (data) directly to the websocket."""
-        try:
-            data = json.dumps(data)
-            self.websocket.send(data)
-        except:
-            self.rtm_connect(reconnect=True)
+        """Send (data) directly to the websocket. If we're disconnected,
+        messages are held until we reconnect; anything else is dropped"""
+        with self.send_lock:
+            if self.connected:
+                try:
+                    self.websocket.send(json.dumps(data))
+                    return
+                except Exception as e:
+                    logger.warning("websocket send failed: {0!r}".format(e))
+                    self.connected = False
+                    self.reconnected.clear()
+
+            if data.get("type") == "message":
+                self.unsent.append(data)
+
+        self.reconnector.start()
+
+    def send_message(self, channel_id, text):
+        """Queue a message for a channel; see Outbox"""
+        self.outbox.put(channel_id, text)
+
+    def send_message_now(self, channel_id, text):
+        self.send_to_websocket({"type": "message", "channel": channel_id, "text": text})
 
     def ping(self):
-        return self.send_to_websocket({"type": "ping"})
+        return self.heartbeat.ping()
+
+    def reconnect(self):
+        """Drop the current connection and start reconnecting in the background"""
+        self.disconnect()
+        self.reconnector.start()
+
+    def disconnect(self):
+        with self.send_lock:
+            self.connected = False
+            self.reconnected.clear()
+            try:
+                self.websocket.close()
+            except Exception:
+                pass
+
+    def resume(self):
+        """Called once we've reconnected; sends what we couldn't while we were away"""
+        self.heartbeat.reset()
+        with self.send_lock:
+            unsent = list(self.unsent)
+            self.unsent.clear()
+        for data in unsent:
+            self.send_to_websocket(data)
+
+    def wait_for_data(self, timeout):
+        """Block until the websocket has data to read, a reply is queued or
+           `timeout` seconds have passed. Returns True if there may be data
+           to read
+        """
+        if not self.connected:
+            self.reconnected.wait(timeout)
+            return False
+
+        sock = self.websocket.sock
+
+        # an SSL socket may already hold decrypted bytes that select won't see
+        if hasattr(sock, "pending") and sock.pending():
+            return True
+
+        try:
+            readable, _, _ = select.select([sock, self.waker], [], [], timeout)
+        except (TypeError, ValueError, select.error):
+            # the socket was closed under us by a reconnect
+            return False
+        if self.waker in readable:
+            self.waker.clear()
+        return sock in readable
 
     def websocket_safe_read(self):
         """ Returns data if available, otherwise ''. Newlines indicate multiple
             messages
         """
+        return "\n".join(self.read_raw_frames())
 
-        data = ""
-        while True:
+    def read_raw_frames(self):
+        """Return a list of the frames waiting on the websocket, without
+        blocking. If the connection has failed, marks the server as not
+        connected and returns whatever was read before the failure"""
+        frames = []
+        while self.connected:
+            try:
+                frame = self.websocket.recv()
+            except Exception as e:
+                if not would_block(e):
+                    logger.warning("websocket read failed: {0!r}".format(e))
+                    self.connected = False
+                    self.reconnected.clear()
+                return frames
+            # control frames come back empty
+            if frame:
+                frames.append(frame)
+        return frames
+
+    def read_frames(self):
+        """Like read_raw_frames, but returns the decoded messages"""
+        messages = []
+        for frame in self.read_raw_frames():
             try:
-                data += "{}\n".format(self.websocket.recv())
-            except:
-                return data.rstrip()
+                messages.append(json.loads(frame))
+            except ValueError:
+                logger.warning("unable to decode frame {0!r}".format(frame[:100]))
+        return messages
 
     def attach_user(self, name, id, real_name, tz):
         self.users.append(User(self, name, id, real_name, tz))
@@ -1,22 +1,168 @@
+import logging
+import threading
 import time
 
-try:
-    # Try for Python3
-    from urllib.parse import urlencode 
-    from urllib.request import urlopen 
-except:
-    # Looks like Python2
-    from urllib import urlencode 
-    from urllib2 import urlopen 
+import requests
+from requests.adapters import HTTPAdapter
 
+from ..httpclient import API_READ_TIMEOUT, CONNECT_TIMEOUT
 
-class SlackRequest(object):
+logger = logging.getLogger(__name__)
+
+# connections to keep open to slack
+POOL_SIZE = 10
+# how many times to retry a call slack turned away with a 429
+MAX_RETRIES = 3
+# bytes of the reply to read at a time when it's read in pieces
+CHUNK_SIZE = 64 * 1024
+
+# how many calls of a method we can make in a burst before we have to wait
+BURST = 5
+# calls per minute that slack allows for methods in each tier. See
+# https://api.slack.com/docs/rate-limits
+TIER_1, TIER_2, TIER_3, TIER_4 = 1, 20, 50, 100
+METHOD_TIERS = {
+    "channels.join": TIER_3,
+    "channels.list": TIER_2,
+    "chat.postMessage": 60,
+    "conversations.history": TIER_3,
+    "conversations.list": TIER_2,
+    "users.info": TIER_4,
+    "users.list": TIER_2,
+    # these already back off when reconnecting; don't slow them down further
+    "rtm.connect": None,
+    "rtm.start": None,
+}
+DEFAULT_TIER = TIER_3
+
+
+def retry_after(response):
+    """How many seconds a 429 response asks us to wait"""
+    try:
+        return max(0, float(response.headers.get("Retry-After", 1)))
+    except ValueError:
+        return 1
+
+
+class SlackResponse(object):
+    """The status of a Web API call in `code` and its body from read(), like
+    the urlopen replies we used to return. read(size) returns the body a
+    piece at a time"""
+
+    def __init__(self, response):
+        self.response = response
+        self.code = response.status_code
+        self.chunks = None
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            if self.chunks is None:
+                return self.response.content
+            return b"".join(self.chunks)
+        if self.chunks is None:
+            self.chunks = self.response.iter_content(max(size, CHUNK_SIZE))
+        return next(self.chunks, b"")
+
+    def close(self):
+        self.response.close()
+
+
+class MethodStats(object):
     def __init__(self):
-        pass
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, code):
+        self.calls += 1
+        if code == 429:
+            self.rate_limited += 1
+        elif code != 200:
+            self.errors += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "average_time": self.total_time / self.calls if self.calls else 0,
+            "max_time": self.max_time,
+        }
+
+
+class SlackRequest(object):
+    """Calls Web API methods over a pool of kept-alive connections.
+
+    Calls of each method are paced to slack's rate limit for its tier,
+    allowing short bursts, and calls slack turns away with a 429 are retried
+    after the Retry-After it asks for."""
+
+    url_template = "https://{domain}/api/{request}"
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, API_READ_TIMEOUT), max_retries=MAX_RETRIES,
+                 pool_size=POOL_SIZE, method_tiers=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.method_tiers = METHOD_TIERS if method_tiers is None else method_tiers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.lock = threading.Lock()
+        # method -> (calls we may make right away, when we last counted them)
+        self.buckets = {}
+        # method -> when a 429 said we may call it again
+        self.held_until = {}
+        self.method_stats = {}
+
+    def do(self, token, request="?", post_data=None, domain="slack.com"):
+        post_data = dict(post_data or {}, token=token)
+        method = request.split("?", 1)[0]
+        url = self.url_template.format(domain=domain, request=request)
+
+        for attempt in range(self.max_retries + 1):
+            delay = self.reserve(method)
+            if delay:
+                logger.debug("waiting {0:.2f}s to call {1}".format(delay, method))
+                time.sleep(delay)
+
+            start = time.time()
+            response = self.session.post(url, data=post_data, timeout=self.timeout, stream=True)
+            self.record(method, time.time() - start, response.status_code)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return SlackResponse(response)
+
+            wait = retry_after(response)
+            logger.warning("{0} was rate limited, retrying in {1}s".format(method, wait))
+            response.close()
+            with self.lock:
+                self.held_until[method] = max(self.held_until.get(method, 0), time.time() + wait)
+
+    def reserve(self, method):
+        """Take a turn to call `method`, returning how long to wait before
+        making the call"""
+        with self.lock:
+            now = time.time()
+            held = max(0, self.held_until.get(method, 0) - now)
+            per_minute = self.method_tiers.get(method, DEFAULT_TIER)
+            if per_minute is None:
+                return held
+
+            rate = per_minute / 60.0
+            tokens, last = self.buckets.get(method, (BURST, now))
+            tokens = min(BURST, tokens + (now - last) * rate) - 1
+            self.buckets[method] = (tokens, now)
+            return max(held, -tokens / rate)
 
-    def do(self, token, request="?", post_data={}, domain="slack.com"):
-        post_data["token"] = token
-        post_data = urlencode(post_data)
-        url = 'https://{}/api/{}'.format(domain, request)
-        return urlopen(url, post_data.encode('utf-8'))
+    def record(self, method, elapsed, code):
+        with self.lock:
+            self.method_stats.setdefault(method, MethodStats()).record(elapsed, code)
 
+    def stats(self):
+        """Call counts and latencies for each method we've called"""
+        with self.lock:
+            return dict((method, s.as_dict()) for method, s in self.method_stats.items())
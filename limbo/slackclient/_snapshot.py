@@ -0,0 +1,73 @@
+import logging
+import os
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from ._channel import Channel
+from ._user import User
+from ._util import Handles, IndexedList, intern_id
+
+logger = logging.getLogger(__name__)
+
+# bump this when the layout below changes, so old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+
+def save_roster(server, path):
+    """Write the server's users and channels to `path`"""
+    start = time.time()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "username": server.username,
+        "domain": server.domain,
+        "user_ids": server.user_handles.strings,
+        "users": [(u.name, u.id, u.real_name, u.tz) for u in server.users],
+        "channels": [(c.name, c.id, c.member_handles) for c in server.channels],
+    }
+    # write to a temporary file first so a crash can't leave half a snapshot
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, path)
+    logger.debug("saved {0} users and {1} channels to {2} in {3:.3f}s".format(
+        len(server.users), len(server.channels), path, time.time() - start))
+
+
+def load_roster(server, path):
+    """Replace the server's users and channels with the ones saved in `path`.
+    Returns False if there's no usable snapshot there"""
+    start = time.time()
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except (IOError, OSError):
+        return False
+    except Exception as e:
+        logger.warning("unable to read roster snapshot {0}: {1!r}".format(path, e))
+        return False
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        logger.warning("ignoring roster snapshot {0} from another version of limbo".format(path))
+        return False
+
+    handles = Handles()
+    handles.strings = [intern_id(s) for s in snapshot["user_ids"]]
+    handles.numbers = dict((s, n) for n, s in enumerate(handles.strings))
+
+    channels = IndexedList()
+    for name, id, member_handles in snapshot["channels"]:
+        channel = Channel(server, name, id)
+        channel.member_handles = member_handles
+        channels.append(channel)
+
+    server.user_handles = handles
+    server.users = IndexedList(User(server, *user) for user in snapshot["users"])
+    server.channels = channels
+    server.username = snapshot["username"]
+    server.domain = snapshot["domain"]
+    logger.info("loaded {0} users and {1} channels from {2} in {3:.3f}s".format(
+        len(server.users), len(server.channels), path, time.time() - start))
+    return True
@@ -1,10 +1,15 @@
+from ._util import intern_id
+
 class User(object):
+    __slots__ = ("server", "name", "id", "real_name", "tz")
+
     def __init__(self, server, name, id, real_name, tz):
-        self.tz = tz
+        # there are only a few hundred time zones
+        self.tz = intern_id(tz)
         self.name = name
         self.real_name = real_name
         self.server = server
-        self.id = id
+        self.id = intern_id(id)
 
     def __eq__(self, compare_str):
         if self.id == compare_str or self.name == compare_str:
@@ -12,11 +17,14 @@ class User(object):
         else:
             return False
 
+    def index_keys(self):
+        return (self.id, self.name)
+
     def __str__(self):
         data = ""
-        for key in list(self.__dict__.keys()):
+        for key in self.__slots__:
             if key != "server":
-                data += "{} : {}\n".format(key, str(self.__dict__[key])[:40])
+                data += "{} : {}\n".format(key, str(getattr(self, key))[:40])
         return data
 
     def __repr__(self):
@@ -1,3 +1,22 @@
+from array import array
+import socket
+
+try:
+    from sys import intern
+except ImportError:
+    # python 2 has intern as a builtin
+    pass
+
+
+def intern_id(s):
+    """Intern a slack id, so every object that refers to it shares one copy"""
+    try:
+        return intern(s)
+    except TypeError:
+        # python 2 won't intern unicode, and tests use integer ids
+        return s
+
+
 class SearchList(list):
 
     def find(self, name):
@@ -14,3 +33,142 @@ class SearchList(list):
         elif items != []:
             return items
 
+
+class IndexedList(SearchList):
+    """A SearchList that finds items with a dict lookup instead of comparing
+    `name` against every item. Items list the strings they should be found by
+    in an index_keys() method; items without one are compared the old way.
+    If you change an item's keys after adding it, call reindex()."""
+
+    def __init__(self, items=()):
+        super(IndexedList, self).__init__()
+        self.reindex()
+        self.extend(items)
+
+    def reindex(self):
+        self.index = {}
+        self.unindexed = []
+        for item in self:
+            self._add(item)
+
+    def _add(self, item):
+        index_keys = getattr(item, "index_keys", None)
+        if index_keys is None:
+            self.unindexed.append(item)
+            return
+        index = self.index
+        for key in index_keys():
+            # most keys belong to one item, so only make a tuple for the
+            # ones that don't
+            found = index.get(key)
+            if found is None:
+                index[key] = item
+            elif isinstance(found, tuple):
+                # an item whose name is its id should only be found once
+                if found[-1] is not item:
+                    index[key] = found + (item,)
+            elif found is not item:
+                index[key] = (found, item)
+
+    def append(self, item):
+        super(IndexedList, self).append(item)
+        self._add(item)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def insert(self, i, item):
+        super(IndexedList, self).insert(i, item)
+        self.reindex()
+
+    def remove(self, item):
+        super(IndexedList, self).remove(item)
+        self.reindex()
+
+    def pop(self, *args):
+        item = super(IndexedList, self).pop(*args)
+        self.reindex()
+        return item
+
+    def __setitem__(self, i, item):
+        super(IndexedList, self).__setitem__(i, item)
+        self.reindex()
+
+    def __delitem__(self, i):
+        super(IndexedList, self).__delitem__(i)
+        self.reindex()
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def find(self, name):
+        found = self.index.get(name, ())
+        items = list(found) if isinstance(found, tuple) else [found]
+        for child in self.unindexed:
+            if isinstance(child, SearchList):
+                found = child.find(name)
+                if isinstance(found, list):
+                    items += found
+                elif found is not None:
+                    items.append(found)
+            elif child == name:
+                items.append(child)
+
+        if len(items) == 1:
+            return items[0]
+        elif items != []:
+            return items
+
+
+class Handles(object):
+    """Numbers the strings it's given, so that lists of them can be stored as
+    compact arrays of ints"""
+
+    def __init__(self):
+        self.strings = []
+        self.numbers = {}
+
+    def handle(self, s):
+        n = self.numbers.get(s)
+        if n is None:
+            n = self.numbers[s] = len(self.strings)
+            self.strings.append(intern_id(s))
+        return n
+
+    def pack(self, strings):
+        return array("i", [self.handle(s) for s in strings])
+
+    def unpack(self, handles):
+        return [self.strings[n] for n in handles]
+
+# for objects that aren't attached to a server with its own handles
+DEFAULT_HANDLES = Handles()
+
+
+class Waker(object):
+    """A socket that select() sees as readable once wake() has been called,
+    so another thread can cut a wait on the websocket short"""
+
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(0)
+        self.writer.setblocking(0)
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def wake(self):
+        try:
+            self.writer.send(b"\0")
+        except socket.error:
+            # the buffer's full, so it's already awake
+            pass
+
+    def clear(self):
+        try:
+            while self.reader.recv(4096):
+                pass
+        except socket.error:
+            pass
@@ -0,0 +1,122 @@
+"""limbo's sqlite database, shared by every thread that runs plugins.
+
+All writes go through a single connection, one at a time. Reads go to a pool
+of read-only connections. The database is in WAL mode, so readers see the
+last committed write and never wait for a write in progress, and a long
+read doesn't hold up the log."""
+import contextlib
+import sqlite3
+import threading
+
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue
+
+# how many read-only connections to open at most
+READERS = 4
+# seconds a write waits for the database to be unlocked
+BUSY_TIMEOUT = 30
+# statements that only read, and can go to a reader
+READ_STATEMENTS = ("SELECT", "EXPLAIN")
+
+def connect(database, readonly=False):
+    """Open a connection that can be used from any thread, as long as only
+    one uses it at a time. The first writable connection puts the database
+    in WAL mode"""
+    db = sqlite3.connect(database, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    if readonly:
+        db.execute("PRAGMA query_only=ON")
+        return db
+    db.execute("PRAGMA journal_mode=WAL")
+    # in WAL mode this is still safe against corruption, and skips an fsync
+    # per transaction
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+def is_read(sql):
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() in READ_STATEMENTS
+
+class Storage(object):
+    """Runs queries on `writer`, a connection from connect(), or on
+    read-only connections to `database` when they only read.
+
+    Without a `database` to open readers on, everything goes to the writer"""
+
+    def __init__(self, writer, database=None, readers=READERS):
+        self.writer = writer
+        self.write_lock = threading.RLock()
+        self.database = database
+        # an in-memory database can't be opened a second time
+        self.readers = readers if database and database != ":memory:" else 0
+        self.idle = Queue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def query(self, sql, *params):
+        """Run `sql` and return its rows. Writes are committed before this
+        returns"""
+        if self.readers and is_read(sql):
+            return self.read(sql, *params)
+        return self.write(sql, *params)
+
+    def read(self, sql, *params):
+        with self.reader() as db:
+            return db.execute(sql, params).fetchall()
+
+    def write(self, sql, *params):
+        with self.transaction() as db:
+            return db.execute(sql, params).fetchall()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Hold the writer for a transaction, which is committed at the end
+        of the block or rolled back if it raises"""
+        with self.write_lock:
+            with self.writer:
+                yield self.writer
+
+    @contextlib.contextmanager
+    def reader(self):
+        """Borrow a read-only connection, waiting for one if they're all in
+        use"""
+        if not self.readers:
+            with self.write_lock:
+                yield self.writer
+            return
+
+        try:
+            db = self.idle.get_nowait()
+        except Empty:
+            with self.lock:
+                opening = self.opened < self.readers
+                if opening:
+                    self.opened += 1
+            if opening:
+                try:
+                    db = connect(self.database, readonly=True)
+                except sqlite3.Error:
+                    with self.lock:
+                        self.opened -= 1
+                    raise
+            else:
+                db = self.idle.get()
+        try:
+            yield db
+        finally:
+            self.idle.put(db)
+
+    def close(self):
+        with self.write_lock:
+            self.writer.close()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                break
+
+def init_storage(config, writer, database):
+    """Returns the Storage for `database`, with up to LIMBO_DB_READERS
+    read-only connections"""
+    return Storage(writer, database, int(config.get("db_readers", READERS)))
@@ -0,0 +1,78 @@
+"""Route each message to only the plugins that might respond to it.
+
+A plugin can declare what it responds to with a module-level TRIGGERS list.
+Entries of the form "!command" go into an index keyed on the command name;
+anything else is treated as a regular expression, and all of those are
+merged into a single regex that's searched once per message. Plugins that
+don't declare TRIGGERS are called for every message, as before.
+
+    TRIGGERS = ["!wiki"]
+    TRIGGERS = [r"\\$[a-zA-Z]"]
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# what a command looks like in a message
+COMMAND = re.compile(r"!(\w+)")
+# a trigger that's nothing but a command
+LITERAL = re.compile(r"^!\w+$")
+
+class TriggerRouter(object):
+    def __init__(self):
+        # command name -> indexes of the message hooks it triggers
+        self.commands = {}
+        # (index, pattern) for every regex trigger
+        self.patterns = []
+        # indexes of message hooks with no TRIGGERS, which see every message
+        self.always = set()
+        self.compiled = []
+        self.combined = None
+
+    def add(self, index, triggers):
+        """Register the triggers for the message hook at `index`. If triggers
+        is None, the hook will be called for every message"""
+        if triggers is None:
+            self.always.add(index)
+            return
+
+        for trigger in triggers:
+            if LITERAL.match(trigger):
+                self.commands.setdefault(trigger[1:], set()).add(index)
+            else:
+                self.patterns.append((index, trigger))
+
+    def compile(self):
+        self.compiled = [(index, re.compile(pattern)) for index, pattern in self.patterns]
+        if self.patterns:
+            try:
+                self.combined = re.compile("|".join("(?:{0})".format(p) for _, p in self.patterns))
+            except re.error:
+                # some patterns (inline flags, backreferences) can't be merged;
+                # we'll search for each one separately
+                logger.debug("unable to merge trigger patterns", exc_info=True)
+                self.combined = None
+        return self
+
+    def match(self, text):
+        """Return the indexes of the message hooks that might respond to
+        `text`, in the order the hooks were loaded"""
+        matched = set(self.always)
+
+        # a hook's regex may match a longer word than its command name (!flip
+        # matches "!flipper"), so look up every prefix of each command
+        for command in COMMAND.findall(text):
+            for end in range(1, len(command) + 1):
+                matched.update(self.commands.get(command[:end], ()))
+
+        if self.compiled and (self.combined is None or self.combined.search(text)):
+            for index, regex in self.compiled:
+                if index not in matched and regex.search(text):
+                    matched.add(index)
+
+        return sorted(matched)
+
+    def __bool__(self):
+        return bool(self.commands or self.patterns)
+    __nonzero__ = __bool__
@@ -0,0 +1,158 @@
+"""Buffer writes to the database and make them in batches on a background
+thread, so that logging a message doesn't wait for the database on the
+thread that answers it.
+
+Buffered writes are made with executemany, in one transaction per batch,
+once `batch_rows` of them are waiting or the oldest has waited `batch_ms`
+milliseconds, and when the writer is flushed or closed. If a batch fails,
+its writes are retried a statement and then a row at a time, and only the
+rows that still fail are dropped."""
+import itertools
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = 500
+BATCH_MS = 1000
+# how long to wait for the last batch to be written when shutting down
+CLOSE_TIMEOUT = 10
+
+class WriteBehind(object):
+    """Makes buffered writes through `storage`'s writer, so that they take
+    their turn with everything else written to the database"""
+
+    def __init__(self, storage, batch_rows=BATCH_ROWS, batch_ms=BATCH_MS):
+        self.storage = storage
+        self.batch_rows = batch_rows
+        self.interval = batch_ms / 1000.0
+        self.cond = threading.Condition()
+        # (sql, params) for each write we haven't made yet
+        self.pending = []
+        # when the oldest pending write was buffered
+        self.oldest = None
+        self.writing = False
+        self.flushing = 0
+        self.closed = False
+        self.thread = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def write(self, sql, *params):
+        with self.cond:
+            if self.closed:
+                raise ValueError("write to a closed WriteBehind: {0}".format(sql))
+            if not self.pending:
+                self.oldest = time.time()
+            self.pending.append((sql, params))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="write-behind")
+                self.thread.daemon = True
+                self.thread.start()
+            # the writer waits without a timeout while there's nothing to
+            # write, so the first write has to start its clock
+            if len(self.pending) == 1 or len(self.pending) >= self.batch_rows:
+                self.cond.notify_all()
+
+    def due(self):
+        """Seconds until the pending writes should be made, 0 if they should
+        be made now, or None if there's nothing to write"""
+        if not self.pending:
+            # when we're closed, there's nothing left to wait for
+            return 0 if self.closed else None
+        if self.closed or self.flushing or len(self.pending) >= self.batch_rows:
+            return 0
+        return max(0, self.oldest + self.interval - time.time())
+
+    def run(self):
+        while True:
+            with self.cond:
+                wait = self.due()
+                while wait != 0:
+                    self.cond.wait(wait)
+                    wait = self.due()
+                if not self.pending and self.closed:
+                    return
+                batch, self.pending = self.pending, []
+                self.writing = True
+
+            self.write_batch(batch)
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+    def write_batch(self, batch):
+        # runs of the same statement go to executemany together
+        runs = [(sql, [params for _, params in writes])
+                for sql, writes in itertools.groupby(batch, key=lambda write: write[0])]
+        try:
+            self.write_runs(runs)
+        except sqlite3.Error as e:
+            # so that one bad write doesn't cost the rest of the batch, retry
+            # each run on its own, and each row of a run that fails again
+            logger.warning("retrying a batch of {0} buffered writes that failed: {1!r}".format(len(batch), e))
+            for sql, rows in runs:
+                try:
+                    self.write_runs([(sql, rows)])
+                except sqlite3.Error:
+                    for params in rows:
+                        self.write_row(sql, params)
+        self.batches += 1
+
+    def write_runs(self, runs):
+        """Make each (sql, rows) in `runs` in one transaction"""
+        with self.storage.transaction() as db:
+            for sql, rows in runs:
+                db.executemany(sql, rows)
+        self.written += sum(len(rows) for _, rows in runs)
+
+    def write_row(self, sql, params):
+        try:
+            with self.storage.transaction() as db:
+                db.execute(sql, params)
+            self.written += 1
+        except sqlite3.Error as e:
+            self.failed += 1
+            logger.warning("dropping a buffered write that failed: {0} {1!r}: {2!r}".format(sql, params, e))
+
+    def flush(self, timeout=None):
+        """Wait until everything written so far has been made, or `timeout`
+        seconds. Returns True if everything was made"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            self.flushing += 1
+            self.cond.notify_all()
+            try:
+                while (self.pending or self.writing) and self.thread is not None and self.thread.is_alive():
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+                return not self.pending
+            finally:
+                self.flushing -= 1
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Make the pending writes and stop the writer thread"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                logger.warning("gave up waiting for {0} buffered writes".format(len(self.pending)))
+
+    def stats(self):
+        with self.cond:
+            return {"pending": len(self.pending), "written": self.written,
+                    "batches": self.batches, "failed": self.failed}
+
+def init_write_behind(config, storage):
+    """Returns a WriteBehind for `storage` that writes every
+    LIMBO_LOG_BATCH_ROWS rows or LIMBO_LOG_BATCH_MS milliseconds"""
+    return WriteBehind(storage,
+                       int(config.get("log_batch_rows", BATCH_ROWS)),
+                       float(config.get("log_batch_ms", BATCH_MS)))
@@ -14,7 +14,7 @@ PYTHON3 = sys.version_info[0] > 2
 
 required = ['requests>=2.5', 'websocket-client==0.25.0', 'beautifulsoup4==4.3.2', 'pyfiglet==0.7.4']
 if not PYTHON3:
-    required += ['importlib>=1.0.3']
+    required += ['importlib>=1.0.3', 'futures>=2.2.0']
 
 packages = ['limbo', 'limbo.slackclient', 'limbo.plugins']
 
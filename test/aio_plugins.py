@@ -0,0 +1,32 @@
+# -*- coding: UTF-8 -*-
+"""Coroutine plugins for test_aio. They're kept out of test_aio.py, which has
+to import on pythons without async def to skip itself"""
+import asyncio
+
+from limbo import aio
+
+async def async_echo(msg, server):
+    await asyncio.sleep(0.2)
+    return msg["text"]
+
+async def slow_first(msg, server):
+    if msg["text"] == u"slow":
+        await asyncio.sleep(0.2)
+    return msg["text"]
+
+async def hang_first(msg, server):
+    if msg["text"] == u"hang":
+        await asyncio.sleep(60)
+    return msg["text"]
+
+async def quick(msg, server):
+    return u"quick"
+
+async def respond_in_turn(server, *events):
+    """Respond to `events`, each waiting for the one before it"""
+    previous = None
+    responses = []
+    for event in events:
+        previous = asyncio.ensure_future(aio.respond(event, server, previous))
+        responses.append(previous)
+    await asyncio.wait(responses)
@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+"""Fixtures shared by the tests"""
+try:
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from limbo.storage import READERS, Storage, connect
+
+class Database(object):
+    """A Storage for a database in a temporary directory, which is removed
+    along with it"""
+    def __init__(self, readers=READERS):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "limbo.sqlite3")
+        self.storage = Storage(connect(self.path), self.path, readers)
+
+    def rows(self, sql):
+        """The rows `sql` returns, read on a connection of its own, with rows
+        of one column as just that column"""
+        db = sqlite3.connect(self.path)
+        try:
+            return [row[0] if len(row) == 1 else row for row in db.execute(sql).fetchall()]
+        finally:
+            db.close()
+
+    def remove(self):
+        self.storage.close()
+        shutil.rmtree(self.dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.remove()
+
+class RecordingSlack(object):
+    """Stands in for a SlackClient, recording (channel, message, time) for
+    each message sent"""
+    def __init__(self, server):
+        self.server = server
+        self.sent = []
+
+    def rtm_send_message(self, channel, message):
+        self.sent.append((channel, message, time.time()))
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # kept-alive connections hold on to their threads
+    daemon_threads = True
+
+def serve(handler):
+    """Start a ThreadingHTTPServer for `handler` on a free local port, in
+    the background"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    t = threading.Thread(target=httpd.serve_forever)
+    t.daemon = True
+    t.start()
+    return httpd
@@ -2,12 +2,18 @@
 import logging
 from .mock_handler import MockHandler
 from .SearchList import SearchList, User
+from .helpers import RecordingSlack
 import os
 import sqlite3
 import tempfile
+import time
 from nose.tools import eq_
 
 import limbo
+from limbo.dispatch import ChannelDispatcher
+from limbo.executor import PluginExecutor, parse_timeouts
+from limbo.server import LimboServer
+from limbo.triggers import TriggerRouter
 
 # test plugin hooks
 #
@@ -53,6 +59,119 @@ def test_missing_hook():
     hooks = limbo.init_plugins("test/plugins")
     eq_(limbo.run_hook(hooks, "nonexistant", {"text": u"!echo bananas"}, None), [])
 
+def slow_hook(msg, server):
+    time.sleep(0.5)
+    return "slow"
+
+def fast_hook(msg, server):
+    return "fast"
+
+def test_run_hook_executor():
+    hooks = limbo.init_plugins("test/plugins")
+    executor = PluginExecutor(pool_size=2, timeout=1)
+    eq_(limbo.run_hook(hooks, "message", {"text": u"!echo bananas"}, None, executor=executor), [u"!echo bananas"])
+
+def test_run_hook_executor_timeout():
+    mhdr = MockHandler()
+    logging.getLogger("limbo.executor").addHandler(mhdr)
+    executor = PluginExecutor(pool_size=2, timeout=0.1)
+    start = time.time()
+    eq_(limbo.run_hook({"message": [slow_hook, fast_hook]}, "message", {}, None, executor=executor), ["fast"])
+    assert time.time() - start < 0.4
+    time.sleep(0.6)
+    assert mhdr.check("WARNING", "dropping late result")
+
+def test_run_hook_executor_per_plugin_timeout():
+    executor = PluginExecutor(pool_size=2, timeout=0.1, timeouts={slow_hook.__module__: 1})
+    eq_(limbo.run_hook({"message": [slow_hook, fast_hook]}, "message", {}, None, executor=executor), ["slow", "fast"])
+
+def test_stream_replies():
+    executor = PluginExecutor(pool_size=2, timeout=1)
+    server = limbo.FakeServer(hooks={"message": [slow_hook, fast_hook]}, executor=executor,
+                              config={"stream_replies": "1"})
+    server.slack = RecordingSlack(server.slack.server)
+
+    start = time.time()
+    eq_(limbo.handle_message({"user": "msguser", "channel": "C1"}, server), None)
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", "fast"), ("C1", "slow")])
+    assert server.slack.sent[0][2] - start < 0.2
+
+def test_stream_replies_window():
+    executor = PluginExecutor(pool_size=2, timeout=1)
+    server = limbo.FakeServer(hooks={"message": [slow_hook, fast_hook]}, executor=executor,
+                              config={"stream_replies": "1", "stream_window": "800"})
+    server.slack = RecordingSlack(server.slack.server)
+    limbo.handle_message({"user": "msguser", "channel": "C1"}, server)
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", "slow\nfast")])
+
+def test_stream_replies_timeout():
+    executor = PluginExecutor(pool_size=2, timeout=0.1)
+    server = limbo.FakeServer(hooks={"message": [slow_hook, fast_hook]}, executor=executor,
+                              config={"stream_replies": "1"})
+    server.slack = RecordingSlack(server.slack.server)
+    limbo.handle_message({"user": "msguser", "channel": "C1"}, server)
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", "fast")])
+
+def test_server_close_stops_thread_pools():
+    executor = PluginExecutor(pool_size=2, timeout=0.1)
+    server = LimboServer(None, {}, {}, None, executor=executor)
+    server.dispatcher = ChannelDispatcher(lambda event: None)
+    server.close()
+    for pool in (executor.pool, server.dispatcher.pool):
+        try:
+            pool.submit(time.time)
+        except RuntimeError:
+            pass
+        else:
+            assert False, "the pool should be shut down"
+
+def test_parse_timeouts():
+    eq_(parse_timeouts("wiki:20, google:5"), {"wiki": 20.0, "google": 5.0})
+    eq_(parse_timeouts(None), {})
+
+# test trigger routing
+
+def test_trigger_router():
+    router = TriggerRouter()
+    router.add(0, ["!wiki"])
+    router.add(1, None)
+    router.add(2, [r"\$[a-zA-Z]", "!stock"])
+    router.add(3, ["!flip"])
+    router.compile()
+
+    eq_(router.match(u"nothing to see here"), [1])
+    eq_(router.match(u"!wiki dog"), [0, 1])
+    eq_(router.match(u"what's $AAPL at"), [1, 2])
+    eq_(router.match(u"!flipper and !wiki"), [0, 1, 3])
+
+def test_trigger_router_unmergeable_patterns():
+    router = TriggerRouter()
+    router.add(0, [r"(?i)hello"])
+    router.add(1, [r"(a)\1"])
+    router.compile()
+    eq_(router.match(u"HELLO"), [0])
+    eq_(router.match(u"aa"), [1])
+
+def test_handle_message_routes_triggers():
+    calls = []
+
+    def wiki(msg, server):
+        calls.append("wiki")
+        return "wiki"
+
+    def log(msg, server):
+        calls.append("log")
+
+    router = TriggerRouter()
+    router.add(0, ["!wiki"])
+    router.add(1, None)
+    hooks = {"message": [wiki, log], "triggers": router.compile()}
+    server = limbo.FakeServer(hooks=hooks)
+
+    eq_(limbo.handle_message({"user": "msguser", "text": u"!flip"}, server), "")
+    eq_(limbo.handle_message({"user": "msguser", "text": u"!wiki dog"}, server), "wiki")
+    eq_(calls, ["log", "wiki", "log"])
+
 # test handle_message
 
 def test_handle_message_subtype():
@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+import sys
+import time
+
+from nose.tools import eq_
+
+try:
+    from unittest import SkipTest
+except ImportError:
+    from nose.plugins.skip import SkipTest
+
+if sys.version_info < (3, 5):
+    raise SkipTest("the asyncio runtime needs python 3.5")
+
+import asyncio
+
+import limbo
+from limbo import aio
+from limbo.executor import PluginExecutor
+from limbo.httpclient import current_plugin, remaining_time
+
+from .aio_plugins import async_echo, hang_first, quick, respond_in_turn, slow_first
+from .helpers import RecordingSlack
+
+def sync_echo(msg, server):
+    time.sleep(0.2)
+    return msg["text"].upper()
+
+def broken(msg, server):
+    1 / 0
+
+def slow(msg, server):
+    time.sleep(0.5)
+    return u"slow"
+
+def fast(msg, server):
+    return u"fast"
+
+def deadline(msg, server):
+    return u"{0} {1:.1f}".format(current_plugin(), remaining_time())
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+def test_run_hook_concurrently():
+    hooks = {"message": [async_echo, sync_echo, broken]}
+    start = time.time()
+    eq_(run(aio.run_hook(hooks, "message", {"text": u"bananas"}, None)), [u"bananas", u"BANANAS"])
+    assert time.time() - start < 0.35
+
+def test_handle_message():
+    hooks = {"message": [async_echo, sync_echo]}
+    server = limbo.FakeServer(hooks=hooks)
+    event = {"type": "message", "user": "msguser", "text": u"Iñtërnâtiônàlizætiøn"}
+    eq_(run(aio.handle_event(event, server)), u"Iñtërnâtiônàlizætiøn\nIÑTËRNÂTIÔNÀLIZÆTIØN")
+
+def test_handle_message_ignores_self():
+    server = limbo.FakeServer(hooks={"message": [async_echo]})
+    eq_(run(aio.handle_message({"user": "limbo_test"}, server)), None)
+
+def test_sync_run_hook_awaits_coroutines():
+    hooks = {"message": [async_echo]}
+    eq_(limbo.run_hook(hooks, "message", {"text": u"bananas"}, None), [u"bananas"])
+
+def test_respond_keeps_channel_order():
+    server = limbo.FakeServer(hooks={"message": [slow_first]})
+    server.slack = RecordingSlack(server.slack.server)
+
+    run(respond_in_turn(server,
+                        {"type": "message", "user": "msguser", "channel": "C1", "text": u"slow"},
+                        {"type": "message", "user": "msguser", "channel": "C1", "text": u"fast"}))
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", u"slow"), ("C1", u"fast")])
+
+def test_hung_plugin_doesnt_hold_up_its_channel():
+    executor = PluginExecutor(pool_size=2, timeout=0.2)
+    server = limbo.FakeServer(hooks={"message": [hang_first]}, executor=executor)
+    server.slack = RecordingSlack(server.slack.server)
+
+    start = time.time()
+    run(respond_in_turn(server,
+                        {"type": "message", "user": "msguser", "channel": "C1", "text": u"hang"},
+                        {"type": "message", "user": "msguser", "channel": "C1", "text": u"fast"}))
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", u"fast")])
+    assert time.time() - start < 1
+    executor.shutdown()
+
+def test_stream_responses():
+    server = limbo.FakeServer(hooks={"message": [sync_echo, quick]}, config={"stream_replies": "1"})
+    server.slack = RecordingSlack(server.slack.server)
+    event = {"type": "message", "user": "msguser", "channel": "C1", "text": u"hi"}
+    eq_(run(aio.handle_event(event, server)), None)
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", u"quick"), ("C1", u"HI")])
+
+def test_stream_responses_window():
+    server = limbo.FakeServer(hooks={"message": [sync_echo, quick]},
+                              config={"stream_replies": "1", "stream_window": "500"})
+    server.slack = RecordingSlack(server.slack.server)
+    event = {"type": "message", "user": "msguser", "channel": "C1", "text": u"hi"}
+    run(aio.handle_event(event, server))
+    eq_([(c, m) for c, m, _ in server.slack.sent], [("C1", u"HI\nquick")])
+
+def test_plugins_get_deadlines():
+    executor = PluginExecutor(pool_size=2, timeout=0.1)
+    server = limbo.FakeServer(hooks={"message": [slow, fast]}, executor=executor)
+    event = {"type": "message", "user": "msguser", "channel": "C1", "text": u"hi"}
+    start = time.time()
+    eq_(run(aio.handle_event(event, server)), u"fast")
+    assert time.time() - start < 0.4
+
+    # and their HTTP requests are cut short, and credited to them
+    executor.timeout = 2
+    eq_(run(aio.run_hook({"message": [deadline]}, "message", event, server, executor=executor)),
+        [u"test.test_aio 2.0"])
+    executor.shutdown()
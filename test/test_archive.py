@@ -0,0 +1,179 @@
+# -*- coding: UTF-8 -*-
+import calendar
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from nose.tools import eq_
+
+from limbo.archive import Archive
+from limbo.messagelog import MessageLog
+from limbo.migrations import migrate
+
+from .helpers import Database
+
+def when(*date):
+    return calendar.timegm(date + (0, 0, 0))
+
+def rows(n, start, channel="C1"):
+    return [(start + i, u"message {0} Iñtërnâtiônàlizætiøn".format(i), "U{0}".format(i % 2), "T1", channel)
+            for i in range(n)]
+
+class Directory(object):
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.path)
+
+def test_append_and_read():
+    with Directory() as d:
+        archive = Archive(os.path.join(d.path, "archive"), block_rows=4)
+        eq_(archive.segments(), [])
+        eq_(archive.append("log_2015_11", rows(10, when(2015, 11, 1))), 10)
+        eq_(archive.append("log_2015_10", rows(3, when(2015, 10, 1))), 3)
+        eq_(archive.segments(), ["log_2015_10", "log_2015_11"])
+        eq_(archive.count("log_2015_11"), 10)
+        eq_(len(list(archive.blocks("log_2015_11"))), 3)
+
+        records = list(archive.read())
+        eq_(len(records), 13)
+        eq_(records[3], {"ts": when(2015, 11, 1), "msg": u"message 0 Iñtërnâtiônàlizætiøn",
+                         "sender": "U0", "team": "T1", "channel": "C1"})
+
+        start = when(2015, 11, 1)
+        eq_([r["ts"] - start for r in archive.read(start + 5, start + 9)], [5, 6, 7, 8])
+        eq_([r["ts"] - start for r in archive.read(start + 5, sender="U1")], [5, 7, 9])
+        eq_(list(archive.read(channel="C2")), [])
+
+        # a segment is an ordinary gzip file of JSON lines
+        with gzip.open(archive.path("log_2015_11", ".jsonl.gz")) as f:
+            eq_([json.loads(line.decode("utf8"))["ts"] - start for line in f], list(range(10)))
+
+def test_only_needed_blocks_are_read():
+    with Directory() as d:
+        archive = Archive(d.path, block_rows=4)
+        archive.append("log_2015_11", rows(12, when(2015, 11, 1)))
+        # spoil the first and last blocks; reading the middle one is fine
+        blocks = list(archive.blocks("log_2015_11"))
+        with open(archive.path("log_2015_11", ".jsonl.gz"), "r+b") as f:
+            for block in (blocks[0], blocks[2]):
+                f.seek(block["offset"] + 10)
+                f.write(b"\0" * 10)
+        start = when(2015, 11, 1)
+        eq_([r["ts"] - start for r in archive.read(start + 4, start + 8)], [4, 5, 6, 7])
+
+def test_appends_survive_a_crash():
+    with Directory() as d:
+        archive = Archive(d.path, block_rows=4)
+        archive.append("log_2015_11", rows(5, when(2015, 11, 1)))
+        # a block that was written but never made it into the index, and an
+        # index line cut short
+        with open(archive.path("log_2015_11", ".jsonl.gz"), "ab") as f:
+            f.write(b"\x1f\x8b half a block")
+        with open(archive.path("log_2015_11", ".idx"), "a") as f:
+            f.write('{"offset": 12')
+        eq_(archive.count("log_2015_11"), 5)
+
+        archive.append("log_2015_11", rows(3, when(2015, 11, 2)))
+        eq_(archive.count("log_2015_11"), 8)
+        eq_(len(list(archive.read())), 8)
+
+def archiving_log(db, archive):
+    return MessageLog(db.storage.query, archive=archive, archive_after=30, transaction=db.storage.transaction)
+
+def test_archive_partitions():
+    with Database() as db:
+        archive = Archive(os.path.join(db.dir, "archive"), block_rows=3)
+        for ts, msg, sender, team, channel in rows(5, when(2015, 10, 30)) + rows(2, when(2015, 11, 30)):
+            MessageLog(db.storage.query).insert(msg, sender, ts, team, channel)
+        log = archiving_log(db, archive)
+        eq_(log.partitions(), ["log_2015_10", "log_2015_11"])
+
+        eq_(log.archive_partitions(now=when(2015, 12, 15)), ["log_2015_10"])
+        eq_(log.partitions(), ["log_2015_11"])
+        eq_(archive.segments(), ["log_2015_10"])
+        eq_([r["msg"] for r in archive.read()], [r[1] for r in rows(5, when(2015, 10, 30))])
+        eq_(log.archive_partitions(now=when(2015, 12, 15)), [])
+
+        # in the background, when a new partition starts
+        now = time.time()
+        log.insert(u"new", "U1", str(now), "T1", "C1")
+        log.archiver.join(5)
+        eq_(log.partitions(), [log.partition_for(now)])
+        eq_(archive.segments(), ["log_2015_10", "log_2015_11"])
+
+def test_messages_written_while_archiving_are_archived():
+    with Database() as db:
+        archive = Archive(os.path.join(db.dir, "archive"), block_rows=2)
+        log = archiving_log(db, archive)
+        for ts, msg, sender, team, channel in rows(5, when(2015, 10, 1)):
+            MessageLog(db.storage.query).insert(msg, sender, ts, team, channel)
+
+        # a late message for the partition arrives after its last batch has
+        # been read
+        append = archive.append
+        def append_and_insert(name, records):
+            count = append(name, records)
+            if archive.count(name) == 5:
+                db.storage.query("INSERT INTO log_2015_10 (ts, msg, sender, team, channel) VALUES (?, ?, ?, ?, ?)",
+                                 when(2015, 10, 2), u"late", "U1", "T1", "C1")
+            return count
+        archive.append = append_and_insert
+
+        eq_(log.archive_partition("log_2015_10", batch_rows=3), 6)
+        eq_(log.partitions(), [])
+        eq_([r["msg"] for r in archive.read()][-2:], [u"message 4 Iñtërnâtiônàlizætiøn", u"late"])
+
+def test_archiving_resumes_after_a_crash():
+    with Database() as db:
+        archive = Archive(os.path.join(db.dir, "archive"), block_rows=2)
+        for ts, msg, sender, team, channel in rows(5, when(2015, 10, 1)):
+            MessageLog(db.storage.query).insert(msg, sender, ts, team, channel)
+
+        # stop after the first batch is in the archive, but before it's
+        # deleted from the partition
+        log = archiving_log(db, archive)
+        transactions = []
+        def crash():
+            transactions.append(1)
+            if len(transactions) == 2:
+                raise IOError("crashed")
+            return db.storage.transaction()
+        log.transaction = crash
+        try:
+            log.archive_partition("log_2015_10", batch_rows=3)
+        except IOError:
+            pass
+        eq_(archive.count("log_2015_10"), 3)
+        eq_(db.storage.query("SELECT count(*) FROM log_2015_10"), [(5,)])
+
+        eq_(archiving_log(db, archive).archive_partitions(), ["log_2015_10"])
+        eq_([r["msg"] for r in archive.read()], [r[1] for r in rows(5, when(2015, 10, 1))])
+        eq_(db.storage.query("SELECT name FROM sqlite_master WHERE name LIKE 'log_2015_10%'"), [])
+
+def test_archiving_waits_for_the_migration():
+    with Database() as db:
+        db.storage.query("CREATE TABLE log (msg STRING, sender STRING, time STRING, team STRING, channel STRING)")
+        messages = [(u"message {0}".format(i), "U1", str(when(2015, 6 + i % 4, 1 + i % 28)), "T1", "C1")
+                    for i in range(300)]
+        with db.storage.transaction() as writer:
+            writer.executemany("INSERT INTO log VALUES (?, ?, ?, ?, ?)", messages)
+        archive = Archive(os.path.join(db.dir, "archive"), block_rows=7)
+        log = archiving_log(db, archive)
+
+        migrator = migrate(db.storage, "log", log.migrations(), batch_rows=20, pause=0.001)
+        eq_(log.migrating, True)
+        # as a message would, after the migration's started
+        log.start_archiving()
+        log.insert(u"new", "U1", str(time.time()), "T1", "C1")
+        migrator.thread.join(10)
+        log.archiver.join(10)
+
+        eq_(log.migrating, False)
+        eq_(archive.segments(), ["log_2015_06", "log_2015_07", "log_2015_08", "log_2015_09"])
+        eq_(sorted(r["msg"] for r in archive.read()), sorted(m[0] for m in messages))
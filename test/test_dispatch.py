@@ -0,0 +1,55 @@
+# -*- coding: UTF-8 -*-
+import threading
+import time
+
+from nose.tools import eq_
+
+from limbo.dispatch import ChannelDispatcher
+
+class Recorder(object):
+    """handles events by sleeping for event["delay"] seconds, and remembers
+    the order in which it finished them"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.done = []
+        self.finished = threading.Event()
+
+    def __call__(self, event):
+        time.sleep(event.get("delay", 0))
+        with self.lock:
+            self.done.append(event["text"])
+        if event.get("last"):
+            self.finished.set()
+
+def test_channel_order():
+    recorder = Recorder()
+    dispatcher = ChannelDispatcher(recorder, workers=4)
+    dispatcher.submit({"channel": "C1", "text": "slow", "delay": 0.2})
+    dispatcher.submit({"channel": "C1", "text": "fast"})
+    dispatcher.submit({"channel": "C1", "text": "last", "last": True})
+    assert recorder.finished.wait(2)
+    eq_(recorder.done, ["slow", "fast", "last"])
+
+def test_channels_dont_block_each_other():
+    recorder = Recorder()
+    dispatcher = ChannelDispatcher(recorder, workers=4)
+    dispatcher.submit({"channel": "#eng", "text": "!wiki", "delay": 0.5, "last": True})
+    dispatcher.submit({"channel": "#random", "text": "!flip"})
+    time.sleep(0.2)
+    eq_(recorder.done, ["!flip"])
+    eq_(dispatcher.depth(), 0)
+    assert recorder.finished.wait(2)
+
+def test_handler_errors_dont_stall_channel():
+    recorder = Recorder()
+
+    def handler(event):
+        if event["text"] == "boom":
+            1 / 0
+        recorder(event)
+
+    dispatcher = ChannelDispatcher(handler, workers=1)
+    dispatcher.submit({"channel": "C1", "text": "boom"})
+    dispatcher.submit({"channel": "C1", "text": "after", "last": True})
+    assert recorder.finished.wait(2)
+    eq_(recorder.done, ["after"])
@@ -0,0 +1,266 @@
+# -*- coding: UTF-8 -*-
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+
+from nose.tools import eq_
+
+from limbo.executor import PluginExecutor
+from limbo.httpcache import CachedResponse, DiskCache, LRU, ResponseCache, parse_ttls
+from limbo.httpclient import DeadlineExceeded, HTTPClient, deadline, remaining_time, running_plugin
+from limbo.singleflight import SingleFlight
+
+from .helpers import Database, serve
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ports = []
+    # the path and If-None-Match header of each request
+    requests = []
+    # seconds to take to answer
+    delay = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.ports.append(self.client_address[1])
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path.startswith("/etag") and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = self.path.encode("utf8")
+        self.send_response(200)
+        if self.path.startswith("/etag"):
+            self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def local_server():
+    Handler.ports = []
+    Handler.requests = []
+    httpd = serve(Handler)
+    return httpd, "http://127.0.0.1:{0}/".format(httpd.server_address[1])
+
+def stop(httpd):
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_shared_connections():
+    httpd, url = local_server()
+    try:
+        http = HTTPClient()
+        eq_([http.get(url + str(i)).text for i in range(3)], ["/0", "/1", "/2"])
+        eq_(len(set(Handler.ports)), 1)
+    finally:
+        stop(httpd)
+
+def test_deadline_shortens_timeouts():
+    http = HTTPClient(timeout=(5, 10))
+    eq_(remaining_time(), None)
+    eq_(http.timeout_for((5, 10)), (5, 10))
+
+    with deadline(time.time() + 2):
+        connect, read = http.timeout_for((5, 10))
+        assert 1.9 < connect <= 2 and 1.9 < read <= 2
+        assert 1.9 < http.timeout_for(None) <= 2
+        eq_(http.timeout_for(1), 1)
+
+        with deadline(time.time() - 1):
+            try:
+                http.get("http://127.0.0.1:1/")
+            except DeadlineExceeded:
+                pass
+            else:
+                assert False, "the request should have been refused"
+        assert remaining_time() > 1.9
+    eq_(remaining_time(), None)
+
+def test_executor_sets_deadline():
+    executor = PluginExecutor(pool_size=2, timeout=3, timeouts={"fast": 1})
+
+    def fast():
+        return remaining_time()
+    fast.__module__ = "fast"
+
+    def slow():
+        return remaining_time()
+
+    (_, fast_call), (_, slow_call) = executor.submit_all([fast, slow])
+    assert 0.9 < fast_call() <= 1
+    assert 2.9 < slow_call() <= 3
+    executor.shutdown()
+
+# test the response cache
+
+def test_cache_hits_and_misses():
+    httpd, url = local_server()
+    try:
+        cache = ResponseCache(default_ttl=60)
+        http = HTTPClient(cache=cache)
+        with running_plugin("weather"):
+            eq_(http.get(url + "a", params={"q": "boston"}).text, "/a?q=boston")
+            start = time.time()
+            response = http.get(url + "a?q=boston")
+            assert time.time() - start < 0.01
+            eq_(response.text, "/a?q=boston")
+            eq_(response.status_code, 200)
+            # different headers are a different request
+            http.get(url + "a?q=boston", headers={"Accept": "text/plain"})
+        with running_plugin("wiki"):
+            http.get(url + "b")
+
+        eq_([path for path, _ in Handler.requests], ["/a?q=boston", "/a?q=boston", "/b"])
+        eq_(cache.stats()["weather"], {"hits": 1, "misses": 2, "revalidated": 0,
+                                       "hit_bytes": 11, "miss_bytes": 22})
+        eq_(cache.stats()["wiki"]["misses"], 1)
+    finally:
+        stop(httpd)
+
+def test_cache_revalidates():
+    httpd, url = local_server()
+    try:
+        cache = ResponseCache(default_ttl=0.05)
+        http = HTTPClient(cache=cache)
+        eq_(http.get(url + "etag").text, "/etag")
+        time.sleep(0.06)
+        eq_(http.get(url + "etag").text, "/etag")
+        eq_(http.get(url + "etag").text, "/etag")
+        eq_(Handler.requests, [("/etag", None), ("/etag", '"v1"')])
+        eq_(cache.stats()[None]["revalidated"], 1)
+
+        # no ttl means no caching
+        cache.default_ttl = 0
+        http.get(url + "c")
+        http.get(url + "c")
+        eq_(Handler.requests[-2:], [("/c", None), ("/c", None)])
+    finally:
+        stop(httpd)
+
+def test_cache_ttls():
+    cache = ResponseCache(default_ttl=5, host_ttls=parse_ttls("example.com:60, api.example.com:1"))
+    eq_(cache.ttl_for("http://example.com/x"), 60)
+    eq_(cache.ttl_for("http://www.example.com/x"), 60)
+    eq_(cache.ttl_for("https://api.example.com:8080/x"), 1)
+    eq_(cache.ttl_for("http://example.org/"), 5)
+    eq_(cache.ttl_for("https://en.wikipedia.org/w/api.php"), 24 * 60 * 60)
+    eq_(cache.ttl_for("https://www.google.com/finance?q=TSLA"), 30)
+
+def entry(content):
+    return CachedResponse("http://example.com/", 200, {}, content, "utf8", time.time() + 60)
+
+def test_lru_limits():
+    lru = LRU(max_entries=2, max_bytes=10)
+    lru.put("a", entry(b"1234"))
+    lru.put("b", entry(b"1234"))
+    lru.get("a")
+    lru.put("c", entry(b"1234"))
+    eq_(sorted(lru.entries), ["a", "c"])
+    lru.put("d", entry(b"12345678"))
+    eq_(sorted(lru.entries), ["d"])
+    eq_(lru.bytes, 8)
+    # too big to cache at all
+    lru.put("e", entry(b"12345678901"))
+    eq_(sorted(lru.entries), ["d"])
+
+def test_disk_cache():
+    with Database() as db:
+        ResponseCache(disk=DiskCache(db.storage)).store("k", entry(b"\x00\xffbinary"))
+
+        cache = ResponseCache(disk=DiskCache(db.storage))
+        found = cache.lookup("k")
+        eq_(found.content, b"\x00\xffbinary")
+        eq_(found.to_response().status_code, 200)
+        assert cache.memory.get("k") is found
+        eq_(cache.lookup("missing"), None)
+        # through the storage's connections, without any of its own
+        eq_(db.storage.opened, 1)
+
+# test coalescing identical requests
+
+def test_single_flight():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return len(calls)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("k", fetch))) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    while flights.stats()["shared"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    eq_(results, [1] * 5)
+    eq_(flights.stats(), {"calls": 1, "shared": 4, "in_flight": 0})
+    # once it's landed, the next call goes out again
+    eq_(flights.do("k", fetch), 2)
+
+def test_single_flight_errors_and_timeouts():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("upstream is down")
+
+    errors = []
+    def call(timeout=None):
+        try:
+            flights.do("k", fail, timeout)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    while not flights.flights:
+        time.sleep(0.001)
+    call(timeout=0.01)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flights.stats()["shared"] < 2:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    eq_(sorted(errors), ["FlightTimeout", "ValueError", "ValueError"])
+
+def test_http_coalesces_requests():
+    httpd, url = local_server()
+    Handler.delay = 0.1
+    try:
+        http = HTTPClient()
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(http.get(url + "slow", params={"q": "nyc"})))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        eq_([r.text for r in responses], ["/slow?q=nyc"] * 5)
+        eq_(len(set(id(r) for r in responses)), 5)
+        eq_(Handler.requests, [("/slow?q=nyc", None)])
+    finally:
+        Handler.delay = 0
+        stop(httpd)
@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+import calendar
+
+from nose.tools import eq_
+
+from limbo.messagelog import MessageLog, partition_bounds
+
+from .helpers import Database
+
+DAY = 24 * 60 * 60
+
+def when(*date):
+    return calendar.timegm(date + (0, 0, 0))
+
+class LogDatabase(Database):
+    def log(self, **kwargs):
+        return MessageLog(self.storage.query, **kwargs)
+
+def test_partition_bounds():
+    eq_(partition_bounds("log_2015_11"), (when(2015, 11, 1), when(2015, 12, 1)))
+    eq_(partition_bounds("log_2015_12"), (when(2015, 12, 1), when(2016, 1, 1)))
+    eq_(partition_bounds("log_2015_11_04"), (when(2015, 11, 4), when(2015, 11, 5)))
+    eq_(partition_bounds("log_fts"), None)
+    eq_(partition_bounds("log"), None)
+
+def test_inserts_go_to_their_partition():
+    db = LogDatabase()
+    try:
+        log = db.log()
+        log.insert(u"one", "U1", str(when(2015, 10, 31) + 0.5), "T1", "C1")
+        log.insert(u"two", "U1", str(when(2015, 11, 1)), "T1", "C1")
+        log.insert(u"three", "U1", str(when(2015, 11, 30)), "T1", "C1")
+        eq_(log.partitions(), ["log_2015_10", "log_2015_11"])
+        eq_(db.storage.query("SELECT msg FROM log_2015_11"), [(u"two",), (u"three",)])
+
+        daily = db.log(partition="day")
+        daily.insert(u"four", "U1", str(when(2015, 11, 30)), "T1", "C1")
+        eq_(daily.partitions(), ["log_2015_10", "log_2015_11", "log_2015_11_30"])
+    finally:
+        db.remove()
+
+def test_time_ranges_only_touch_their_partitions():
+    db = LogDatabase()
+    try:
+        log = db.log(partition="day")
+        for day in (1, 2, 3, 4):
+            log.insert(u"day {0}".format(day), "U1", str(when(2015, 11, day) + 60), "T1", "C1")
+        eq_(log.partitions(when(2015, 11, 2), when(2015, 11, 4)), ["log_2015_11_02", "log_2015_11_03"])
+        eq_(log.partitions(start=when(2015, 11, 3) + 1), ["log_2015_11_03", "log_2015_11_04"])
+
+        sql, params = log.union("SELECT msg FROM {table} WHERE sender = ?", ["U1"], end=when(2015, 11, 3))
+        eq_(sql.count("UNION ALL"), 1)
+        eq_(params, ("U1", "U1"))
+        eq_(db.storage.query(sql, *params), [(u"day 1",), (u"day 2",)])
+        eq_(log.union("SELECT msg FROM {table}", start=when(2016, 1, 1)), (None, ()))
+    finally:
+        db.remove()
+
+def test_retention_drops_partitions():
+    db = LogDatabase()
+    try:
+        for day in (1, 2, 3, 4):
+            db.log(partition="day").insert(u"day {0}".format(day), "U1", str(when(2015, 11, day)), "T1", "C1")
+        log = db.log(partition="day", retention=2)
+        eq_(len(log.partitions()), 4)
+        # the 2nd ended at the start of the 3rd, which is still in the window
+        eq_(log.prune(now=when(2015, 11, 5)), ["log_2015_11_01", "log_2015_11_02"])
+        eq_(log.partitions(), ["log_2015_11_03", "log_2015_11_04"])
+        eq_(db.storage.query("SELECT count(*) FROM sqlite_master WHERE name LIKE 'log_2015_11_01%'"), [(0,)])
+        eq_(log.prune(now=when(2015, 11, 5)), [])
+
+        # messages that would only be dropped again aren't logged
+        log.insert(u"too old", "U1", str(when(2015, 11, 1)), "T1", "C1")
+        eq_(log.partitions(), ["log_2015_11_03", "log_2015_11_04"])
+    finally:
+        db.remove()
+
+def test_range_queries_use_the_indexes():
+    db = LogDatabase()
+    try:
+        log = db.log()
+        for i in range(10):
+            log.insert(u"message {0}".format(i), "U{0}".format(i % 2), str(when(2015, 10, 30) + i * DAY / 2), "T1",
+                       "C{0}".format(i % 3))
+        eq_(log.messages(channel="C0", start=when(2015, 10, 31), end=when(2015, 11, 3)),
+            [(when(2015, 10, 31) + DAY / 2, u"message 3", u"U1", u"C0"),
+             (when(2015, 11, 2), u"message 6", u"U0", u"C0")])
+        eq_([row[1] for row in log.messages(sender="U1", start=when(2015, 11, 1), limit=2)],
+            [u"message 5", u"message 7"])
+        eq_(log.messages(sender="U1", start=when(2016, 1, 1)), [])
+
+        for column in ("channel", "sender"):
+            plan = db.storage.query("EXPLAIN QUERY PLAN SELECT ts FROM log_2015_11 WHERE {0} = ? AND ts >= ?".format(
+                column), "x", 0)
+            assert "USING COVERING INDEX log_2015_11_{0}_ts".format(column) in plan[0][-1], plan
+    finally:
+        db.remove()
+
+def untyped(storage, table):
+    storage.query("CREATE TABLE {0} (msg STRING, sender STRING, time STRING, team STRING, channel STRING)".format(
+        table))
+    storage.query("CREATE VIRTUAL TABLE {0}_fts USING fts5(msg, content='{0}', content_rowid='rowid')".format(table))
+    storage.query("""CREATE TRIGGER {0}_fts_delete AFTER DELETE ON {0} BEGIN
+        INSERT INTO {0}_fts({0}_fts, rowid, msg) VALUES ('delete', old.rowid, old.msg);
+    END""".format(table))
+
+def test_migrate_untyped_tables():
+    db = LogDatabase()
+    try:
+        untyped(db.storage, "log")
+        untyped(db.storage, "log_2015_11")
+        rows = [(u"Iñtërnâtiônàlizætiøn", str(when(2015, 10, 31) + 0.25)),
+                (u"two", str(when(2015, 11, 1) + 0.5)),
+                (u"no time", None)]
+        for msg, ts in rows:
+            db.storage.query("INSERT INTO log VALUES (?, 'U1', ?, 'T1', 'C1')", msg, ts)
+        db.storage.query("INSERT INTO log_2015_11 VALUES ('three', 'U2', ?, 'T1', 'C1')", str(when(2015, 11, 2)))
+
+        log = db.log()
+        batches = log.type_partitions(db.storage, 2)
+        next(batches)
+        # the old tables are set aside straight away, so that messages can
+        # be logged to typed partitions while they're moved
+        eq_(log.partitions(), [])
+        log.insert(u"four", "U2", str(when(2015, 11, 3)), "T1", "C1")
+        eq_(len(list(batches)), 3)
+
+        eq_(log.partitions(), ["log_1970_01", "log_2015_10", "log_2015_11"])
+        eq_(log.messages(start=when(2015, 10, 1)), [
+            (when(2015, 10, 31) + 0.25, u"Iñtërnâtiônàlizætiøn", u"U1", u"C1"),
+            (when(2015, 11, 1) + 0.5, u"two", u"U1", u"C1"),
+            (when(2015, 11, 2), u"three", u"U2", u"C1"),
+            (when(2015, 11, 3), u"four", u"U2", u"C1"),
+        ])
+        eq_(log.messages(end=1), [(0, u"no time", u"U1", u"C1")])
+        eq_(db.storage.query("SELECT name FROM sqlite_master "
+                             "WHERE name LIKE '%untyped%' OR name IN ('log', 'log_fts')"), [])
+        # the moved messages are in the full-text index
+        eq_(db.storage.query("SELECT count(*) FROM log_2015_11_fts WHERE log_2015_11_fts MATCH 'two OR three'"), [(2,)])
+    finally:
+        db.remove()
+
+def test_migrate_resumes():
+    db = LogDatabase()
+    try:
+        untyped(db.storage, "log")
+        for i in range(5):
+            db.storage.query("INSERT INTO log VALUES (?, 'U1', ?, 'T1', 'C1')", str(i), str(when(2015, 11, 1) + i))
+
+        log = db.log()
+        batches = log.type_partitions(db.storage, 2)
+        next(batches)
+        next(batches)
+        # stop after the first batch, and start again
+        eq_(len(list(db.log().type_partitions(db.storage, 2))), 3)
+        eq_([row[1] for row in log.messages()], [u"0", u"1", u"2", u"3", u"4"])
+    finally:
+        db.remove()
@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+import threading
+
+from nose.tools import eq_
+
+from limbo.migrations import Migrator, migrate, schema_version
+from limbo.storage import Storage, connect
+
+def storage():
+    return Storage(connect(":memory:"), ":memory:")
+
+def test_runs_migrations_in_order():
+    db = storage()
+    ran = []
+
+    def first(storage, batch_rows):
+        ran.append(("first", "now"))
+        yield
+        for i in range(3):
+            ran.append(("first", i, batch_rows))
+            yield
+
+    def second(storage, batch_rows):
+        ran.append(("second", "now"))
+        yield
+
+    migrator = Migrator(db, "test", [first, second], batch_rows=10, pause=0)
+    eq_(migrator.start(), True)
+    migrator.thread.join(5)
+    eq_(ran, [("first", "now"), ("first", 0, 10), ("first", 1, 10), ("first", 2, 10), ("second", "now")])
+    eq_(schema_version(db, "test"), 2)
+    eq_(schema_version(db, "other"), 0)
+
+    # they're only run once
+    eq_(migrator.start(), False)
+    eq_(len(ran), 5)
+
+def test_only_new_migrations_run():
+    db = storage()
+    ran = []
+
+    def migration(name):
+        def run(storage, batch_rows):
+            ran.append(name)
+            return iter(())
+        return run
+
+    Migrator(db, "test", [migration("one")]).run()
+    Migrator(db, "test", [migration("one"), migration("two")]).run()
+    eq_(ran, ["one", "two"])
+    eq_(schema_version(db, "test"), 2)
+
+def test_first_step_runs_before_start_returns():
+    db = storage()
+    release = threading.Event()
+
+    def slow(storage, batch_rows):
+        storage.query("CREATE TABLE t (x INTEGER)")
+        yield
+        release.wait(5)
+        storage.query("INSERT INTO t VALUES (1)")
+        yield
+
+    migrator = migrate(db, "test", [slow], pause=0)
+    eq_(db.query("SELECT x FROM t"), [])
+    eq_(schema_version(db, "test"), 0)
+    release.set()
+    migrator.thread.join(5)
+    eq_(db.query("SELECT x FROM t"), [(1,)])
+    eq_(schema_version(db, "test"), 1)
+
+def test_failed_migration_is_retried():
+    db = storage()
+    attempts = []
+
+    def flaky(storage, batch_rows):
+        yield
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("try again")
+
+    Migrator(db, "test", [flaky], pause=0).run()
+    eq_(schema_version(db, "test"), 0)
+    Migrator(db, "test", [flaky], pause=0).run()
+    eq_(schema_version(db, "test"), 1)
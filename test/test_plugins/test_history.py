@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+import os
+import sys
+
+from nose.tools import eq_
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIR, '../../limbo/plugins'))
+sys.path.insert(0, os.path.join(DIR, '..'))
+
+from history import fts_query, on_message
+import log
+from helpers import Database
+
+from limbo.fakeserver import FakeServer, FakeSlack
+from limbo.server import LimboServer
+from limbo.slackclient._channel import Channel
+from limbo.slackclient._user import User
+from limbo.slackclient._util import IndexedList
+
+MESSAGES = [
+    (u"the deploy failed again", "U1", "1446672000.000100", "C1"),
+    (u"deploying the fix now", "U2", "1446672060.000100", "C1"),
+    (u"lunch?", "U1", "1446672120.000100", "C2"),
+    (u"the deploy of Iñtërnâtiônàlizætiøn worked", "U1", "1446672180.000100", "C2"),
+    (u"first deploy in october", "U2", "1443657600.000100", "C1"),
+]
+
+class Server(object):
+    def __init__(self):
+        self.db = Database()
+        self.server = LimboServer(FakeSlack(), {}, {}, self.db.storage)
+        slack = self.server.slack.server
+        slack.users = IndexedList([User(slack, "alice", "U1", "", 0), User(slack, "bob", "U2", "", 0)])
+        slack.channels = IndexedList([Channel(slack, "general", "C1"), Channel(slack, "random", "C2")])
+
+    def log(self, messages):
+        for text, user, ts, channel in messages:
+            log.on_message({"text": text, "user": user, "ts": ts, "team": "T1", "channel": channel}, self.server)
+
+    def search(self, text):
+        return on_message({"text": text}, self.server)
+
+    def __enter__(self):
+        log.DO_LOG = True
+        log.on_init(self.server)
+        return self
+
+    def __exit__(self, *exc):
+        log.DO_LOG = os.environ.get("LIMBO_LOG_EVERYTHING", False)
+        self.server.close()
+        self.db.remove()
+
+def test_fts_query():
+    eq_(fts_query(u"deploy  fix"), u'"deploy" "fix"')
+    eq_(fts_query(u'dep* "quoted" OR'), u'"dep"* """quoted""" "OR"')
+
+def test_search():
+    with Server() as s:
+        s.log(MESSAGES)
+        ret = s.search(u"!history deploy")
+        lines = ret.split("\n")
+        eq_(len(lines), 4)
+        assert all("*deploy" in line for line in lines), ret
+        assert "lunch" not in ret
+        assert u"<@U2> in <#C1> at 2015-11-04 21:21: *deploying* the fix now" in lines
+
+        eq_(s.search(u"!history intern*"),
+            u"<@U1> in <#C2> at 2015-11-04 21:23: the deploy of *Iñtërnâtiônàlizætiøn* worked")
+        eq_(s.search(u"!history nothing"), u"No messages match nothing")
+
+def test_filters():
+    with Server() as s:
+        s.log(MESSAGES)
+        ret = s.search(u"!history deploy in #random")
+        assert ret.startswith(u"<@U1> in <#C2>"), ret
+        eq_(len(ret.split("\n")), 1)
+
+        ret = s.search(u"!history deploy from <@U2> since 2015-11-01")
+        eq_(ret, u"<@U2> in <#C1> at 2015-11-04 21:21: *deploying* the fix now")
+
+        ret = s.search(u"!history deploy in <#C1|general> from @alice")
+        eq_(ret, u"<@U1> in <#C1> at 2015-11-04 21:20: the *deploy* failed again")
+
+        eq_(s.search(u"!history deploy in #nowhere"), u"I don't know the channel #nowhere")
+        assert s.search(u"!history from @bob").startswith("What should I search for?")
+
+def test_since():
+    with Server() as s:
+        s.log(MESSAGES)
+        eq_(len(s.search(u"!history deploy since 2015-11-01").split("\n")), 3)
+        eq_(s.search(u"!history october since 2015-11-01"), u"No messages match october")
+        eq_(s.search(u"!history october since 2015-10-01"),
+            u"<@U2> in <#C1> at 2015-10-01 00:00: first deploy in *october*")
+        eq_(s.search(u"!history deploy since 2015-13-01"), u"I don't understand the date 2015-13-01")
+
+def test_indexes_old_log():
+    s = Server()
+    s.server.query("CREATE TABLE log (msg STRING, sender STRING, time STRING, team STRING, channel STRING)")
+    for text, user, ts, channel in MESSAGES:
+        s.server.query("INSERT INTO log VALUES (?, ?, ?, ?, ?)", text, user, ts, "T1", channel)
+    with s:
+        log.migrator.thread.join(5)
+        eq_(len(s.search(u"!history deploy").split("\n")), 4)
+        eq_(s.server.query("SELECT name FROM sqlite_master WHERE name = 'log'"), [])
+
+def test_no_log():
+    with Server() as s:
+        eq_(s.search(u"!history deploy"), "I'm not keeping a searchable history of messages")
+
+def test_without_a_database():
+    eq_(on_message({"text": u"!history deploy"}, FakeServer()), u"I'm not keeping a searchable history of messages")
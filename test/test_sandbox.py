@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+import time
+
+from nose.tools import eq_
+
+import limbo
+from limbo.sandbox import Sandbox, SandboxError, sandbox_hooks
+
+def echo(msg, server):
+    return msg["text"]
+
+def broken(msg, server):
+    1 / 0
+
+def spin(msg, server):
+    while True:
+        pass
+
+def hog(msg, server):
+    return len(" " * (512 * 1024 * 1024))
+
+def nap(msg, server):
+    time.sleep(5)
+
+def raises(sandbox, hook, msg):
+    try:
+        sandbox.call(hook, msg, None)
+    except SandboxError as e:
+        return str(e)
+    1 / 0
+
+def test_call():
+    sandbox = Sandbox(workers=1)
+    eq_(sandbox.call(echo, {"text": u"Iñtërnâtiônàlizætiøn"}, None), u"Iñtërnâtiônàlizætiøn")
+
+def test_plugin_error():
+    sandbox = Sandbox(workers=1)
+    assert "ZeroDivisionError" in raises(sandbox, broken, {})
+    eq_(sandbox.call(echo, {"text": u"still here"}, None), u"still here")
+
+def test_cpu_limit_respawns():
+    sandbox = Sandbox(workers=1, cpu_limit=1)
+    assert "CPU limit" in raises(sandbox, spin, {})
+    eq_(sandbox.call(echo, {"text": u"respawned"}, None), u"respawned")
+
+def test_memory_limit():
+    sandbox = Sandbox(workers=1, memory_limit=64)
+    assert "memory limit" in raises(sandbox, hog, {})
+    eq_(sandbox.call(echo, {"text": u"respawned"}, None), u"respawned")
+
+def test_timeout_respawns():
+    sandbox = Sandbox(workers=1, timeout=0.2)
+    assert "took more than" in raises(sandbox, nap, {})
+    eq_(sandbox.call(echo, {"text": u"respawned"}, None), u"respawned")
+
+def test_sandbox_hooks():
+    hooks = limbo.init_plugins("test/plugins")
+    sandbox_hooks(hooks, set(["echo"]), Sandbox(workers=1))
+    eq_(limbo.run_hook(hooks, "message", {"text": u"!echo bananas"}, None), [u"!echo bananas"])
@@ -0,0 +1,553 @@
+# -*- coding: UTF-8 -*-
+try:
+    from http.server import BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from nose.tools import eq_
+
+from limbo.slackclient._client import SlackClient
+from limbo.slackclient._heartbeat import Heartbeat
+from limbo.slackclient._jsonstream import JSONStream
+from limbo.slackclient._outbox import Outbox
+from limbo.slackclient._server import Server, SlackLoginError
+from limbo.slackclient._slackrequest import SlackRequest
+from limbo.slackclient._user import User
+from limbo.slackclient._util import IndexedList
+
+from .helpers import serve
+
+class FakeWebsocket(object):
+    """A stand-in for a websocket-client connection that reads
+    newline-delimited frames off of a real socket"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setblocking(0)
+        self.sent = []
+        self.buf = b""
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self):
+        while b"\n" not in self.buf:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise socket.error("connection closed")
+            self.buf += chunk
+        frame, self.buf = self.buf.split(b"\n", 1)
+        return frame.decode("utf8")
+
+def fake_server():
+    ours, theirs = socket.socketpair()
+    server = Server("xoxb-token", connect=False)
+    server.websocket = FakeWebsocket(ours)
+    server.connected = True
+    return server, theirs
+
+def test_wait_for_data_times_out():
+    server, _ = fake_server()
+    start = time.time()
+    eq_(server.wait_for_data(0.05), False)
+    assert time.time() - start >= 0.04
+
+def test_wait_for_data_wakes_on_frame():
+    server, peer = fake_server()
+    peer.sendall(b'{"type": "hello"}\n')
+    eq_(server.wait_for_data(5), True)
+    eq_(server.websocket_safe_read(), '{"type": "hello"}')
+
+def test_read_frames():
+    server, peer = fake_server()
+    peer.sendall(b'{"type": "hello"}\n\n{"type": "message", "text": "\\u00f1"}\nnot json\n')
+    server.wait_for_data(5)
+    eq_(server.read_frames(), [{"type": "hello"}, {"type": "message", "text": u"\xf1"}])
+    eq_(server.connected, True)
+
+def test_read_frames_no_data():
+    server, peer = fake_server()
+    eq_(server.read_frames(), [])
+    eq_(server.connected, True)
+
+def test_read_frames_connection_closed():
+    server, peer = fake_server()
+    peer.sendall(b'{"type": "hello"}\n')
+    peer.close()
+    eq_(server.read_frames(), [{"type": "hello"}])
+    eq_(server.connected, False)
+
+# test the outbox
+
+class Sent(list):
+    def __call__(self, channel, text):
+        self.append((channel, text))
+
+def test_outbox_sends_right_away():
+    sent = Sent()
+    outbox = Outbox(sent)
+    outbox.put("C1", u"hello")
+    outbox.put("C2", u"world")
+    eq_(sent, [("C1", u"hello"), ("C2", u"world")])
+    eq_(outbox.depth(), 0)
+    eq_(outbox.next_due(), None)
+
+def test_outbox_paces_and_coalesces():
+    sent = Sent()
+    outbox = Outbox(sent, interval=0.1)
+    outbox.put("C1", u"one")
+    outbox.put("C1", u"two")
+    outbox.put("C1", u"three")
+    eq_(sent, [("C1", u"one")])
+    eq_(outbox.depth(), 2)
+    eq_(outbox.depths(), {"C1": 2})
+
+    outbox.flush()
+    eq_(len(sent), 1)
+
+    time.sleep(outbox.next_due())
+    outbox.flush()
+    eq_(sent, [("C1", u"one"), ("C1", u"two\nthree")])
+    eq_(outbox.depth(), 0)
+
+def test_outbox_splits_long_messages():
+    sent = Sent()
+    outbox = Outbox(sent, interval=0, max_length=10)
+    outbox.pending["C1"] = [u"12345", u"6789", u"abcde"]
+    outbox.flush()
+    outbox.flush()
+    eq_(sent, [("C1", u"12345\n6789"), ("C1", u"abcde")])
+
+def test_channel_send_message_goes_through_outbox():
+    server, _ = fake_server()
+    server.attach_channel("general", "C1", [])
+    server.channels.find("general").send_message(u"Iñtërnâtiônàlizætiøn")
+    server.channels.find("general").send_message(u"again")
+    eq_(server.websocket.sent,
+        ['{"type": "message", "channel": "C1", '
+         '"text": "I\\u00f1t\\u00ebrn\\u00e2ti\\u00f4n\\u00e0liz\\u00e6ti\\u00f8n"}'])
+    eq_(server.outbox.depth(), 1)
+
+def test_queued_message_wakes_wait_for_data():
+    server, _ = fake_server()
+    server.outbox.interval = 0.2
+    server.send_message("C1", u"one")
+    # queued from a plugin's thread while the event loop is waiting
+    timer = threading.Timer(0.1, server.send_message, ("C1", u"two"))
+    timer.start()
+    start = time.time()
+    eq_(server.wait_for_data(5), False)
+    assert time.time() - start < 1
+    timer.join()
+
+    time.sleep(server.outbox.next_due())
+    server.outbox.flush()
+    eq_(len(server.websocket.sent), 2)
+    # and it sleeps again once the wakeup's been seen
+    start = time.time()
+    eq_(server.wait_for_data(0.05), False)
+    assert time.time() - start >= 0.04
+
+# test the heartbeat
+
+def test_heartbeat_pings_when_due():
+    sent = []
+    heartbeat = Heartbeat(sent.append, interval=0.1)
+    heartbeat.tick()
+    heartbeat.tick()
+    eq_(sent, [{"type": "ping", "id": 1}])
+    assert 0 < heartbeat.next_due() <= 0.1
+
+    time.sleep(heartbeat.next_due())
+    heartbeat.tick()
+    eq_(sent[-1], {"type": "ping", "id": 2})
+
+def test_heartbeat_rtt():
+    heartbeat = Heartbeat(lambda msg: None, interval=1)
+    heartbeat.ping()
+    time.sleep(0.05)
+    heartbeat.pong(1)
+    assert 0.05 <= heartbeat.rtt < 0.5
+    eq_(heartbeat.average_rtt, heartbeat.rtt)
+    eq_(heartbeat.missed(), 0)
+
+    # unknown and repeated pongs are ignored
+    heartbeat.pong(1)
+    heartbeat.pong(42)
+    assert heartbeat.rtt >= 0.05
+
+def test_heartbeat_dead_after_missed_pongs():
+    heartbeat = Heartbeat(lambda msg: None, interval=0.05, max_missed=2)
+    heartbeat.ping()
+    heartbeat.ping()
+    eq_(heartbeat.dead(), False)
+    time.sleep(0.06)
+    eq_(heartbeat.missed(), 2)
+    eq_(heartbeat.dead(), True)
+
+    # a pong for the newest ping means the older ones aren't coming
+    heartbeat.pong(2)
+    eq_(heartbeat.dead(), False)
+
+def test_client_handles_pongs():
+    client = SlackClient("xoxb-token")
+    server, peer = fake_server()
+    client.server = server
+    server.ping()
+    peer.sendall(b'{"type": "pong", "reply_to": 1}\n')
+    server.wait_for_data(5)
+    eq_(client.rtm_read(), [{"type": "pong", "reply_to": 1}])
+    assert server.heartbeat.rtt is not None
+    eq_(server.websocket.sent, ['{"type": "ping", "id": 1}'])
+
+# test reconnecting
+
+def test_send_failure_buffers_and_reconnects():
+    server, peer = fake_server()
+    attempts = []
+
+    def rtm_connect(reconnect=False):
+        attempts.append(reconnect)
+        if len(attempts) < 3:
+            raise socket.error("slack is down")
+        ours, theirs = socket.socketpair()
+        server.websocket = FakeWebsocket(ours)
+        server.connected = True
+        server.reconnected.set()
+
+    server.rtm_connect = rtm_connect
+    server.reconnector.base_delay = 0.01
+
+    def broken_send(data):
+        raise socket.error("broken pipe")
+    server.websocket.send = broken_send
+
+    server.send_message_now("C1", u"hello")
+    server.ping()
+    server.send_message_now("C1", u"world")
+    eq_(server.connected, False)
+    eq_(server.wait_for_data(0), False)
+
+    assert server.reconnected.wait(2)
+    server.reconnector.thread.join(1)
+    eq_(attempts, [True, True, True])
+    eq_(server.websocket.sent, ['{"type": "message", "channel": "C1", "text": "hello"}',
+                                '{"type": "message", "channel": "C1", "text": "world"}'])
+    eq_(len(server.unsent), 0)
+
+def test_reconnect_backoff():
+    server, _ = fake_server()
+    reconnector = server.reconnector
+    for attempt in range(10):
+        delay = reconnector.delay(attempt)
+        ceiling = min(reconnector.max_delay, reconnector.base_delay * 2 ** attempt)
+        assert ceiling / 2 <= delay <= ceiling
+
+# test the roster indexes
+
+def test_indexed_list_find():
+    server, _ = fake_server()
+    server.attach_user("alice", "U1", "Alice", "")
+    server.attach_user("bob", "U2", "Bob", "")
+    server.attach_channel("general", "C1", [])
+    server.attach_channel("random", "C2", [])
+
+    eq_(server.users.find("U1").name, "alice")
+    eq_(server.users.find("bob").id, "U2")
+    eq_(server.users.find("carol"), None)
+    eq_(server.channels.find("C2").name, "random")
+    eq_(server.channels.find("general").id, "C1")
+    eq_(server.channels.find("#general").id, "C1")
+    eq_(server.channels.find("#C1"), None)
+
+def test_indexed_list_duplicates():
+    users = IndexedList([User(None, "alice", "U1", "", ""), User(None, "alice", "U2", "", "")])
+    eq_([u.id for u in users.find("alice")], ["U1", "U2"])
+
+def test_indexed_list_mutation():
+    users = IndexedList([User(None, "alice", "U1", "", "")])
+    users += [User(None, "bob", "U2", "", "")]
+    eq_(users.find("bob").id, "U2")
+
+    users.pop(0)
+    eq_(users.find("alice"), None)
+
+    users[0].name = "robert"
+    users.reindex()
+    eq_(users.find("bob"), None)
+    eq_(users.find("robert").id, "U2")
+
+    # items without index_keys are still compared one by one
+    users.append("carol")
+    eq_(users.find("carol"), "carol")
+
+# test parsing rtm.start
+
+def test_json_stream_members():
+    doc = (u'{"ok": true, "n": 12345, "self": {"name": "limbo"}, '
+           u'"users": [{"name": "I\xf1t\xebrn\xe2ti\xf4n"}, {"name": "b", "x": [1, {"y": "}]"}]}], '
+           u'"ims": [], "other": [1, 2]}')
+    for chunk_size in (1, 2, 3, 7, 4096):
+        stream = JSONStream(io.BytesIO(doc.encode("utf8")), chunk_size=chunk_size)
+        eq_(list(stream.members(("users", "ims"))), [
+            ("ok", True),
+            ("n", 12345),
+            ("self", {"name": "limbo"}),
+            ("users", {"name": u"I\xf1t\xebrn\xe2ti\xf4n"}),
+            ("users", {"name": "b", "x": [1, {"y": "}]"}]}),
+            ("other", [1, 2]),
+        ])
+
+def test_json_stream_errors():
+    for doc in (b"", b"[]", b'{"ok": true', b'{"users": [{"name": "a"}'):
+        try:
+            list(JSONStream(io.BytesIO(doc), chunk_size=4).members(("users",)))
+        except ValueError:
+            pass
+        else:
+            assert False, "{0!r} should not parse".format(doc)
+
+class FakeReply(io.BytesIO):
+    code = 200
+
+class FakeRequester(object):
+    def __init__(self, reply):
+        self.reply = reply
+        self.methods = []
+
+    def do(self, token, request, post_data=None):
+        self.methods.append(request)
+        return FakeReply(json.dumps(self.reply).encode("utf8"))
+
+def test_rtm_connect_builds_roster():
+    server, _ = fake_server()
+    server.api_requester = FakeRequester({
+        "ok": True,
+        "url": "wss://example.com/",
+        "self": {"id": "U1", "name": "limbo", "prefs": {"lots": "of stuff"}},
+        "team": {"domain": "example"},
+        "users": [{"id": "U1", "name": "limbo", "real_name": "Limbo", "tz": "UTC"},
+                  {"id": "U2", "name": "alice", "profile": {"image": "..."}}],
+        "channels": [{"id": "C1", "name": "general", "members": ["U1", "U2"]}],
+        "groups": [{"id": "G1", "name": "secret"}],
+        "ims": [{"id": "D1", "user": "U2"}],
+        "bots": [{"id": "B1"}],
+    })
+    urls = []
+    server.connect_slack_websocket = urls.append
+    server.rtm_connect()
+
+    eq_(urls, ["wss://example.com/"])
+    eq_(server.api_requester.methods, ["rtm.start"])
+    eq_(server.username, "limbo")
+    eq_(server.domain, "example")
+    eq_(server.users.find("U2").real_name, "alice")
+    eq_(server.users.find("U2").tz, "unknown")
+    eq_(server.channels.find("#general").members, ["U1", "U2"])
+    eq_(server.channels.find("secret").id, "G1")
+    eq_(server.channels.find("D1").name, "D1")
+    assert not hasattr(server, "login_data")
+
+    server.api_requester = FakeRequester({"ok": True, "url": "wss://example.com/again"})
+    server.rtm_connect(reconnect=True)
+    eq_(urls[-1], "wss://example.com/again")
+    eq_(len(server.users), 2)
+
+def test_rtm_connect_login_error():
+    server, _ = fake_server()
+    server.api_requester = FakeRequester({"ok": False, "error": "invalid_auth"})
+    try:
+        server.rtm_connect()
+    except SlackLoginError:
+        pass
+    else:
+        assert False, "rtm_connect should have failed"
+
+def test_compact_roster():
+    server, _ = fake_server()
+    server.attach_user("alice", u"U1", "Alice", "UTC")
+    server.attach_channel("general", u"C1", [u"U1", u"U2"])
+    server.attach_channel("random", u"C2", [u"U2"])
+    alice = server.users.find("alice")
+    general = server.channels.find("general")
+
+    assert not hasattr(alice, "__dict__")
+    eq_((alice.name, alice.id, alice.real_name, alice.tz), ("alice", "U1", "Alice", "UTC"))
+    eq_(general.members, ["U1", "U2"])
+    eq_(list(general.member_handles), [0, 1])
+    eq_(list(server.channels.find("random").member_handles), [1])
+    assert general.members[1] is server.channels.find("random").members[0]
+
+    general.members = ["U3"]
+    eq_(general.members, ["U3"])
+    assert "members : ['U3']" in str(general)
+
+# test the roster snapshot
+
+ROSTER_REPLY = {
+    "ok": True,
+    "url": "wss://example.com/",
+    "self": {"id": "U1", "name": "limbo"},
+    "team": {"domain": "example"},
+    "users": [{"id": "U1", "name": "limbo"}, {"id": "U2", "name": "alice", "real_name": "Alice", "tz": "UTC"}],
+    "channels": [{"id": "C1", "name": "general", "members": ["U1", "U2"]}],
+    "groups": [],
+    "ims": [],
+}
+
+def snapshot_server(path, reply):
+    server, _ = fake_server()
+    server.roster_path = path
+    server.api_requester = FakeRequester(reply)
+    server.connect_slack_websocket = lambda url: None
+    return server
+
+def test_roster_snapshot():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "limbo.sqlite3.roster")
+        first = snapshot_server(path, ROSTER_REPLY)
+        eq_(first.load_roster(), False)
+        first.rtm_connect()
+        assert os.path.exists(path)
+
+        # the next start has a roster before it's connected, and refreshes it
+        # after connecting
+        reply = dict(ROSTER_REPLY, users=ROSTER_REPLY["users"] + [{"id": "U3", "name": "bob"}],
+                     channels=[{"id": "C1", "name": "general", "members": ["U3"]}])
+        second = snapshot_server(path, reply)
+        eq_(second.load_roster(), True)
+        eq_(second.username, "limbo")
+        eq_(second.users.find("alice").tz, "UTC")
+        eq_(second.users.find("bob"), None)
+        eq_(second.channels.find("#general").members, ["U1", "U2"])
+        eq_(second.channels.find("general").server, second)
+
+        second.refresh_roster_safely = lambda: None
+        second.rtm_connect()
+        eq_(second.api_requester.methods, ["rtm.connect"])
+        # a channel created while the roster downloads is kept
+        do = second.api_requester.do
+        def download(*args):
+            second.attach_channel("new", "C2", [])
+            return do(*args)
+        second.api_requester.do = download
+        second.refresh_roster()
+        eq_(second.users.find("bob").id, "U3")
+        eq_(second.channels.find("general").members, ["U3"])
+        eq_(second.channels.find("new").id, "C2")
+
+        third = snapshot_server(path, reply)
+        third.load_roster()
+        eq_(third.users.find("bob").id, "U3")
+        eq_(third.channels.find("C1").members, ["U3"])
+    finally:
+        shutil.rmtree(tmp)
+
+def test_roster_snapshot_unreadable():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "roster")
+        with open(path, "wb") as f:
+            f.write(b"not a snapshot")
+        server = snapshot_server(path, ROSTER_REPLY)
+        eq_(server.load_roster(), False)
+        server.roster_path = None
+        eq_(server.load_roster(), False)
+    finally:
+        shutil.rmtree(tmp)
+
+# test the web api client
+
+class FakeSlackAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # method -> how many more times to answer it with a 429
+    rate_limited = {}
+    # (client port, path, body) for each request
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf8")
+        self.requests.append((self.client_address[1], self.path, body))
+        method = self.path.rsplit("/", 1)[-1]
+        if self.rate_limited.get(method):
+            self.rate_limited[method] -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0.1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        reply = json.dumps({"ok": True, "method": method}).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+def fake_slack_api():
+    FakeSlackAPI.rate_limited = {}
+    FakeSlackAPI.requests = []
+    httpd = serve(FakeSlackAPI)
+    requester = SlackRequest(method_tiers={"fast": None, "slow": 60 * 10})
+    requester.url_template = "http://{domain}/api/{request}"
+    return httpd, requester, "127.0.0.1:{0}".format(httpd.server_address[1])
+
+def test_slack_request_keeps_connections_alive():
+    httpd, requester, domain = fake_slack_api()
+    try:
+        for i in range(3):
+            reply = requester.do("xoxb-token", "fast", {"n": i}, domain=domain)
+            eq_(reply.code, 200)
+            eq_(json.loads(reply.read().decode("utf8")), {"ok": True, "method": "fast"})
+
+        eq_(len(set(port for port, _, _ in FakeSlackAPI.requests)), 1)
+        eq_(FakeSlackAPI.requests[-1][2], "n=2&token=xoxb-token")
+        stats = requester.stats()["fast"]
+        eq_((stats["calls"], stats["errors"], stats["rate_limited"]), (3, 0, 0))
+        assert stats["max_time"] >= stats["average_time"] > 0
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_slack_request_streams_reply():
+    httpd, requester, domain = fake_slack_api()
+    try:
+        reply = requester.do("xoxb-token", "fast", domain=domain)
+        eq_(list(JSONStream(reply, chunk_size=4).members()), [("ok", True), ("method", "fast")])
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_slack_request_retries_429():
+    httpd, requester, domain = fake_slack_api()
+    try:
+        FakeSlackAPI.rate_limited["fast"] = 2
+        start = time.time()
+        eq_(requester.do("xoxb-token", "fast", domain=domain).code, 200)
+        assert time.time() - start >= 0.2
+        eq_(requester.stats()["fast"]["rate_limited"], 2)
+
+        requester.max_retries = 0
+        FakeSlackAPI.rate_limited["fast"] = 1
+        eq_(requester.do("xoxb-token", "fast", domain=domain).code, 429)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_slack_request_paces_methods():
+    requester = SlackRequest(method_tiers={"fast": None, "slow": 60 * 10})
+    eq_([requester.reserve("fast") for _ in range(10)], [0] * 10)
+    delays = [requester.reserve("slow") for _ in range(7)]
+    # a burst goes through right away, then calls are spaced out
+    eq_(delays[:5], [0] * 5)
+    assert 0.09 < delays[5] <= 0.1
+    assert 0.19 < delays[6] <= 0.2
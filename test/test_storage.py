@@ -0,0 +1,94 @@
+# -*- coding: UTF-8 -*-
+import sqlite3
+import threading
+
+from nose.tools import eq_
+
+from limbo.server import LimboServer
+from limbo.storage import Storage, connect, is_read
+
+from .helpers import Database
+
+def database(readers=2):
+    db = Database(readers)
+    db.storage.query("CREATE TABLE log (msg TEXT)")
+    return db
+
+def test_is_read():
+    eq_(is_read("SELECT 1"), True)
+    eq_(is_read("\n  select msg FROM log"), True)
+    eq_(is_read("INSERT INTO log VALUES (?)"), False)
+    eq_(is_read("CREATE TABLE x (y)"), False)
+    eq_(is_read(""), False)
+
+def test_reads_see_writes():
+    db = database()
+    try:
+        eq_(db.storage.query("INSERT INTO log VALUES (?)", u"Iñtërnâtiônàlizætiøn"), [])
+        eq_(db.storage.query("SELECT msg FROM log"), [(u"Iñtërnâtiônàlizætiøn",)])
+        eq_(db.storage.opened, 1)
+        eq_(db.storage.query("PRAGMA journal_mode"), [("wal",)])
+    finally:
+        db.remove()
+
+def test_readers_are_read_only():
+    db = database()
+    try:
+        with db.storage.reader() as reader:
+            try:
+                reader.execute("INSERT INTO log VALUES (?)", ("nope",))
+            except sqlite3.OperationalError:
+                pass
+            else:
+                assert False, "a reader shouldn't be able to write"
+    finally:
+        db.remove()
+
+def test_reads_dont_wait_for_writes():
+    db = database()
+    try:
+        db.storage.query("INSERT INTO log VALUES (?)", u"one")
+        rows = []
+        with db.storage.transaction() as writer:
+            writer.execute("INSERT INTO log VALUES (?)", (u"two",))
+            # the writer is held, and its transaction is open
+            reading = threading.Thread(target=lambda: rows.extend(db.storage.query("SELECT msg FROM log")))
+            reading.start()
+            reading.join(5)
+            assert not reading.is_alive()
+        eq_(rows, [(u"one",)])
+        eq_(db.storage.query("SELECT msg FROM log"), [(u"one",), (u"two",)])
+    finally:
+        db.remove()
+
+def test_reader_pool_is_bounded():
+    db = database(readers=2)
+    try:
+        done = []
+        with db.storage.reader() as first:
+            with db.storage.reader() as second:
+                assert first is not second
+                waiting = threading.Thread(target=lambda: done.append(db.storage.query("SELECT 1")))
+                waiting.start()
+                waiting.join(0.1)
+                assert waiting.is_alive()
+            waiting.join(5)
+        eq_(done, [[(1,)]])
+        eq_(db.storage.opened, 2)
+    finally:
+        db.remove()
+
+def test_in_memory_database_uses_the_writer():
+    storage = Storage(connect(":memory:"), ":memory:")
+    storage.query("CREATE TABLE log (msg TEXT)")
+    storage.query("INSERT INTO log VALUES (?)", u"one")
+    eq_(storage.query("SELECT msg FROM log"), [(u"one",)])
+    eq_(storage.opened, 0)
+    storage.close()
+
+def test_server_wraps_a_connection():
+    server = LimboServer(None, {}, {}, sqlite3.connect(":memory:"))
+    server.query("CREATE TABLE log (msg TEXT)")
+    server.query("INSERT INTO log VALUES (?)", u"one")
+    eq_(server.query("SELECT msg FROM log"), [(u"one",)])
+    server.close()
@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+import os
+import time
+
+from nose.tools import eq_
+
+from limbo.plugins import log
+from limbo.server import LimboServer
+from limbo.writebehind import WriteBehind
+
+from .helpers import Database
+
+def database():
+    db = Database()
+    db.storage.query("CREATE TABLE log (msg STRING, sender STRING, time STRING, team STRING, channel STRING)")
+    db.storage.query("CREATE TABLE other (x INTEGER)")
+    return db
+
+def insert(writer, msg):
+    writer.write("INSERT INTO log VALUES (?, ?, ?, ?, ?)", msg, "U1", "1.0", "T1", "C1")
+
+def test_batches_by_rows():
+    db = database()
+    try:
+        writer = WriteBehind(db.storage, batch_rows=3, batch_ms=60000)
+        insert(writer, u"one")
+        insert(writer, u"two")
+        time.sleep(0.05)
+        eq_(db.rows("SELECT msg FROM log"), [])
+        insert(writer, u"Iñtërnâtiônàlizætiøn")
+        for _ in range(100):
+            if writer.stats()["written"] == 3:
+                break
+            time.sleep(0.01)
+        eq_(db.rows("SELECT msg FROM log"), [u"one", u"two", u"Iñtërnâtiônàlizætiøn"])
+        eq_(writer.stats(), {"pending": 0, "written": 3, "batches": 1, "failed": 0})
+        eq_(db.rows("PRAGMA journal_mode"), ["wal"])
+        writer.close()
+    finally:
+        db.remove()
+
+def test_batches_by_time():
+    db = database()
+    try:
+        writer = WriteBehind(db.storage, batch_rows=1000, batch_ms=50)
+        start = time.time()
+        insert(writer, u"one")
+        while not db.rows("SELECT msg FROM log"):
+            time.sleep(0.005)
+            assert time.time() - start < 5
+        assert time.time() - start >= 0.05
+
+        # and once it's idle again
+        start = time.time()
+        insert(writer, u"two")
+        while len(db.rows("SELECT msg FROM log")) < 2:
+            time.sleep(0.005)
+            assert time.time() - start < 1
+        assert time.time() - start >= 0.05
+        writer.close()
+    finally:
+        db.remove()
+
+def test_flush_and_close():
+    db = database()
+    try:
+        writer = WriteBehind(db.storage, batch_rows=1000, batch_ms=60000)
+        insert(writer, u"one")
+        writer.write("INSERT INTO other VALUES (?)", 1)
+        insert(writer, u"two")
+        eq_(writer.flush(5), True)
+        eq_(db.rows("SELECT msg FROM log"), [u"one", u"two"])
+        eq_(db.rows("SELECT x FROM other"), [1])
+
+        insert(writer, u"three")
+        writer.close()
+        eq_(db.rows("SELECT msg FROM log"), [u"one", u"two", u"three"])
+        assert not writer.thread.is_alive()
+        try:
+            insert(writer, u"four")
+        except ValueError:
+            pass
+        else:
+            assert False, "writing after close should fail"
+    finally:
+        db.remove()
+
+def test_failed_batches_are_dropped():
+    db = database()
+    try:
+        writer = WriteBehind(db.storage, batch_rows=1000, batch_ms=60000)
+        writer.write("INSERT INTO missing VALUES (?)", 1)
+        writer.flush(5)
+        insert(writer, u"one")
+        writer.close()
+        eq_(db.rows("SELECT msg FROM log"), [u"one"])
+        eq_(writer.stats()["failed"], 1)
+    finally:
+        db.remove()
+
+def test_only_failing_rows_are_dropped():
+    db = database()
+    try:
+        db.storage.query("CREATE UNIQUE INDEX other_x ON other (x)")
+        writer = WriteBehind(db.storage, batch_rows=1000, batch_ms=60000)
+        insert(writer, u"one")
+        for x in (1, 2, 1, 3):
+            writer.write("INSERT INTO other VALUES (?)", x)
+        writer.write("INSERT INTO missing VALUES (?)", 1)
+        insert(writer, u"two")
+        writer.close()
+        eq_(db.rows("SELECT msg FROM log"), [u"one", u"two"])
+        eq_(db.rows("SELECT x FROM other ORDER BY x"), [1, 2, 3])
+        eq_(writer.stats(), {"pending": 0, "written": 5, "batches": 1, "failed": 2})
+    finally:
+        db.remove()
+
+def test_log_plugin_writes_behind():
+    db = database()
+    try:
+        server = LimboServer(None, {}, {}, db.storage, write_behind=WriteBehind(db.storage))
+        log.DO_LOG = True
+        log.on_message({"text": u"hello", "user": "U1", "ts": "1.0", "team": "T1", "channel": "C1"}, server)
+        server.write_behind.close()
+        eq_(db.rows("SELECT msg, sender, channel FROM log_1970_01"), [(u"hello", u"U1", u"C1")])
+    finally:
+        log.DO_LOG = os.environ.get("LIMBO_LOG_EVERYTHING", False)
+        db.remove()